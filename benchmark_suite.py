@@ -0,0 +1,21 @@
+"""
+Launcher for the benchmark suite with stored baselines.  SDL is switched to
+dummy video and audio drivers before pygame is imported, so this runs without
+a display (on a CI machine for example).  Run with --help for options.
+"""
+
+import os
+import sys
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame as pg
+
+from data.benchmark_suite import main
+
+
+if __name__ == '__main__':
+    main()
+    pg.quit()
+    sys.exit()
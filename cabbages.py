@@ -6,7 +6,13 @@ more and more unmaintainable. This eventually led to it being abandoned.
 -Mek, November 22, 2013.
 """
 
+import os
 import sys
+
+if "--headless" in sys.argv:
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+
 import pygame as pg
 
 from data.main import main
@@ -0,0 +1,142 @@
+"""
+Contains a class for loading resources on a pool of worker threads.
+
+Resources are held in tools.LazyAssets mappings whose loading is split into
+a decode stage (file access and decompression, safe to run off the main
+thread) and a finish stage (conversion to the display format, which must
+happen on the main thread).  The AssetLoader decodes on its workers and the
+main thread calls AssetLoader.process regularly to finish a bounded amount
+of work per frame, so the window stays responsive while loading.
+
+The game starts one loader in the background (start_background) that the
+Control finishes a little of every update (process_background), so the
+splash and title screens show while the remaining resources load.
+"""
+
+import time
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+WORKERS = 4
+
+#The loader started by start_background until it is done.
+BACKGROUND = None
+
+get_time = getattr(time, "perf_counter", time.time)
+
+
+class AssetLoader(object):
+    """Loads the unloaded resources of a collection of LazyAssets."""
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+        self.jobs = queue.Queue()
+        self.decoded = queue.Queue()
+        self.threads = []
+        self.total = 0
+        self.finished = 0
+
+    def add(self, assets, names=None):
+        """
+        Queue the named resources of a LazyAssets mapping (all unloaded
+        resources if names is None).  Mappings without a finish stage can't
+        be decoded off the main thread and are ignored.
+        """
+        if not assets.finish:
+            return
+        names = assets.unloaded() if names is None else names
+        for name in names:
+            self.jobs.put((assets, name))
+            self.total += 1
+
+    def start(self):
+        """Start the worker threads.  Each exits once the queue is empty."""
+        for _ in range(self.workers):
+            self.jobs.put(None)
+            thread = threading.Thread(target=self.work)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def work(self):
+        """Loop of each worker thread; decode queued resources."""
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            assets, name = job
+            if assets.is_loaded(name):
+                decoded, error = None, None
+            else:
+                try:
+                    decoded, error = assets.decode(assets.paths[name]), None
+                except Exception as exception:
+                    decoded, error = None, exception
+            self.decoded.put((assets, name, decoded, error))
+
+    def process(self, budget):
+        """
+        Finish decoded resources on the calling (main) thread until none are
+        waiting or budget milliseconds have passed.  Resources that failed
+        to decode are left unloaded; they will be loaded (and raise) on
+        first use as usual.
+        """
+        end = get_time()+budget/1000.0
+        while get_time() < end:
+            try:
+                assets, name, decoded, error = self.decoded.get_nowait()
+            except queue.Empty:
+                break
+            if error is None and not assets.is_loaded(name):
+                assets.store(name, decoded)
+            self.finished += 1
+
+    def finish_all(self):
+        """
+        Finish every queued resource on the calling thread, waiting for the
+        workers as needed.
+        """
+        while not self.done:
+            assets, name, decoded, error = self.decoded.get()
+            if error is None and not assets.is_loaded(name):
+                assets.store(name, decoded)
+            self.finished += 1
+
+    @property
+    def progress(self):
+        """The fraction of queued resources that have been finished."""
+        return float(self.finished)/self.total if self.total else 1.0
+
+    @property
+    def done(self):
+        return self.finished >= self.total
+
+
+def start_background(collections):
+    """
+    Start loading every unloaded resource of the LazyAssets mappings in
+    collections in the background and return the AssetLoader.
+    """
+    global BACKGROUND
+    loader = AssetLoader()
+    for assets in collections:
+        loader.add(assets)
+    loader.start()
+    BACKGROUND = loader
+    return loader
+
+
+def process_background(budget):
+    """
+    Finish background loaded resources for at most budget milliseconds;
+    the loader is dropped once it is done.
+    """
+    global BACKGROUND
+    if BACKGROUND is not None:
+        BACKGROUND.process(budget)
+        if BACKGROUND.done:
+            BACKGROUND = None
@@ -0,0 +1,143 @@
+"""
+Contains the autosaver, which writes saves on a background thread.
+
+Components call AUTOSAVER.trigger with the name of an event (see TRIGGERS)
+when something worth saving happens.  At the end of its update the Game
+state calls AUTOSAVER.poll, which takes a snapshot of the player's data on
+the main thread if anything was triggered.  Snapshots are handed to a
+writer thread that serialises them and syncs them to disk through a
+SaveStore.  A snapshot that hasn't been written yet is simply replaced by
+a newer one for the same slot, so bursts of triggers cost one write.  The
+main thread never waits on the disk; anything that needs the slots before
+pending writes finish (the select screen) reads them through get_slots.
+"""
+
+import copy
+import threading
+
+from . import save_store
+
+
+#Events that cause an autosave; set a value to False to disable it.
+TRIGGERS = {"map change" : True,
+            "chest" : True,
+            "item" : True,
+            "camp" : True}
+
+RETRY_DELAY = 5.0 #Seconds before retrying a failed write.
+FLUSH_TIMEOUT = 5.0 #Longest to wait for pending writes on exit.
+
+
+class AutoSaver(object):
+    """
+    Queues save snapshots per slot and writes them on a daemon thread,
+    started when the first snapshot is queued.  If enabled is False nothing
+    is written (used by the benchmark).
+    """
+    def __init__(self, store=save_store.STORE, triggers=TRIGGERS):
+        self.store = store
+        self.triggers = dict(triggers)
+        self.enabled = True
+        self.triggered = set()
+        self.pending = {} #Slot to the newest unwritten snapshot.
+        self.writing = None #The (slot, snapshot) being written.
+        self.condition = threading.Condition(threading.Lock())
+        self.thread = None
+        self.written = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def trigger(self, event):
+        """Note that event happened; a save is made at the next poll."""
+        if self.triggers.get(event):
+            self.triggered.add(event)
+
+    def poll(self, slot, player):
+        """
+        Queue a snapshot of the player for slot if anything was triggered
+        since the last poll.  Called on the main thread.
+        """
+        if self.triggered:
+            self.triggered.clear()
+            self.request(slot, player.get_player_data())
+
+    def request(self, slot, data):
+        """Queue data (player data or EMPTY) to be written to slot."""
+        if not self.enabled:
+            return
+        data = copy.deepcopy(data)
+        with self.condition:
+            if slot in self.pending:
+                self.coalesced += 1
+            self.pending[slot] = data
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run,
+                                               name="autosave")
+                self.thread.daemon = True
+                self.thread.start()
+            self.condition.notify_all()
+
+    def run(self):
+        """
+        The writer thread.  A write that fails with an IOError or OSError
+        is retried after RETRY_DELAY; a snapshot that fails any other way
+        (it can't be serialised, say) would fail again, so it is dropped and
+        the thread carries on with the next one.
+        """
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                slot, data = self.pending.popitem()
+                self.writing = (slot, data)
+            failed = dropped = False
+            try:
+                self.store.save_slot(slot, data)
+            except (IOError, OSError) as error:
+                print("Autosave failed: {}".format(error))
+                failed = True
+            except Exception as error:
+                print("Autosave of slot {} dropped: {!r}".format(slot, error))
+                dropped = True
+            with self.condition:
+                self.writing = None
+                if failed:
+                    self.pending.setdefault(slot, data)
+                elif dropped:
+                    self.dropped += 1
+                else:
+                    self.written += 1
+                self.condition.notify_all()
+                if failed:
+                    self.condition.wait(RETRY_DELAY)
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """
+        Wait until every queued snapshot is written or timeout seconds have
+        passed.  Returns True if nothing is left to write.
+        """
+        with self.condition:
+            if self.thread is None:
+                return True
+            waited = 0.0
+            while (self.pending or self.writing) and waited < timeout:
+                self.condition.wait(0.1)
+                waited += 0.1
+            return not (self.pending or self.writing)
+
+    def get_slots(self):
+        """
+        Return a copy of all save slots including snapshots that are still
+        waiting to be written.
+        """
+        with self.condition:
+            unwritten = list(self.pending.items())
+            if self.writing and self.writing[0] not in self.pending:
+                unwritten.append(self.writing)
+            slots = self.store.get_slots()
+            for slot, data in unwritten:
+                slots[slot] = copy.deepcopy(data)
+        return slots
+
+
+AUTOSAVER = AutoSaver()
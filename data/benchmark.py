@@ -0,0 +1,321 @@
+"""
+A headless benchmark of the game loop.
+
+The Game state is run on a chosen world or single map for a fixed number of
+frames.  The player is driven by a scripted sequence of key presses and the
+loop is stepped as fast as possible on a virtual clock (one update and one
+draw per frame) rather than being limited by the frame rate.  The time spent
+in each phase of every frame is recorded and reported as percentiles.
+
+This module must be imported through the benchmark.py launcher (or after
+SDL has otherwise been told to use dummy video and audio drivers), as
+importing prepare opens the display.
+"""
+
+import copy
+import json
+import time
+import argparse
+import pygame as pg
+
+from . import prepare, tools, serialization, autosave, replay
+from .states import game
+from .components import player, world, level, enemy_sprites
+
+
+#The default script: walk a loop around the map swinging the weapon.
+DEFAULT_SCRIPT = ("right:45 attack down:45 attack left:45 attack "
+                  "up:45 attack wait:20")
+
+SCRIPT_KEYS = {"up" : pg.K_UP,
+               "down" : pg.K_DOWN,
+               "left" : pg.K_LEFT,
+               "right" : pg.K_RIGHT,
+               "attack" : pg.K_SPACE,
+               "interact" : pg.K_LSHIFT}
+HELD_ACTIONS = ("up", "down", "left", "right")
+
+#Phases in the order they are reported.  Each phase's time excludes the
+#time spent in the phases nested inside it.
+PHASES = ("update", "level", "collisions", "ai", "draw", "display")
+PERCENTILES = (50, 90, 99)
+
+get_time = getattr(time, "perf_counter", time.time)
+
+
+class ScriptError(Exception):
+    """Raised if an input script can not be parsed."""
+    pass
+
+
+def parse_script(script):
+    """
+    Parse an input script into a list of (frame, event_type, key) tuples
+    covering one pass through the script, and return it along with the
+    length of the pass in frames.  A script is a series of space separated
+    actions, each of the form name:frames.  Direction names (up, down, left,
+    right) hold the key for the given number of frames, attack and interact
+    press their key once and wait does nothing.  The number of frames
+    defaults to 1.
+    """
+    events = []
+    frame = 0
+    for action in script.split():
+        name, _, frames = action.partition(":")
+        try:
+            frames = int(frames) if frames else 1
+        except ValueError:
+            raise ScriptError("Bad frame count in {}.".format(action))
+        if name != "wait" and name not in SCRIPT_KEYS:
+            raise ScriptError("Unknown action {}.".format(name))
+        if name in SCRIPT_KEYS:
+            events.append((frame, pg.KEYDOWN, SCRIPT_KEYS[name]))
+            release = frame+frames if name in HELD_ACTIONS else frame
+            events.append((release, pg.KEYUP, SCRIPT_KEYS[name]))
+        frame += frames
+    length = max(frame, 1)
+    #A key held at the end of the script is released as it starts again.
+    events = [(event_frame%length, event_type, key)
+              for event_frame, event_type, key in events]
+    events.sort(key=lambda event: (event[0], event[1] != pg.KEYUP))
+    return events, length
+
+
+class PhaseTimer(object):
+    """
+    Records the time spent in named phases each frame.  Phases may nest;
+    time spent in an inner phase is not counted toward the outer phase.
+    """
+    def __init__(self, phases=PHASES):
+        self.phases = phases
+        self.frames = {phase:[] for phase in phases}
+        self.current = {phase:0.0 for phase in phases}
+        self.stack = []
+
+    def start(self, phase):
+        self.stack.append([phase, get_time(), 0.0])
+
+    def stop(self):
+        phase, start, nested = self.stack.pop()
+        elapsed = get_time()-start
+        self.current[phase] += elapsed-nested
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+    def wrap(self, phase, function):
+        """Return a version of function that is timed as phase."""
+        def timed(*args, **kwargs):
+            self.start(phase)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.stop()
+        return timed
+
+    def end_frame(self, record=True):
+        """Store (if record is True) and reset the current frame's times."""
+        for phase in self.phases:
+            if record:
+                self.frames[phase].append(self.current[phase])
+            self.current[phase] = 0.0
+
+    def totals(self):
+        """Return the total time of each recorded frame."""
+        return [sum(times) for times in zip(*self.frames.values())]
+
+    def summary(self):
+        """
+        Return a dictionary of phase name to a dictionary of statistics in
+        milliseconds; the key "frame" holds the statistics of whole frames.
+        """
+        results = {}
+        series = [(phase, self.frames[phase]) for phase in self.phases]
+        series.append(("frame", self.totals()))
+        for name, times in series:
+            results[name] = get_statistics(times)
+        return results
+
+
+def percentile(ordered, percent):
+    """Return the nearest rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    rank = int(round(percent/100.0*(len(ordered)-1)))
+    return ordered[rank]
+
+
+def get_statistics(times):
+    """Return the mean, percentiles and maximum of times in milliseconds."""
+    ordered = sorted(1000.0*value for value in times)
+    stats = {"mean" : sum(ordered)/len(ordered) if ordered else 0.0,
+             "max" : ordered[-1] if ordered else 0.0}
+    for percent in PERCENTILES:
+        stats["p{}".format(percent)] = percentile(ordered, percent)
+    return stats
+
+
+class SingleMapWorld(world.WorldMap):
+    """A WorldMap consisting of only one map."""
+    def __init__(self, player, map_name):
+        self.map_name = map_name
+        world.WorldMap.__init__(self, player)
+
+    def load(self, world_name):
+        return {tuple(self.player.save_world_coords) : self.map_name}
+
+
+class HeadlessGame(game.Game):
+    """A Game state that can be started on a single map."""
+    def __init__(self, map_name=None):
+        game.Game.__init__(self)
+        self.map_name = map_name
+
+    def make_world(self):
+        if self.map_name:
+            return SingleMapWorld(self.player, self.map_name)
+        return game.Game.make_world(self)
+
+
+class HeadlessControl(tools.Control):
+    """
+    A Control that runs a fixed number of frames on a virtual clock, feeding
+    scripted input to the state machine and timing each phase.
+    """
+    def __init__(self, script=DEFAULT_SCRIPT):
+        tools.Control.__init__(self, prepare.ORIGINAL_CAPTION)
+        self.fps_visible = False
+        self.script, self.script_length = parse_script(script)
+        self.timer = PhaseTimer()
+        self.frame = 0
+
+    def update(self):
+        """Advance the virtual clock one step and update the state."""
+        self.now += tools.TIME_PER_UPDATE
+        replay.CLOCK.now = self.now
+        self.state_machine.update(self.keys, self.now)
+
+    def post_script_events(self):
+        """Pass this frame's scripted key events to the state machine."""
+        frame = self.frame%self.script_length
+        for event_frame, event_type, key in self.script:
+            if event_frame == frame:
+                event = pg.event.Event(event_type, key=key)
+                self.state_machine.get_event(event)
+
+    def instrument(self):
+        """
+        Wrap the methods that make up each phase with the timer.  Returns a
+        function that removes the class level wrappers again.
+        """
+        timer = self.timer
+        patched = [(level.Level, "update", "level"),
+                   (level.Level, "check_collisions", "collisions"),
+                   (enemy_sprites._Enemy, "change_direction", "ai")]
+        originals = []
+        for cls, name, phase in patched:
+            original = cls.__dict__[name]
+            originals.append((cls, name, original))
+            setattr(cls, name, timer.wrap(phase, original))
+        self.update = timer.wrap("update", self.update)
+        self.draw = timer.wrap("display", self.draw)
+        self.state_machine.draw = timer.wrap("draw", self.state_machine.draw)
+        def restore():
+            for cls, name, original in originals:
+                setattr(cls, name, original)
+        return restore
+
+    def run(self, frames, warmup=0):
+        """
+        Run warmup frames untimed followed by frames timed frames.
+        Stops early if the state machine quits.
+        """
+        restore = self.instrument()
+        try:
+            while self.frame < warmup+frames and not self.done:
+                self.post_script_events()
+                self.event_loop()
+                self.update()
+                self.draw(0.0)
+                self.timer.end_frame(self.frame >= warmup)
+                self.frame += 1
+        finally:
+            restore()
+        return self.timer.summary()
+
+
+def make_player(coords=None):
+    """Create a fresh player; optionally starting in the world at coords."""
+    data = copy.deepcopy(prepare.DEFAULT_PLAYER)
+    if coords:
+        data["save_world_coords"] = tuple(coords)
+    return player.Player(data)
+
+
+def run_benchmark(map_name=None, coords=None, frames=1200, warmup=60,
+                  script=DEFAULT_SCRIPT, seed=0, dirty=False):
+    """
+    Run the Game state headlessly and return the summary dictionary of
+    PhaseTimer along with some details of the run.
+    """
+    replay.RNG.seed(seed)
+    autosave.AUTOSAVER.enabled = False #Never touch the real save file.
+    app = HeadlessControl(script)
+    state = HeadlessGame(map_name)
+    state.dirty_rendering = dirty
+    app.state_machine.setup_states({"GAME" : state}, "GAME")
+    state.startup(app.now, {"player" : make_player(coords), "save_slot" : 0})
+    start = get_time()
+    try:
+        summary = app.run(frames, warmup)
+    finally:
+        replay.CLOCK.now = None
+    elapsed = get_time()-start
+    return {"phases" : summary,
+            "frames" : len(app.timer.frames[PHASES[0]]),
+            "seconds" : elapsed,
+            "map" : state.world.level.name,
+            "player_state" : state.player.action_state,
+            "enemies" : len(state.world.level.enemies)}
+
+
+def format_report(results):
+    """Return a printable table of the results of run_benchmark."""
+    columns = ["mean"]+["p{}".format(p) for p in PERCENTILES]+["max"]
+    lines = ["Map: {map}  Frames: {frames}  Wall time: {seconds:.2f}s  "
+             "Enemies left: {enemies}".format(**results),
+             "YAML backend: {}".format(serialization.get_backend()),
+             "{:<12}".format("phase (ms)")+"".join("{:>9}".format(column)
+                                                for column in columns)]
+    for phase in PHASES+("frame",):
+        stats = results["phases"][phase]
+        values = "".join("{:>9.3f}".format(stats[column])
+                         for column in columns)
+        lines.append("{:<12}".format(phase)+values)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """Parse command line arguments, run the benchmark and report."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--map", help="run on a single map (eg desert.map)")
+    parser.add_argument("--coords", type=int, nargs=2, metavar=("X", "Y"),
+                        help="world coordinates to start at")
+    parser.add_argument("--frames", type=int, default=1200)
+    parser.add_argument("--warmup", type=int, default=60)
+    parser.add_argument("--script", default=DEFAULT_SCRIPT,
+                        help="input script (see parse_script)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dirty", action="store_true",
+                        help="use dirty rect rendering")
+    parser.add_argument("--json", help="also write the results to this path")
+    args = parser.parse_args(argv)
+    try:
+        results = run_benchmark(args.map, args.coords, args.frames,
+                                args.warmup, args.script, args.seed,
+                                args.dirty)
+    except ScriptError as error:
+        parser.error(str(error))
+    print(format_report(results))
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=2, sort_keys=True)
@@ -0,0 +1,572 @@
+"""
+A suite of benchmarks of the game's core costs, with stored baselines.
+
+Each case times one cost in isolation and keeps every sample:
+
+  yaml_map:NAME      parsing a map file's text with serialization.load_map
+                     (the MapLoader fast path, not the full yaml.load;
+                     map_benchmark times the two against each other)
+  yaml_save          parsing a save file of SLOTS default players
+  level_init:NAME    Level.__init__ given an already loaded map dictionary
+  animations         Player.make_all_animations with an empty cache
+  animations_cached  Player.make_all_animations with the loadout cached
+  level_update:NAME  Level.update, one sample per tick
+  level_draw:NAME    Level.draw, one sample per tick
+  collisions:COUNT   Level.check_collisions on central.map with COUNT extra
+                     enemies placed on free cells
+  edge_cold          a WorldMap edge crossing that has to build the Level
+  edge_warm          a WorldMap edge crossing back to a Level in history
+
+Gameplay runs on replay.RNG, seeded before every case, and on replay.CLOCK
+advanced TIME_PER_UPDATE per tick, so every run does the same work.  Maps
+and images are warmed up before timing; the caches the game keeps between
+maps (tile atlas, compiled maps, baked layers) are left in place.
+
+Results can be saved as a JSON baseline with --save.  With --compare the
+samples of each case are tested against the baseline's with a one sided
+Mann-Whitney U test.  A case is flagged as a regression when the test finds
+it slower with p below --alpha and its median is more than --threshold
+slower.  With hundreds of samples the test notices the few percent that
+separate two runs of the same code, so the threshold is what keeps that
+drift from being reported; compare baselines made on the same machine.
+With few samples the test can't reach --alpha however large the change,
+so at least MIN_SAMPLES are taken of every case, and a change beyond the
+threshold that the sample sizes can't confirm is reported "inconclusive"
+(this only happens with baselines from elsewhere).
+The exit status is 1 if anything regressed, for use in scripts.
+
+This module must be imported through the benchmark_suite.py launcher (or
+after SDL has otherwise been told to use dummy video and audio drivers), as
+importing prepare opens the display.
+"""
+
+import os
+import gc
+import sys
+import copy
+import json
+import math
+import time
+import fnmatch
+import argparse
+import platform
+import pygame as pg
+
+from . import (prepare, tools, serialization, autosave, replay, save_store,
+               benchmark, map_benchmark)
+from .components import player, level, world, enemy_sprites, prefetch
+
+
+FORMAT_VERSION = 1
+COLLISION_MAP = "central.map"
+ENEMY_COUNTS = (0, 50, 100, 150)
+EDGE_WORLD_COORDS = (5, 5) #Crossings go right from here and back.
+WARMUP_TICKS = 10
+ALPHA = 0.01
+THRESHOLD = 0.10 #Fraction of the baseline median.
+MIN_SAMPLES = 8 #Per case; with 8 against 8 the smallest p is about 0.0004.
+
+get_time = getattr(time, "perf_counter", time.time)
+
+
+class BaselineError(Exception):
+    """Raised if a baseline file can not be read."""
+    pass
+
+
+class IdlePrefetcher(prefetch.MapPrefetcher):
+    """
+    A prefetcher that never loads anything, so that every map a WorldMap
+    doesn't have in history is built on the main thread.
+    """
+    def request(self, map_names):
+        pass
+
+
+def selected(settings, name):
+    """Return True if the case called name should be run."""
+    return fnmatch.fnmatch(name, settings["only"])
+
+
+def get_map_names(directory=map_benchmark.MAP_DIRECTORY):
+    return sorted(name for name in os.listdir(directory)
+                  if name.endswith(map_benchmark.MAP_EXTENSION))
+
+
+def read_map(map_name):
+    path = os.path.join(map_benchmark.MAP_DIRECTORY, map_name)
+    with open(path) as map_file:
+        return map_file.read()
+
+
+def timed(function, *args):
+    """
+    Call function(*args) with the garbage collector paused (as timeit
+    does) and return the time it took in seconds and its result.
+    """
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        start = get_time()
+        result = function(*args)
+        return get_time()-start, result
+    finally:
+        if collecting:
+            gc.enable()
+
+
+def time_call(function, *args):
+    """Return the time function(*args) takes in seconds."""
+    return timed(function, *args)[0]
+
+
+def make_level(map_name, map_dict=None):
+    """Return a fresh Level with a fresh player in it."""
+    return level.Level(benchmark.make_player(), map_name, map_dict)
+
+
+def run_ticks(level_map, ticks, surface):
+    """
+    Update and draw a Level for ticks ticks on the virtual clock, carrying
+    on from its current time.  Returns lists of the update and draw times.
+    The player's health is restored each tick so the player never dies.
+    """
+    update_times = []
+    draw_times = []
+    now = replay.CLOCK.now
+    for _ in range(ticks):
+        now += tools.TIME_PER_UPDATE
+        replay.CLOCK.now = now
+        level_map.player.health = prepare.MAX_HEALTH
+        update_times.append(time_call(level_map.update, now))
+        draw_times.append(time_call(level_map.draw, surface, 0.0))
+    return update_times, draw_times
+
+
+def bench_yaml(settings):
+    """Parse every map and a save file from memory."""
+    for map_name in settings["maps"]:
+        name = "yaml_map:"+map_name
+        if selected(settings, name):
+            text = read_map(map_name)
+            serialization.load_map(text)
+            yield name, [time_call(serialization.load_map, text)
+                         for _ in range(settings["repeat"])]
+    if selected(settings, "yaml_save"):
+        slots = [copy.deepcopy(prepare.DEFAULT_PLAYER)
+                 for _ in range(save_store.SLOTS)]
+        text = serialization.dump(slots)
+        yield "yaml_save", [time_call(serialization.load, text)
+                            for _ in range(settings["repeat"])]
+
+
+def bench_level_init(settings):
+    """Build a Level for every map from a preloaded map dictionary."""
+    for map_name in settings["maps"]:
+        name = "level_init:"+map_name
+        if not selected(settings, name):
+            continue
+        map_dict = level.load_map(map_name)
+        make_level(map_name, copy.deepcopy(map_dict)).discard()
+        times = []
+        for _ in range(settings["repeat"]):
+            fresh_dict = copy.deepcopy(map_dict)
+            hero = benchmark.make_player()
+            elapsed, level_map = timed(level.Level, hero, map_name,
+                                       fresh_dict)
+            times.append(elapsed)
+            level_map.discard()
+        yield name, times
+
+
+def bench_animations(settings):
+    """Composite the player's animations, uncached and cached."""
+    hero = benchmark.make_player()
+    if selected(settings, "animations"):
+        uncached = []
+        for _ in range(settings["repeat"]):
+            player.ANIMATION_CACHE.clear()
+            uncached.append(time_call(hero.make_all_animations))
+        yield "animations", uncached
+    if selected(settings, "animations_cached"):
+        hero.make_all_animations()
+        yield "animations_cached", [time_call(hero.make_all_animations)
+                                    for _ in range(settings["repeat"])]
+
+
+def bench_level_ticks(settings):
+    """Update and draw every map for the given number of ticks."""
+    surface = pg.display.get_surface()
+    for map_name in settings["maps"]:
+        names = ("level_update:"+map_name, "level_draw:"+map_name)
+        if not any(selected(settings, name) for name in names):
+            continue
+        replay.RNG.seed(settings["seed"])
+        level_map = make_level(map_name)
+        run_ticks(level_map, WARMUP_TICKS, surface)
+        times = run_ticks(level_map, settings["ticks"], surface)
+        level_map.discard()
+        for name, case_times in zip(names, times):
+            if selected(settings, name):
+                yield name, case_times
+
+
+def add_enemies(level_map, count):
+    """
+    Add count cabbages to free cells of a Level, chosen with replay.RNG.
+    Returns the number actually added (limited by the free cells).
+    """
+    cell_w, cell_h = prepare.CELL_SIZE
+    columns = prepare.PLAY_RECT.w//cell_w
+    rows = prepare.PLAY_RECT.h//cell_h
+    free = []
+    for x in range(columns):
+        for y in range(rows):
+            cell = pg.Rect(x*cell_w, y*cell_h, cell_w, cell_h)
+            if level_map.occupancy.is_free(cell) and not (
+                    cell.colliderect(level_map.player.rect)):
+                free.append(cell.topleft)
+    groups = (level_map.enemies, level_map.main_sprites,
+              level_map.moving, level_map.all_group)
+    chosen = replay.RNG.sample(free, min(count, len(free)))
+    for position in chosen:
+        enemy = enemy_sprites.Cabbage(position, 1, *groups)
+        enemy.spawn_target = position
+    level_map.sync_dynamic_grid()
+    return len(chosen)
+
+
+def bench_collisions(settings):
+    """
+    Check collisions with increasing numbers of enemies.  The enemies are
+    moved by updating the Level between samples; only check_collisions is
+    timed.
+    """
+    surface = pg.display.get_surface()
+    for count in ENEMY_COUNTS:
+        name = "collisions:{}".format(count)
+        if not selected(settings, name):
+            continue
+        replay.RNG.seed(settings["seed"])
+        level_map = make_level(COLLISION_MAP)
+        add_enemies(level_map, count)
+        run_ticks(level_map, WARMUP_TICKS, surface)
+        times = []
+        now = replay.CLOCK.now
+        for _ in range(settings["ticks"]):
+            now += tools.TIME_PER_UPDATE
+            replay.CLOCK.now = now
+            level_map.player.health = prepare.MAX_HEALTH
+            level_map.update(now)
+            times.append(time_call(level_map.check_collisions))
+        level_map.discard()
+        yield name, times
+
+
+def cross_edge(world_map, direction, now):
+    """
+    Move the player just past an edge of the current map and run the
+    world until the scroll finishes.  Returns the time taken by the update
+    that crosses the edge and the one that prepares the scroll, and the
+    virtual time after the crossing.
+    """
+    hero = world_map.player
+    surface = pg.display.get_surface()
+    offset = world.OFFSCREEN_THRESHOLD+1
+    center = list(prepare.PLAY_RECT.center)
+    if direction == "right":
+        center[0] = prepare.PLAY_RECT.right+offset+hero.rect.w//2
+    else:
+        center[0] = prepare.PLAY_RECT.left-offset-hero.rect.w//2
+    hero.reset_position(center, "center")
+    hero.direction_stack = []
+    coords = list(world_map.current_coords)
+    elapsed = 0.0
+    for _ in range(2):
+        now += tools.TIME_PER_UPDATE
+        replay.CLOCK.now = now
+        elapsed += time_call(world_map.update, now)
+        world_map.draw(surface, 0.0)
+    while world_map.scrolling:
+        now += tools.TIME_PER_UPDATE
+        replay.CLOCK.now = now
+        try:
+            world_map.update(now)
+        except world.MapError:
+            hero.reset_position(prepare.PLAY_RECT.center, "center")
+        world_map.draw(surface, 0.0)
+    if world_map.current_coords == coords:
+        raise world.MapError("The player did not cross the edge.")
+    hero.health = prepare.MAX_HEALTH
+    return elapsed, now
+
+
+def forget_level(world_map, map_name):
+    """Make sure the next visit to map_name builds a new Level."""
+    if map_name in world_map.history:
+        world_map.history.remove(map_name).discard()
+    world_map.history.pop_frozen(map_name)
+    staged = world_map.staged.pop(map_name, None)
+    if staged:
+        staged.discard()
+    if world_map.building and world_map.building.name == map_name:
+        world_map.building.discard()
+        world_map.building = None
+    world_map.prefetcher.take(map_name)
+
+
+def bench_edges(settings):
+    """
+    Cross back and forth over the right edge of EDGE_WORLD_COORDS, first
+    forcing the Level to be rebuilt each time and then from history.
+    """
+    cases = [name for name in ("edge_cold", "edge_warm")
+             if selected(settings, name)]
+    if not cases:
+        return
+    hero = benchmark.make_player(EDGE_WORLD_COORDS)
+    world_map = world.WorldMap(hero)
+    world_map.prefetcher = IdlePrefetcher()
+    for name in list(world_map.staged):
+        world_map.staged.pop(name).discard()
+    names = [world_map.world_dict[EDGE_WORLD_COORDS],
+             world_map.world_dict[(EDGE_WORLD_COORDS[0]+1,
+                                   EDGE_WORLD_COORDS[1])]]
+    now = 0.0
+    for name in cases:
+        warm = name == "edge_warm"
+        times = []
+        for sample in range(settings["repeat"]):
+            direction = ("right", "left")[sample%2]
+            target = names[(sample+1)%2]
+            if not warm:
+                forget_level(world_map, target)
+            elapsed, now = cross_edge(world_map, direction, now)
+            times.append(elapsed)
+        if settings["repeat"]%2:
+            now = cross_edge(world_map, "left", now)[1]
+        yield name, times
+    world_map.level.discard()
+
+
+#Groups of cases in the order they are run.
+GROUPS = (("yaml", bench_yaml),
+          ("level_init", bench_level_init),
+          ("animations", bench_animations),
+          ("level_ticks", bench_level_ticks),
+          ("collisions", bench_collisions),
+          ("edges", bench_edges))
+
+
+def mann_whitney(sample, baseline):
+    """
+    Return the one sided p-value of the Mann-Whitney U test that values in
+    sample tend to be larger than those in baseline (normal approximation
+    with tie and continuity corrections).
+    """
+    sample_count, baseline_count = len(sample), len(baseline)
+    total = sample_count+baseline_count
+    if not sample_count or not baseline_count:
+        return 1.0
+    combined = sorted([(value, 0) for value in sample]+
+                      [(value, 1) for value in baseline])
+    sample_ranks = 0.0
+    ties = 0.0
+    start = 0
+    while start < total:
+        end = start
+        while end+1 < total and combined[end+1][0] == combined[start][0]:
+            end += 1
+        rank = (start+end)/2.0+1
+        tied = end-start+1
+        ties += tied**3-tied
+        sample_ranks += rank*sum(1 for _, which in combined[start:end+1]
+                                 if which == 0)
+        start = end+1
+    u = sample_ranks-sample_count*(sample_count+1)/2.0
+    mean = sample_count*baseline_count/2.0
+    variance = sample_count*baseline_count/12.0*(
+               total+1-ties/(total*(total-1.0)))
+    if variance <= 0:
+        return 1.0
+    z = (u-mean-0.5)/math.sqrt(variance)
+    return 0.5*math.erfc(z/math.sqrt(2))
+
+
+def smallest_p(sample_count, baseline_count):
+    """
+    Return the smallest p-value mann_whitney can give for samples of these
+    sizes (when every value in sample is larger than all of baseline).
+    """
+    return mann_whitney(range(baseline_count, baseline_count+sample_count),
+                        range(baseline_count))
+
+
+def case_key(name):
+    """Sort key putting collisions:50 before collisions:100."""
+    group, _, detail = name.partition(":")
+    return group, int(detail) if detail.isdigit() else 0, detail
+
+
+def get_environment():
+    """Describe the machine and libraries the suite ran with."""
+    return {"python" : platform.python_version(),
+            "pygame" : pg.version.ver,
+            "platform" : platform.platform(),
+            "yaml" : serialization.get_backend(),
+            "video" : pg.display.get_driver()}
+
+
+def run_suite(settings):
+    """
+    Run every case whose name matches the fnmatch pattern settings["only"]
+    and return a results dictionary holding the samples and statistics of
+    each case in milliseconds.
+    """
+    autosave.AUTOSAVER.enabled = False #Never touch the real save file.
+    cases = {}
+    try:
+        for _, function in GROUPS:
+            replay.RNG.seed(settings["seed"])
+            replay.CLOCK.now = 0.0
+            gc.collect()
+            for name, times in function(settings):
+                samples = [1000.0*value for value in times]
+                cases[name] = {"samples" : samples,
+                               "median" : map_benchmark.median(samples),
+                               "stats" : benchmark.get_statistics(times)}
+                sys.stdout.write(".")
+                sys.stdout.flush()
+    finally:
+        replay.CLOCK.now = None
+        print("")
+    return {"version" : FORMAT_VERSION,
+            "created" : time.strftime("%Y-%m-%d %H:%M:%S"),
+            "environment" : get_environment(),
+            "settings" : dict(settings, maps=list(settings["maps"])),
+            "cases" : cases}
+
+
+def load_baseline(path):
+    try:
+        with open(path) as baseline_file:
+            baseline = json.load(baseline_file)
+    except (IOError, ValueError) as error:
+        raise BaselineError("Can't read {}: {}".format(path, error))
+    if baseline.get("version") != FORMAT_VERSION:
+        raise BaselineError("{} is not a version {} baseline.".format(
+                            path, FORMAT_VERSION))
+    return baseline
+
+
+def compare(results, baseline, alpha=ALPHA, threshold=THRESHOLD):
+    """
+    Compare the cases of results with those of a baseline.  Returns a list
+    of (name, baseline median, median, change, p, verdict) rows where
+    change is the fractional change of the median, p the probability of
+    the samples being at least this much slower by chance and verdict one
+    of "REGRESSION", "faster", "inconclusive", "ok" or "new".  A case is
+    inconclusive if its median changed by more than threshold but the
+    sample sizes are too small for the test to reach alpha.
+    """
+    rows = []
+    old_cases = baseline["cases"]
+    for name in sorted(results["cases"], key=case_key):
+        case = results["cases"][name]
+        old = old_cases.get(name)
+        if old is None:
+            rows.append((name, None, case["median"], None, None, "new"))
+            continue
+        change = case["median"]/max(old["median"], 1e-9)-1
+        slower = mann_whitney(case["samples"], old["samples"])
+        faster = mann_whitney(old["samples"], case["samples"])
+        if slower < alpha and change > threshold:
+            verdict = "REGRESSION"
+        elif faster < alpha and change < -threshold:
+            verdict = "faster"
+        elif abs(change) > threshold and smallest_p(
+                len(case["samples"]), len(old["samples"])) >= alpha:
+            verdict = "inconclusive"
+        else:
+            verdict = "ok"
+        rows.append((name, old["median"], case["median"], change, slower,
+                     verdict))
+    return rows
+
+
+def format_results(results):
+    """Return a printable table of the results of run_suite."""
+    lines = ["{:<34}{:>9}{:>10}{:>10}{:>10}{:>10}".format(
+             "case (ms)", "samples", "median", "mean", "p90", "max")]
+    for name in sorted(results["cases"], key=case_key):
+        case = results["cases"][name]
+        stats = case["stats"]
+        lines.append("{:<34}{:>9}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}".format(
+                     name, len(case["samples"]), case["median"],
+                     stats["mean"], stats["p90"], stats["max"]))
+    return "\n".join(lines)
+
+
+def format_comparison(rows):
+    """Return a printable table of the rows returned by compare."""
+    lines = ["{:<34}{:>10}{:>10}{:>9}{:>9}  {}".format(
+             "case (median ms)", "baseline", "current", "change", "p",
+             "verdict")]
+    for name, old, new, change, p, verdict in rows:
+        if old is None:
+            lines.append("{:<34}{:>10}{:>10.3f}{:>9}{:>9}  {}".format(
+                         name, "-", new, "-", "-", verdict))
+        else:
+            lines.append(
+                "{:<34}{:>10.3f}{:>10.3f}{:>+8.1f}%{:>9.4f}  {}".format(
+                name, old, new, 100*change, p, verdict))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """Parse command line arguments, run the suite and report."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--only", default="*", metavar="PATTERN",
+                        help="run only cases matching PATTERN (eg 'edge*')")
+    parser.add_argument("--maps", nargs="+", metavar="MAP",
+                        help="maps to use (default: every map)")
+    parser.add_argument("--repeat", type=int, default=20,
+                        help="samples of each non per tick case (at least "
+                             "{})".format(MIN_SAMPLES))
+    parser.add_argument("--ticks", type=int, default=300,
+                        help="ticks of each per tick case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", metavar="PATH",
+                        help="write the results as a baseline to PATH")
+    parser.add_argument("--compare", metavar="PATH",
+                        help="compare the results with the baseline PATH")
+    parser.add_argument("--alpha", type=float, default=ALPHA,
+                        help="significance level of a regression")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="smallest slowdown of the median reported")
+    args = parser.parse_args(argv)
+    baseline = None
+    if args.compare:
+        try:
+            baseline = load_baseline(args.compare)
+        except BaselineError as error:
+            parser.error(str(error))
+    settings = {"maps" : args.maps or get_map_names(),
+                "repeat" : max(args.repeat, MIN_SAMPLES),
+                "ticks" : max(args.ticks, MIN_SAMPLES),
+                "seed" : args.seed,
+                "only" : args.only}
+    results = run_suite(settings)
+    print(format_results(results))
+    if args.save:
+        with open(args.save, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=1, sort_keys=True)
+        print("Baseline written to {}.".format(args.save))
+    if baseline:
+        rows = compare(results, baseline, args.alpha, args.threshold)
+        print("")
+        print("Compared with {} ({}):".format(args.compare,
+                                              baseline["created"]))
+        print(format_comparison(rows))
+        if any(row[5] == "REGRESSION" for row in rows):
+            sys.exit(1)
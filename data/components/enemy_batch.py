@@ -0,0 +1,140 @@
+"""
+Contains an optional simulator that advances a Level's walking enemies
+together using NumPy.
+
+Most of the time most enemies are simply walking between cells, and for
+those _Enemy.update does nothing but add a direction vector to their
+position and step counters.  The batch keeps the positions, steps and
+velocities of all batchable enemies in arrays and advances every walker
+with a handful of array operations.  Any enemy doing something else (being
+hit or knocked, dying, spawning, reaching a new cell, or acting mid step)
+is given its regular update for that tick and reloaded into the arrays
+afterwards, so each enemy behaves as it would on the per sprite path.
+Batched enemies are however updated before every other sprite in the
+Level, rather than in the y sorted order of the main sprites; see
+Level.update.
+
+NumPy is not required by the game; if it can't be imported the batch is
+simply never used.
+"""
+
+from .. import prepare
+from . import enemy_sprites
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+#Below this many batchable enemies the fixed cost of the array operations
+#outweighs the savings and the regular per sprite update is used instead.
+MIN_BATCH_SIZE = 16
+
+
+def get_function(method):
+    """Return the plain function of a (possibly unbound) method."""
+    return getattr(method, "__func__", method)
+
+
+def is_batchable(enemy):
+    """
+    Only enemies using the unmodified _Enemy.update can be batched.
+    Subclass hooks such as check_action are still called by that update.
+    """
+    return (get_function(type(enemy).update) is
+            get_function(enemy_sprites._Enemy.update))
+
+
+def is_walking(enemy):
+    """Return True if the enemy's next update may be a simple move."""
+    return (enemy.state == "walk" and not enemy.hit_state and
+            not enemy.busy and not enemy.act_mid_step and
+            enemy.direction in prepare.DIRECT_DICT)
+
+
+class EnemyBatch(object):
+    """
+    Keeps the state of a Level's batchable enemies in arrays.  Rows are
+    in the same order as the members list.
+    """
+    def __init__(self, cell_size=prepare.CELL_SIZE):
+        self.cell_size = np.array(cell_size, dtype=float)
+        self.members = []
+        self.positions = [] #The exact_position list last given to a member.
+        self.position = np.zeros((0, 2))
+        self.steps = np.zeros((0, 2))
+        self.velocity = np.zeros((0, 2))
+        self.walking = np.zeros(0, dtype=bool)
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, sprite):
+        return sprite in self.members
+
+    def sync_members(self, enemies):
+        """
+        Make the batch contain exactly the batchable sprites in enemies,
+        reloading every row if membership changed.  Returns True if the
+        batch is large enough to be worth using; if not, the batch is left
+        empty and no arrays are built.
+        """
+        members = [enemy for enemy in enemies if is_batchable(enemy)]
+        if len(members) < MIN_BATCH_SIZE:
+            self.members = []
+            return False
+        if members != self.members:
+            self.members = members
+            size = len(members)
+            self.positions = [None]*size
+            self.position = np.zeros((size, 2))
+            self.steps = np.zeros((size, 2))
+            self.velocity = np.zeros((size, 2))
+            self.walking = np.zeros(size, dtype=bool)
+            for i in range(size):
+                self.load(i)
+        return True
+
+    def load(self, i):
+        """Copy the state of member i from the sprite into the arrays."""
+        enemy = self.members[i]
+        self.positions[i] = enemy.exact_position
+        self.position[i] = enemy.exact_position
+        self.steps[i] = enemy.steps
+        self.walking[i] = is_walking(enemy)
+        if self.walking[i]:
+            vector = prepare.DIRECT_DICT[enemy.direction]
+            self.velocity[i] = (vector[0]*enemy.speed, vector[1]*enemy.speed)
+        else:
+            self.velocity[i] = (0, 0)
+
+    def update(self, now, player, group_dict):
+        """
+        Advance all members one tick.  Walkers that remain within their cell
+        are moved by the arrays; every other member gets its regular update
+        and is then reloaded.  Returns the set of sprites that were updated,
+        or None if the batch was too small to be used (in which case the
+        caller must update the members itself).
+        """
+        if not self.sync_members(group_dict["enemies"]):
+            return None
+        position = self.position+self.velocity
+        steps = self.steps+np.abs(self.velocity)
+        simple = self.walking & (steps < self.cell_size).all(axis=1)
+        self.position[simple] = position[simple]
+        self.steps[simple] = steps[simple]
+        coordinates = self.position.tolist()
+        for i, (enemy, is_simple) in enumerate(zip(self.members, simple)):
+            if is_simple and enemy.state == "walk" and (
+                    enemy.exact_position is self.positions[i]):
+                enemy.old_position = enemy.exact_position
+                enemy.exact_position = coordinates[i]
+                enemy.steps = self.steps[i].tolist()
+                enemy.rect.topleft = enemy.exact_position
+                enemy.image = enemy.get_anim().get_next_frame(now)
+                self.positions[i] = enemy.exact_position
+            else:
+                enemy.update(now, player, group_dict)
+                self.load(i)
+        return set(self.members)
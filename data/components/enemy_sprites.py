@@ -1,8 +1,7 @@
-import random
 import pygame as pg
 
-from . import shadow, item_sprites, projectiles
-from .. import prepare, tools
+from . import shadow, item_sprites, projectiles, spatial
+from .. import prepare, tools, replay
 
 
 KNOCK_SPEED = 12.5  #Pixels per frame.
@@ -56,24 +55,35 @@ class BasicAI(object):
         return self.get_direction(obstacles)
 
     def get_direction(self, obstacles):
-        """Return a new valid direction for the sprite."""
-        new_dir = None
-        while not new_dir:
-            new_dir = random.choice(prepare.DIRECTIONS)
-            move = (prepare.DIRECT_DICT[new_dir][0]*prepare.CELL_SIZE[0],
-                    prepare.DIRECT_DICT[new_dir][1]*prepare.CELL_SIZE[1])
-            self.sprite.rect.move_ip(*move)
-            if self.check_collisions(obstacles):
-                new_dir = None
-            self.sprite.rect.move_ip(-move[0], -move[1])
-        return new_dir
+        """
+        Return a new valid direction for the sprite.  Returns None if the
+        sprite is completely boxed in.
+        """
+        open_directions = [direction for direction in prepare.DIRECTIONS
+                           if not self.is_blocked(direction, obstacles)]
+        return replay.RNG.choice(open_directions) if open_directions else None
+
+    def is_blocked(self, direction, obstacles):
+        """
+        Check if moving one cell in direction would take the sprite off the
+        screen or into a solid obstacle.  The obstacles may be an
+        OccupancyGrid, a SpatialGrid or a sprite group.
+        """
+        move = (prepare.DIRECT_DICT[direction][0]*prepare.CELL_SIZE[0],
+                prepare.DIRECT_DICT[direction][1]*prepare.CELL_SIZE[1])
+        if isinstance(obstacles, spatial.OccupancyGrid):
+            return not obstacles.is_free(self.sprite.rect.move(*move))
+        self.sprite.rect.move_ip(*move)
+        blocked = self.check_collisions(obstacles)
+        self.sprite.rect.move_ip(-move[0], -move[1])
+        return blocked
 
     def check_collisions(self, obstacles):
         """
         Check if the sprite attempts to leave the screen or move into a
-        solid obstacle.
+        solid obstacle.  The obstacles may be a sprite group or SpatialGrid.
         """
-        return pg.sprite.spritecollideany(self.sprite, obstacles)
+        return spatial.collideany(self.sprite, obstacles)
 
 
 class LinearAI(BasicAI):
@@ -96,17 +106,14 @@ class LinearAI(BasicAI):
             directions = prepare.DIRECTIONS[:]
             directions.remove(opposite)
         except KeyError:
+            opposite = None
             directions = prepare.DIRECTIONS[:]
-        random.shuffle(directions)
+        replay.RNG.shuffle(directions)
         new_dir = None
         while directions and not new_dir:
             new_dir = directions.pop()
-            move = (prepare.DIRECT_DICT[new_dir][0]*prepare.CELL_SIZE[0],
-                    prepare.DIRECT_DICT[new_dir][1]*prepare.CELL_SIZE[1])
-            self.sprite.rect.move_ip(*move)
-            if self.check_collisions(obstacles):
+            if self.is_blocked(new_dir, obstacles):
                 new_dir = None
-            self.sprite.rect.move_ip(-move[0], -move[1])
         return new_dir if new_dir else opposite
 
 
@@ -123,18 +130,17 @@ class CrabWalk(BasicAI):
         return self.get_direction(obstacles)
 
     def get_direction(self, obstacles):
-        """Sprite has a 3:4 chance of moving horizontally."""
+        """
+        Sprite has a 3:4 chance of moving horizontally.  Returns None if the
+        sprite is completely boxed in.
+        """
         directions = ["front", "back"]+["left"]*3+["right"]*3
-        random.shuffle(directions)
+        replay.RNG.shuffle(directions)
         new_dir = None
-        while not new_dir:
+        while directions and not new_dir:
             new_dir = directions.pop()
-            move = (prepare.DIRECT_DICT[new_dir][0]*prepare.CELL_SIZE[0],
-                    prepare.DIRECT_DICT[new_dir][1]*prepare.CELL_SIZE[1])
-            self.sprite.rect.move_ip(*move)
-            if self.check_collisions(obstacles):
+            if self.is_blocked(new_dir, obstacles):
                 new_dir = None
-            self.sprite.rect.move_ip(-move[0], -move[1])
         return new_dir
 
 
@@ -153,7 +159,7 @@ class _Enemy(tools._BaseSprite):
         self.speed = speed
         self.direction = None
         self.anim_directions = prepare.DIRECTIONS[:]
-        self.anim_direction = random.choice(self.anim_directions)
+        self.anim_direction = replay.RNG.choice(self.anim_directions)
         self.shadow = shadow.Shadow((40,20), self.rect)
         self.image = None
         self.state = "walk"
@@ -204,7 +210,7 @@ class _Enemy(tools._BaseSprite):
         Drop a random item from self.drop.  If None is chosen then no
         item is dropped.
         """
-        drop = random.choice(self.drops)
+        drop = replay.RNG.choice(self.drops)
         if drop:
             item_sprites.ITEMS[drop](self.rect, 15, False, None, *item_groups)
 
@@ -222,7 +228,7 @@ class _Enemy(tools._BaseSprite):
         for knocked_distance in (1, 2, 3):
             move = component*cell_size*knocked_distance
             self.rect[index] += move
-            collide = pg.sprite.spritecollideany(self, obstacles)
+            collide = spatial.collideany(self, obstacles)
             self.rect[index] -= move
             if collide:
                 self.knock_collide = collide.rect
@@ -271,7 +277,7 @@ class _Enemy(tools._BaseSprite):
         will be snapped to the cell and their AI will be queried for a new
         direction.  Finally, update the sprite's rect and animation.
         """
-        obstacles = group_dict["solid_border"]
+        obstacles = group_dict["occupancy"]
         self.old_position = self.exact_position[:]
         if self.state not in ("hit", "die", "spawn"):
             if self.act_mid_step and not self.busy:
@@ -347,7 +353,7 @@ class _BasicFrontFrames(_Enemy):
         self.anims = {"walk" : tools.Anim(self.frames[:2], 7),
                       "hit" : tools.Anim(self.frames[2:4], 20),
                       "die" : None} #Set die in specific class declaration.
-        self.image = self.get_anim().get_next_frame(pg.time.get_ticks())
+        self.image = self.get_anim().get_next_frame(replay.CLOCK.get_ticks())
 
 
 class _SideFramesOnly(_Enemy):
@@ -359,7 +365,7 @@ class _SideFramesOnly(_Enemy):
     def __init__(self, *args):
         _Enemy.__init__(self, *args)
         self.anim_directions = ["left", "right"]
-        self.anim_direction = random.choice(self.anim_directions)
+        self.anim_direction = replay.RNG.choice(self.anim_directions)
         self.ai = LinearAI(self)
         walk = {"left" : tools.Anim(self.frames[:2], 7),
                 "right" : tools.Anim([pg.transform.flip(self.frames[0], 1, 0),
@@ -372,7 +378,7 @@ class _SideFramesOnly(_Enemy):
         die = {"left" : tools.Anim(self.frames[4:], 5, 1),
                "right" : tools.Anim(flipped_die, 5, 1)}
         self.anims = {"walk" : walk, "hit" : hit, "die" : die}
-        self.image = self.get_anim().get_next_frame(pg.time.get_ticks())
+        self.image = self.get_anim().get_next_frame(replay.CLOCK.get_ticks())
 
 
 class _FourDirFrames(_Enemy):
@@ -394,7 +400,7 @@ class _FourDirFrames(_Enemy):
                                pg.transform.flip(self.frames[11], 1, 0)], 20),
                "right" : tools.Anim(self.frames[10:12], 20)}
         self.anims = {"walk" : walk, "hit" : hit, "die" : None}
-        self.image = self.get_anim().get_next_frame(pg.time.get_ticks())
+        self.image = self.get_anim().get_next_frame(replay.CLOCK.get_ticks())
 
 
 class Cabbage(_BasicFrontFrames):
@@ -425,7 +431,7 @@ class Spider(_BasicFrontFrames):
         Every time the spider finishes moving a cell it has a chance to
         shoot a web.
         """
-        if not self.shooting and random.random() <= 0.25:
+        if not self.shooting and replay.RNG.random() <= 0.25:
             self.shooting.add(projectiles.Web(self, group_dict))
 
 
@@ -557,7 +563,7 @@ class Skeleton(_Enemy):
                       "hit" : hit,
                       "die" : tools.Anim(die_frames, 5, 1),
                       "spawn" : tools.Anim(die_frames[::-1], 3, 1)}
-        self.image = self.get_anim().get_next_frame(pg.time.get_ticks())
+        self.image = self.get_anim().get_next_frame(replay.CLOCK.get_ticks())
         self.health = 6
         self.attack = 6
         self.drops = ["heart", None]
@@ -568,7 +574,7 @@ class Daruma(_Enemy):
     def __init__(self, *args):
         _Enemy.__init__(self,  "daruma", ENEMY_SHEET_2, *args)
         self.anim_directions = ["front", "back"]
-        self.anim_direction = random.choice(self.anim_directions)
+        self.anim_direction = replay.RNG.choice(self.anim_directions)
         self.ai = BasicAI(self)
         walk = {"front" : tools.Anim(self.frames[:2], 7),
                 "back" : tools.Anim(self.frames[4:6], 7)}
@@ -576,7 +582,7 @@ class Daruma(_Enemy):
                "back" : tools.Anim(self.frames[6:8], 20)}
         die = tools.Anim(self.frames[8:], 10, 1)
         self.anims = {"walk" : walk, "hit" : hit, "die" : die}
-        self.image = self.get_anim().get_next_frame(pg.time.get_ticks())
+        self.image = self.get_anim().get_next_frame(replay.CLOCK.get_ticks())
         self.health = 6
         self.attack = 6
         self.drops = ["heart", None]
@@ -599,7 +605,7 @@ class EvilElf(_Enemy):
         death_frames = tools.strip_from_sheet(*death_args)
         die = tools.Anim(death_frames, 3, loops=1)
         self.anims = {"walk" : walk, "hit" : hit, "die" : die}
-        self.image = self.get_anim().get_next_frame(pg.time.get_ticks())
+        self.image = self.get_anim().get_next_frame(replay.CLOCK.get_ticks())
         self.health = 6
         self.attack = 6
         self.drops = ["heart", None]
@@ -612,7 +618,7 @@ class FireBallGenerator(_Enemy):
         self.image = pg.Surface((1,1)).convert_alpha() #Required by interface.
         self.image.fill((0,0,0,0))
         self.speed = speed*100 #Miliseconds between shots.
-        self.shot_delay = random.random()*self.speed/2
+        self.shot_delay = replay.RNG.random()*self.speed/2
         self.timer = None
 
     def reset_timer(self):
@@ -621,7 +627,7 @@ class FireBallGenerator(_Enemy):
         prevent projectiles from syncronizing.
         """
         self.timer = tools.Timer(self.speed)
-        self.timer.check_tick(pg.time.get_ticks())
+        self.timer.check_tick(replay.CLOCK.get_ticks())
 
     def collide_with_player(self, player):
         """The generator itself can not hit or be hit."""
@@ -5,7 +5,7 @@ Contains prototype and specific classes for all types of equipable gear.
 import os
 import pygame as pg
 
-from .. import prepare, tools
+from .. import prepare, tools, replay
 
 
 DISPLAY_SHEET = prepare.GFX["equips"]["geardisplay"]
@@ -220,7 +220,7 @@ class AttackSprite(pg.sprite.Sprite):
         Checks the time to see if the weapon's after attack delay has
         elapsed.
         """
-        if self.delay_timer.check_tick(pg.time.get_ticks()):
+        if self.delay_timer.check_tick(replay.CLOCK.get_ticks()):
             self.attacking = True
             self.player = player
             return True
@@ -1,6 +1,6 @@
 import pygame as pg
 
-from .. import tools, prepare
+from .. import tools, prepare, autosave, replay
 from . import equips
 
 
@@ -29,7 +29,7 @@ class _Item(pg.sprite.Sprite):
         coords, size = ITEM_COORDS[name], prepare.CELL_SIZE
         self.frames = tools.strip_coords_from_sheet(ITEM_SHEET, coords, size)
         self.anim = tools.Anim(self.frames, 7)
-        self.image = self.anim.get_next_frame(pg.time.get_ticks())
+        self.image = self.anim.get_next_frame(replay.CLOCK.get_ticks())
         #Subtract 1 from y axis to make item drop appear behind death anim.
         self.rect = pg.Rect((pos[0],pos[1]-1), prepare.CELL_SIZE)
         self.exact_position = list(self.rect.topleft)
@@ -70,6 +70,7 @@ class _Item(pg.sprite.Sprite):
             map_name, key = self.identifier
             identifiers.setdefault(map_name, set())
             identifiers[map_name].add(key)
+        autosave.AUTOSAVER.trigger("item")
 
     def update(self, now, *args):
         """
@@ -1,22 +1,66 @@
 import os
-import sys
 import pygame as pg
 
 from operator import attrgetter
-from .. import prepare, tools
-from . import enemy_sprites, item_sprites
-
-
-if sys.version_info[0] < 3:
-    import yaml
-else:
-    import yaml3 as yaml
+from .. import prepare, tools, autosave, sprite_profiler
+from . import enemy_batch, enemy_sprites, item_sprites, map_cache, spatial
+from .tile_atlas import ATLAS
 
 
 LAYERS = ("BG Colors", "BG Tiles", "Water", "Solid",
           "Solid/Fore", "Foreground", "Environment",
           "Enemies", "Items", "Chests", "Push")
 
+SPRITE_OVERHEAD = 512 #Rough size in bytes of a sprite without its images.
+
+#If True, plain tiles on the BG Tiles and Foreground layers are drawn once
+#onto a single surface per layer instead of being kept as individual sprites.
+BAKE_STATIC_LAYERS = True
+
+#If True (and NumPy is available), crowds of walking enemies are advanced
+#together by an EnemyBatch rather than one sprite at a time.
+BATCH_ENEMIES = True
+
+
+def load_map(map_name):
+    """
+    Load the map data from a resource file.  The compiled copy of the map
+    is used if it is up to date (see map_cache).  This function does not
+    touch pygame so it is safe to call from a worker thread.
+    """
+    path = os.path.join(".", "resources", "map_data", map_name)
+    map_dict = {layer:{} for layer in LAYERS}
+    map_dict.update(map_cache.load_map_data(path))
+    return map_dict
+
+
+def surface_size(surface):
+    """
+    Return the size in bytes of a surface's pixels.  Subsurfaces share
+    their parent's pixels and count as zero.
+    """
+    if surface is None or surface.get_parent():
+        return 0
+    width, height = surface.get_size()
+    return width*height*surface.get_bytesize()
+
+
+def get_sprite_images(sprite):
+    """
+    Return a list of all the surfaces a sprite holds as its image and in
+    its animations.
+    """
+    images = [getattr(sprite, "image", None)]
+    images.extend(getattr(sprite, "frames", []))
+    anims = [getattr(sprite, "anim", None), getattr(sprite, "anims", None)]
+    while anims:
+        anim = anims.pop()
+        if isinstance(anim, dict):
+            anims.extend(anim.values())
+        elif isinstance(anim, tools.Anim):
+            images.extend(anim.frames)
+    return images
+
 
 class CollisionRect(pg.sprite.Sprite):
     """A rect that can be used as a sprite for collision purposes."""
@@ -28,12 +72,15 @@ class CollisionRect(pg.sprite.Sprite):
 class Tile(tools._BaseSprite):
     """A basic tile."""
     def __init__(self, sheet, source, target, mask):
-        """If the player can collide with it pass mask=True."""
+        """
+        If the player can collide with it pass mask=True.  The image and mask
+        are shared with all other tiles of the same type (see tile_atlas).
+        """
         tools._BaseSprite.__init__(self, target, prepare.CELL_SIZE)
         self.sheet = prepare.GFX["mapsheets"][sheet]
-        self.image = self.sheet.subsurface(pg.Rect(source, prepare.CELL_SIZE))
+        self.image = ATLAS.get_image(sheet, source)
         if mask:
-            self.mask = pg.mask.from_surface(self.image)
+            self.mask = ATLAS.get_mask(sheet, source)
 
     def collide_with_player(self, player):
         """
@@ -46,6 +93,27 @@ class Tile(tools._BaseSprite):
         self.rect.topleft = self.exact_position
 
 
+class StaticLayer(pg.sprite.Sprite):
+    """
+    A single sprite holding the prerendered images of many tiles that never
+    move or change (see Level.bake_layer).
+    """
+    def __init__(self, tiles, *groups):
+        """
+        The image is only as large as the bounding rect of the tiles passed.
+        """
+        pg.sprite.Sprite.__init__(self, *groups)
+        self.rect = tiles[0].rect.unionall([tile.rect for tile in tiles])
+        self.image = pg.Surface(self.rect.size).convert_alpha()
+        self.image.fill((0,0,0,0))
+        for tile in tiles:
+            self.image.blit(tile.image, tile.rect.move(-self.rect.x,
+                                                       -self.rect.y))
+
+    def update(self, *args):
+        pass
+
+
 class PushBlock(Tile):
     """
     A class for blocks that the player can push on the map to trigger
@@ -66,7 +134,7 @@ class PushBlock(Tile):
         self.stack_height = stack_height
         self.linked = None
         self.post_event = post_event
-        self.mask.fill() #Solid block masks for pushblocks avoid problems.
+        self.mask = ATLAS.solid_mask #Solid pushblock masks avoid problems.
         self.event_key = event_key
         self.start_rect = self.rect.copy()
         self.offset = [0,0]
@@ -119,14 +187,20 @@ class PushBlock(Tile):
         """
         If the block has not yet been moved, check if the player is currently
         pushing the block.  If the block is currently moving, update its
-        position.
+        position (in the level's solid grid as well).  While moving, the block
+        occupies both its start and final cells in the level's occupancy grid.
         """
         if self.stack_height and not self.linked:
             self.linked = self.get_stacked_tiles(groups)
         if not (self.pushed or self.is_pushing):
             self.check_if_pushing(groups)
+            if self.is_pushing:
+                groups["occupancy"].block(self.get_final_rect())
         elif self.is_pushing and not self.pushed:
             self.pushing()
+            groups["solid_grid"].move(self)
+            if self.pushed:
+                groups["occupancy"].unblock(self.start_rect)
 
     def check_if_pushing(self, groups):
         """
@@ -151,10 +225,13 @@ class PushBlock(Tile):
         position of the block.
         """
         enemies = groups["enemies"]
+        test_sprite = CollisionRect(self.get_final_rect())
+        return not groups["dynamic_grid"].collideany(test_sprite, enemies)
+
+    def get_final_rect(self):
+        """Return the rect the block will occupy once pushed."""
         unit_vec = prepare.DIRECT_DICT[self.push_direction]
-        final = unit_vec[0]*50, unit_vec[1]*50
-        test_sprite = CollisionRect(self.start_rect.move(*final))
-        return not pg.sprite.spritecollideany(test_sprite, enemies)
+        return self.start_rect.move(unit_vec[0]*50, unit_vec[1]*50)
 
     def push_stack(self):
         if self.linked:
@@ -198,8 +275,7 @@ class AnimatedTile(Tile):
         are the same.
         """
         Tile.__init__(self, "animsheet", src, target, mask)
-        size = prepare.CELL_SIZE
-        frames = tools.strip_from_sheet(self.sheet, src, size, frames)
+        frames = ATLAS.get_frames("animsheet", src, frames)
         self.anim = tools.Anim(frames, fps)
 
     def update(self, now, *args):
@@ -244,8 +320,8 @@ class TreasureChest(Tile):
         self.item = item
         self.map_name, self.key = map_name, key
         self.open = False
-        self.open_image = self.sheet.subsurface(((50,0), prepare.CELL_SIZE))
-        self.open_mask = pg.mask.from_surface(self.open_image)
+        self.open_image = ATLAS.get_image("chests", (50,0))
+        self.open_mask = ATLAS.get_mask("chests", (50,0))
         self.add_to_map = False
 
     def check_opened(self, player):
@@ -275,6 +351,7 @@ class TreasureChest(Tile):
                                     (self.map_name, self.key), *item_groups)
             item.get_item(player)
             self.add_to_map = False
+            autosave.AUTOSAVER.trigger("chest")
 
     def interact_with(self, player):
         """
@@ -318,16 +395,37 @@ SPECIAL_TILES = {
 
 class Level(object):
     """Class representing an individual map."""
-    def __init__(self, player, map_name):
+    def __init__(self, player, map_name, map_dict=None, staged=False):
+        """
+        A map_dict that has already been loaded (by the prefetcher for
+        example) may be passed to skip loading the map file.  If staged is
+        True the Level is only built as build_step is called (see build).
+        """
         self.player = player
         self.name = map_name
-        self.map_dict = self.load_map(map_name)
+        self.map_dict = map_dict or self.load_map(map_name)
+        self.group_dict = {}
+        self.shadows = pg.sprite.Group()
+        self.building = self.build()
+        if not staged:
+            self.finish_building()
+
+    def build(self):
+        """
+        A generator that builds the Level, yielding after each costly stage
+        so that a staged Level can be built over several updates.  Until
+        it is done only discard may be called.
+        """
         self.background = self.make_background()
+        yield
         self.enemies = pg.sprite.Group()
         self.items = pg.sprite.Group()
         self.main_sprites = pg.sprite.Group(self.player)
         self.moving = pg.sprite.Group(self.player)
-        self.all_group, self.solids, foreground = self.make_all_layer_groups()
+        self.group_dict = {"main" : self.main_sprites, "moving" : self.moving}
+        for _ in self.make_all_layer_groups():
+            yield
+        foreground = self.group_dict["foreground"]
         self.borders = self.make_borders()
         self.solid_border = pg.sprite.Group(self.solids, self.borders)
         self.interactables = pg.sprite.Group() ###
@@ -344,20 +442,49 @@ class Level(object):
         self.all_group.add(self.player)
         self.spawn()
         self.shadows = self.make_shadows()
+        self.tile_stats = self.get_tile_stats()
         self.posted = set() # Set of map events that have been posted.
+        self.drawn = None #Sprite images and rects as of the last dirty draw.
+        yield
         self.make_chests()
-        self.make_push()
+        self.push_blocks = self.make_push()
+        self.solid_grid = spatial.SpatialGrid(self.solid_border)
+        self.dynamic_grid = spatial.SpatialGrid(slack=1)
+        self.sync_dynamic_grid()
+        self.occupancy = spatial.OccupancyGrid(self.solids)
+        self.group_dict["solid_grid"] = self.solid_grid
+        self.group_dict["dynamic_grid"] = self.dynamic_grid
+        self.group_dict["occupancy"] = self.occupancy
+        self.enemy_batch = None
+        if BATCH_ENEMIES and enemy_batch.np is not None:
+            self.enemy_batch = enemy_batch.EnemyBatch()
+
+    def build_step(self):
+        """Run the next stage of build; return True once the Level is built."""
+        if self.building is not None:
+            try:
+                next(self.building)
+            except StopIteration:
+                self.building = None
+        return self.building is None
+
+    def finish_building(self):
+        """Run every remaining stage of build."""
+        while not self.build_step():
+            pass
 
     def make_push(self):
         """Create all push blocks."""
+        push_blocks = pg.sprite.Group()
         for target in self.map_dict["Push"]:
             data = self.map_dict["Push"][target]
             sheet, source = data[:2]
             args = [sheet, source, target, True, self.post_map_event]+data[2:]
             push = PushBlock(*args)
             self.all_group.add(push, layer=prepare.Z_ORDER["Solid"])
-            groups = (self.solids, self.solid_border, self.moving)
+            groups = (self.solids, self.solid_border, self.moving, push_blocks)
             push.add(*groups)
+        return push_blocks
 
     def make_chests(self):
         """
@@ -391,7 +518,8 @@ class Level(object):
         groups = (self.enemies, self.main_sprites, self.moving, self.all_group)
         for target in self.map_dict["Enemies"]:
             sheet, source, speed = self.map_dict["Enemies"][target]
-            enemy_sprites.ENEMY_DICT[source](target, speed, *groups)
+            enemy = enemy_sprites.ENEMY_DICT[source](target, speed, *groups)
+            enemy.spawn_target = target #Identifies the enemy when frozen.
 
     def make_shadows(self):
         """Create shadows for the player and all enemies."""
@@ -417,11 +545,7 @@ class Level(object):
 
     def load_map(self, map_name):
         """Load the map data from a resource file."""
-        path = os.path.join(".", "resources", "map_data", map_name)
-        map_dict = {layer:{} for layer in LAYERS}
-        with open(path) as myfile:
-            map_dict.update(yaml.load(myfile))
-        return map_dict
+        return load_map(map_name)
 
     def make_background(self):
         """Create the background as one big surface."""
@@ -435,18 +559,79 @@ class Level(object):
         return background
 
     def make_all_layer_groups(self):
-        """Create sprite groups for all layers."""
-        all_group = pg.sprite.LayeredUpdates()
-        solid_group = pg.sprite.Group()
+        """
+        Create sprite groups for all layers as all_group and solids (and the
+        Foreground in group_dict).  If BAKE_STATIC_LAYERS is set, plain BG
+        Tiles are drawn directly onto the background and plain Foreground
+        tiles are combined into a single StaticLayer sprite.  Animated tiles
+        and tiles stacked on push blocks remain sprites.  A generator that
+        yields after each layer; see build.
+        """
+        self.all_group = all_group = pg.sprite.LayeredUpdates()
+        self.solids = pg.sprite.Group()
         layer = "BG Tiles"
-        all_group.add(self.make_tile_group(layer), layer=prepare.Z_ORDER[layer])
+        bg_tiles = self.make_tile_group(layer)
+        yield
         foreground = self.make_tile_group("Foreground")
+        self.group_dict["foreground"] = foreground
+        yield
+        if BAKE_STATIC_LAYERS:
+            for tile in self.bake_layer(bg_tiles):
+                self.background.blit(tile.image, tile.rect)
+            baked = self.bake_layer(foreground, self.get_push_stack_rects())
+            if baked:
+                foreground_layer = StaticLayer(baked)
+                all_group.add(foreground_layer,
+                              layer=prepare.Z_ORDER["Foreground"])
+            yield
+        all_group.add(bg_tiles, layer=prepare.Z_ORDER[layer])
         all_group.add(foreground, layer=prepare.Z_ORDER["Foreground"])
         for layer in ("Solid/Fore", "Solid", "Water"):
             solids = self.make_tile_group(layer, True)
             all_group.add(solids, layer=prepare.Z_ORDER[layer])
-            solid_group.add(solids)
-        return all_group, solid_group, foreground
+            self.solids.add(solids)
+            yield
+
+    def bake_layer(self, group, keep_rects=()):
+        """
+        Remove the tiles that can be prerendered from group and return them
+        as a list.  Only plain Tile instances can be baked; tiles colliding
+        with any of keep_rects are left in the group.
+        """
+        baked = []
+        for tile in group.sprites():
+            if type(tile) is Tile and tile.rect.collidelist(keep_rects) == -1:
+                group.remove(tile)
+                baked.append(tile)
+        return baked
+
+    def get_push_stack_rects(self):
+        """
+        Return the rects above each push block that may contain foreground
+        tiles which move with the block (see PushBlock.get_stacked_tiles).
+        """
+        rects = []
+        for target, data in self.map_dict["Push"].items():
+            stack_height = data[3] if len(data) > 3 else 2
+            rect = pg.Rect(0, 0, prepare.CELL_SIZE[0],
+                           prepare.CELL_SIZE[1]*stack_height)
+            rect.bottomleft = target
+            rects.append(rect)
+        return rects
+
+    def get_tile_stats(self):
+        """
+        Return the number of tiles on the map, the number of distinct
+        (sheet, source) pairs among them, and the ratio of the two.  The lower
+        the ratio, the more the Level benefits from the shared tile atlas.
+        """
+        layers = ("BG Tiles", "Water", "Solid", "Solid/Fore", "Foreground",
+                  "Push")
+        cells = [tuple(self.map_dict[layer][target][:2])
+                 for layer in layers for target in self.map_dict[layer]]
+        unique = len(set(cells))
+        ratio = float(unique)/len(cells) if cells else 0.0
+        return {"tiles" : len(cells), "unique" : unique, "ratio" : ratio}
 
     def make_tile_group(self, layer, mask=False):
         """
@@ -481,22 +666,55 @@ class Level(object):
     def update(self, now):
         """
         Update all sprites; check any collisions that may have occured;
-        and finally sort the main_sprite group by y coordinate.
-        """
-        self.all_group.update(now, self.player, self.group_dict)
+        and finally sort the main_sprite group by y coordinate.  Enemies
+        handled by the enemy batch are updated first, ahead of the y sorted
+        order the other sprites update in.  This only shows where sprites
+        interact within a tick, such as two enemies claiming the same free
+        cell, and only on maps crowded enough for the batch to be used.
+        While the sprite profiler is enabled each sprite is updated through
+        it.
+        """
+        profiler = sprite_profiler.PROFILER
+        batched = None
+        if self.enemy_batch is not None:
+            #Sprites created by the batched enemies wait until next update.
+            sprites = self.all_group.sprites()
+            start = sprite_profiler.get_time()
+            batched = self.enemy_batch.update(now, self.player,
+                                              self.group_dict)
+            if profiler.enabled and batched:
+                elapsed = sprite_profiler.get_time()-start
+                profiler.add("update", "EnemyBatch", elapsed, len(batched))
+        if batched:
+            sprites = [sprite for sprite in sprites if sprite not in batched]
+        else:
+            sprites = self.all_group.sprites()
+        if profiler.enabled:
+            profiler.update(sprites, now, self.player, self.group_dict)
+        else:
+            for sprite in sprites:
+                sprite.update(now, self.player, self.group_dict)
         if not self.enemies:
             self.post_map_event("kill")
+        self.sync_dynamic_grid()
         self.check_collisions()
 
+    def sync_dynamic_grid(self):
+        """
+        Update the grid of enemies, items and projectiles to their current
+        positions (adding and removing sprites as needed).
+        """
+        dynamic = self.enemies.sprites()+self.items.sprites()
+        self.dynamic_grid.sync(dynamic+self.projectiles.sprites())
+
     def check_collisions(self):
         """
         Check collisions and call the appropriate functions of the affected
-        sprites.
+        sprites.  Only sprites in the grid cells around the player are tested.
         """
         callback = tools.rect_then_mask
-        groups = pg.sprite.Group(self.solids, self.enemies,
-                                 self.items, self.projectiles)
-        hits = pg.sprite.spritecollide(self.player, groups, False, callback)
+        hits = self.solid_grid.collide(self.player, callback, self.solids)
+        hits += self.dynamic_grid.collide(self.player, callback)
         for hit in hits:
             hit.collide_with_player(self.player)
         self.process_attacks()
@@ -505,20 +723,161 @@ class Level(object):
         """Check if player is attacking, and if so, check enemy collisions."""
         weapon = self.player.equipped["weapon"].sprite
         if weapon.attacking:
-            for enemy in pg.sprite.spritecollide(weapon, self.enemies, False):
-                enemy.got_hit(self.player, self.solid_border, self.items,
+            hits = self.dynamic_grid.collide(weapon, within=self.enemies)
+            for enemy in hits:
+                enemy.got_hit(self.player, self.solid_grid, self.items,
                               self.main_sprites, self.all_group)
 
-    def draw(self, surface, interpolate):
-        """Draw all sprites and layers to the surface."""
-        surface.blit(self.background, (0,0))
+    def prepare_draw(self, interpolate):
+        """
+        Interpolate the positions of moving sprites and sort the main sprites
+        by y coordinate.
+        """
         for sprite in self.moving:
             interpolated = (sprite.frame_speed[0]*interpolate,
                             sprite.frame_speed[1]*interpolate)
             sprite.rect.move_ip(*interpolated)
         for sprite in self.main_sprites:
             self.all_group.change_layer(sprite, sprite.rect.centery)
-        self.all_group.draw(surface)
+
+    def draw(self, surface, interpolate):
+        """Draw all sprites and layers to the surface."""
+        surface.blit(self.background, (0,0))
+        self.prepare_draw(interpolate)
+        self.draw_sprites(surface)
+        self.drawn = None
+
+    def draw_sprites(self, surface):
+        """
+        Draw every sprite in layer order; through the sprite profiler if it
+        is enabled.
+        """
+        if sprite_profiler.PROFILER.enabled:
+            sprite_profiler.PROFILER.draw(self.all_group.sprites(), surface)
+        else:
+            self.all_group.draw(surface)
+
+    def draw_dirty(self, surface, interpolate):
+        """
+        Redraw only the areas of the surface where a sprite has moved,
+        changed image, appeared or disappeared since the last call.  Returns
+        the list of redrawn rects.  The first call after a full draw (or
+        after drawn is reset to None) redraws everything and returns
+        [prepare.PLAY_RECT].
+        """
+        self.prepare_draw(interpolate)
+        sprites = self.all_group.sprites()
+        current = {sprite : (sprite.image, pg.Rect(sprite.rect))
+                   for sprite in sprites}
+        if self.drawn is None:
+            surface.blit(self.background, (0,0))
+            self.draw_sprites(surface)
+            self.drawn = current
+            return [prepare.PLAY_RECT.copy()]
+        dirty = []
+        for sprite, (image, rect) in current.items():
+            old = self.drawn.pop(sprite, None)
+            if not old:
+                dirty.append(rect)
+            elif old[0] is not image or old[1] != rect:
+                dirty.extend((old[1], rect))
+        dirty.extend(rect for image, rect in self.drawn.values())
+        self.drawn = current
+        dirty = [rect.clip(prepare.PLAY_RECT) for rect in dirty]
+        dirty = tools.merge_rects([rect for rect in dirty if rect])
+        sprite_rects = [sprite.rect for sprite in sprites]
+        profiler = sprite_profiler.PROFILER
+        for rect in dirty:
+            surface.set_clip(rect)
+            surface.blit(self.background, rect, rect)
+            for i in rect.collidelistall(sprite_rects):
+                if profiler.enabled:
+                    profiler.draw_sprite(surface, sprites[i])
+                else:
+                    surface.blit(sprites[i].image, sprites[i].rect)
+        surface.set_clip(None)
+        if profiler.enabled:
+            profiler.end_draw()
+        return dirty
+
+    def estimate_size(self):
+        """
+        Return a rough estimate of the memory (in bytes) held by this Level's
+        surfaces, masks and sprites.  The player's images are not counted as
+        they are shared by every Level.
+        """
+        surfaces, masks = {self.background}, set()
+        sprites = [sprite for sprite in self.all_group
+                   if sprite not in (self.player, self.player.shadow)]
+        for sprite in sprites:
+            surfaces.update(get_sprite_images(sprite))
+            if getattr(sprite, "mask", None):
+                masks.add(sprite.mask)
+        size = sum(surface_size(surface) for surface in surfaces)
+        for mask in masks:
+            width, height = mask.get_size()
+            size += width*height//8
+        return size+SPRITE_OVERHEAD*len(sprites)
+
+    def freeze(self):
+        """
+        Return a dictionary of the state that would be lost if this Level
+        were rebuilt from its map file: the positions and health of living
+        enemies, the events that have been posted, and pushed blocks.
+        """
+        enemies = {}
+        for enemy in self.enemies:
+            if enemy.state != "die":
+                health = getattr(enemy, "health", None)
+                enemies[enemy.spawn_target] = (enemy.rect.topleft, health)
+        pushed = {}
+        for block in self.push_blocks:
+            if block.pushed:
+                pushed[block.start_rect.topleft] = block.rect.topleft
+        return {"enemies" : enemies,
+                "posted" : set(self.posted),
+                "pushed" : pushed}
+
+    def thaw(self, frozen):
+        """
+        Restore state returned by Level.freeze to a freshly built Level.
+        Enemies that had been killed are removed rather than respawning.
+        """
+        for enemy in list(self.enemies):
+            if enemy.spawn_target in frozen["enemies"]:
+                position, health = frozen["enemies"][enemy.spawn_target]
+                enemy.reset_position(position)
+                if health is not None:
+                    enemy.health = health
+            else:
+                enemy.kill()
+                if hasattr(enemy, "shadow"):
+                    enemy.shadow.kill()
+        for block in self.push_blocks:
+            if block.start_rect.topleft in frozen["pushed"]:
+                if block.stack_height:
+                    block.linked = block.get_stacked_tiles(self.group_dict)
+                block.rect.topleft = frozen["pushed"][block.start_rect.topleft]
+                block.pushed = True
+                block.push_stack()
+                self.solid_grid.move(block)
+                self.occupancy.unblock(block.start_rect)
+                self.occupancy.block(block.rect)
+        for event in frozen["posted"]:
+            self.post_map_event(event)
+
+    def discard(self):
+        """
+        Remove the player and its attached sprites from this Level's groups.
+        Sprites keep references to their groups, so this must be called on
+        any Level that is thrown away for it to be garbage collected.
+        """
+        groups = [group for group in self.group_dict.values()
+                  if isinstance(group, pg.sprite.AbstractGroup)]
+        groups.append(self.shadows)
+        weapon = self.player.equipped["weapon"].sprite
+        for sprite in (self.player, self.player.shadow, weapon):
+            sprite.remove(*groups)
 
     def on_map_change(self):
         groups = pg.sprite.Group(self.group_dict["projectiles"],
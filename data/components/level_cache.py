@@ -0,0 +1,78 @@
+"""
+Contains a least recently used cache for Levels that is limited by an
+estimate of the memory the cached Levels use rather than by their number.
+"""
+
+from collections import OrderedDict
+
+
+class LevelCache(object):
+    """
+    Levels are looked up by map name.  When adding a Level pushes the total
+    estimated size over budget, the least recently used Levels are evicted
+    (the Level just added is never evicted).  If freeze is True, an evicted
+    Level's dynamic state is kept so that the map can later be rebuilt the
+    way the player left it.  At most frozen_limit states are kept; beyond
+    that the state frozen longest ago is forgotten and its map respawns.
+    """
+    def __init__(self, budget, freeze=False, frozen_limit=32):
+        """The budget argument is given in bytes."""
+        self.budget = budget
+        self.freeze = freeze
+        self.frozen_limit = frozen_limit
+        self.levels = OrderedDict() #Least recently used first.
+        self.sizes = {}
+        self.frozen = OrderedDict() #Oldest first.
+        self.total_size = 0
+
+    def __contains__(self, map_name):
+        return map_name in self.levels
+
+    def __len__(self):
+        return len(self.levels)
+
+    def names(self):
+        """Return the names of the cached maps; most recently used last."""
+        return list(self.levels)
+
+    def get(self, map_name):
+        """
+        Return the cached Level for map_name and mark it as most recently
+        used.  Returns None if the map isn't cached.
+        """
+        level = self.levels.pop(map_name, None)
+        if level is not None:
+            self.levels[map_name] = level
+        return level
+
+    def add(self, level):
+        """Add (or refresh) a Level; then evict Levels until within budget."""
+        if level.name in self.levels:
+            self.remove(level.name)
+        self.levels[level.name] = level
+        self.sizes[level.name] = level.estimate_size()
+        self.total_size += self.sizes[level.name]
+        self.frozen.pop(level.name, None)
+        while self.total_size > self.budget and len(self.levels) > 1:
+            self.evict(next(iter(self.levels)))
+
+    def remove(self, map_name):
+        """Remove and return a Level without freezing or discarding it."""
+        self.total_size -= self.sizes.pop(map_name)
+        return self.levels.pop(map_name)
+
+    def evict(self, map_name):
+        """
+        Remove a Level from the cache, freezing its state first if freeze
+        mode is on.
+        """
+        level = self.remove(map_name)
+        if self.freeze:
+            self.frozen[map_name] = level.freeze()
+            while len(self.frozen) > self.frozen_limit:
+                self.frozen.popitem(last=False)
+        level.discard()
+
+    def pop_frozen(self, map_name):
+        """Return and forget the frozen state for map_name (None if absent)."""
+        return self.frozen.pop(map_name, None)
@@ -0,0 +1,140 @@
+"""
+Functions for loading map files through a compiled binary cache.
+
+Parsing a .map file with the pure python YAML loader is by far the slowest
+part of building a Level.  The first time a map is loaded its data is dumped
+with marshal to a compiled file sitting alongside the source (desert.map
+becomes desert.mapc).  The compiled file records the modification time, size
+and SHA-1 digest of the source it was built from; later loads use it as long
+as it still matches the source and fall back to YAML (rewriting the compiled
+file) when it doesn't.
+"""
+
+import os
+import sys
+import struct
+import marshal
+import hashlib
+import tempfile
+
+from .. import serialization
+
+
+COMPILED_EXTENSION = ".mapc"
+MAGIC = b"CKMP"
+FORMAT_VERSION = 1
+
+#Magic, format version, python major, python minor, marshal version,
+#source mtime, source size, source SHA-1 digest.
+HEADER = struct.Struct("<4sBBBBdQ20s")
+
+
+def compiled_path(path):
+    """Return the path of the compiled file for the map at path."""
+    return os.path.splitext(path)[0]+COMPILED_EXTENSION
+
+
+def source_digest(path):
+    """Return the SHA-1 digest of the file at path."""
+    with open(path, "rb") as source:
+        return hashlib.sha1(source.read()).digest()
+
+
+def make_header(path, digest):
+    """Pack a compiled file header describing the source file at path."""
+    stat = os.stat(path)
+    return HEADER.pack(MAGIC, FORMAT_VERSION, sys.version_info[0],
+                       sys.version_info[1], marshal.version,
+                       stat.st_mtime, stat.st_size, digest)
+
+
+def read_compiled(path):
+    """
+    Return the map data stored in the compiled file for the source at path
+    if it is still fresh; otherwise return None.  The source is only hashed
+    if its modification time or size no longer match the header.
+    """
+    try:
+        with open(compiled_path(path), "rb") as compiled:
+            raw_header = compiled.read(HEADER.size)
+            header = HEADER.unpack(raw_header)
+            magic, version, major, minor, marshal_version = header[:5]
+            mtime, size, digest = header[5:]
+            if (magic, version, marshal_version) != (MAGIC, FORMAT_VERSION,
+                                                     marshal.version):
+                return None
+            if (major, minor) != sys.version_info[:2]:
+                return None
+            stat = os.stat(path)
+            if (stat.st_mtime, stat.st_size) != (mtime, size):
+                if source_digest(path) != digest:
+                    return None
+                refresh_header(path, digest)
+            return marshal.loads(compiled.read())
+    except (IOError, OSError, struct.error, ValueError, EOFError, TypeError):
+        return None
+
+
+def refresh_header(path, digest):
+    """
+    Rewrite only the header of a compiled file whose source was touched but
+    not changed (so that the next load can skip hashing).
+    """
+    try:
+        with open(compiled_path(path), "r+b") as compiled:
+            compiled.write(make_header(path, digest))
+    except (IOError, OSError):
+        pass
+
+
+def write_compiled(path, map_data, digest=None):
+    """
+    Write map_data to the compiled file for the source at path.  The data is
+    written to a uniquely named temporary file first and renamed into place
+    so that a partially written file is never read (this also makes it safe
+    to compile the same map from more than one thread).  Failure to write
+    (a read only install for example) is not an error; the map is simply
+    parsed again next time.
+    """
+    digest = digest or source_digest(path)
+    target = compiled_path(path)
+    directory, name = os.path.split(target)
+    try:
+        handle, temp = tempfile.mkstemp(".tmp", name+".", directory or ".")
+    except (IOError, OSError):
+        return
+    try:
+        with os.fdopen(handle, "wb") as compiled:
+            compiled.write(make_header(path, digest))
+            compiled.write(marshal.dumps(map_data))
+        if os.name == "nt" and os.path.exists(target):
+            os.remove(target)
+        os.rename(temp, target)
+    except (IOError, OSError, ValueError):
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+
+
+def load_yaml(path):
+    """
+    Parse the map file at path with YAML and return the resulting data.
+    The loader is chosen by serialization.load_map.
+    """
+    with open(path) as myfile:
+        return serialization.load_map(myfile)
+
+
+def load_map_data(path):
+    """
+    Load the map data for the .map file at path.  The compiled file is used
+    if it is fresh; otherwise the map is parsed and the compiled file is
+    rebuilt.
+    """
+    map_data = read_compiled(path)
+    if map_data is None:
+        digest = source_digest(path)
+        map_data = load_yaml(path)
+        write_compiled(path, map_data, digest)
+    return map_data
@@ -5,6 +5,8 @@ This module contains the primary class for the player.
 import random
 import pygame as pg
 
+from collections import OrderedDict
+
 from . import equips, shadow
 from .. import prepare, tools
 
@@ -23,6 +25,101 @@ STANDARD_ANIMATION_FPS = 7.0
 HIT_ANIMATION_FPS = 20.0
 BASE_SPEED = 3
 KNOCK_SPEED = 12.5
+PREVIEW_DIRECTION = "front"
+EQUIP_SLOTS = ("head", "body", "shield", "armleg", "weapon")
+ANIMATION_CACHE_SIZE = 40 #Loadouts; enough for every combination of gear.
+
+#Select screen previews keyed by the equipped tuple (see get_preview).
+PREVIEW_CACHE = {}
+
+
+def calc_stats(gear):
+    """Calculate (defense, attack, speed) from a dict of equipped gear."""
+    stat_mods = zip(*[g.stats for g in gear.values()])
+    defense, attack, speed_mod = [sum(stats) for stats in stat_mods]
+    return (defense, attack, BASE_SPEED+speed_mod)
+
+
+def make_death_animation():
+    """Return a tools.Anim object with the player's death sequence."""
+    sheet = prepare.GFX["enemies"]["enemysheet"]
+    cell_coords = [(3,1), (4,1), (5,1), (6,1), (6,1)]
+    args = (sheet, cell_coords, prepare.CELL_SIZE)
+    death_cells = tools.strip_coords_from_sheet(*args)
+    return tools.Anim(death_cells, 3, loops=1)
+
+
+def make_anims(frame_set, fps):
+    """
+    Return a dict like frame_set ({state : {direction : frames}}) holding a
+    new tools.Anim for each list of frames.
+    """
+    anims = {}
+    for state,directions in frame_set.items():
+        anims[state] = {direction:tools.Anim(directions[direction], fps)
+                        for direction in directions}
+    return anims
+
+
+def get_equipped_key(equipped):
+    """
+    Return the equipped tuple (head, body, shield, armleg, weapon) for a
+    dict of equipped gear names.
+    """
+    return tuple(equipped[part] for part in EQUIP_SLOTS)
+
+
+def get_preview(equipped):
+    """
+    Return the PlayerPreview for a dict of equipped gear names, creating
+    it the first time a combination is seen.
+    """
+    key = get_equipped_key(equipped)
+    if key not in PREVIEW_CACHE:
+        PREVIEW_CACHE[key] = PlayerPreview(equipped)
+    return PREVIEW_CACHE[key]
+
+
+class AnimationCache(object):
+    """
+    A least recently used cache of the finished player frames for each
+    equipped tuple.  Every player wearing the same loadout shares the same
+    surfaces; only the Anim objects wrapping them belong to a sprite.
+    """
+    def __init__(self, size=ANIMATION_CACHE_SIZE):
+        self.size = size
+        self.frame_sets = OrderedDict() #Least recently used first.
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        return key in self.frame_sets
+
+    def __len__(self):
+        return len(self.frame_sets)
+
+    def get(self, key, make_frame_sets):
+        """
+        Return the frame sets for key, calling make_frame_sets to create
+        them if they aren't cached; then evict the least recently used
+        loadouts until within size.
+        """
+        frame_sets = self.frame_sets.pop(key, None)
+        if frame_sets is None:
+            self.misses += 1
+            frame_sets = make_frame_sets()
+        else:
+            self.hits += 1
+        self.frame_sets[key] = frame_sets
+        while len(self.frame_sets) > max(self.size, 1):
+            self.frame_sets.popitem(last=False)
+        return frame_sets
+
+    def clear(self):
+        self.frame_sets.clear()
+
+
+ANIMATION_CACHE = AnimationCache()
 
 
 class _ImageProcessing(object):
@@ -35,7 +132,20 @@ class _ImageProcessing(object):
         """
         Returns a list of two dictionaries containing all animations.
         Index zero corresponds to normal frames; index one corresponds to
-        frames for taking damage.
+        frames for taking damage.  The frames come from ANIMATION_CACHE, so
+        they are only composited the first time a loadout is seen.
+        """
+        names = {part:gear.name for part,gear in self.equipped.items()}
+        key = get_equipped_key(names)
+        standard, strobing = ANIMATION_CACHE.get(key, self.make_frame_sets)
+        return [make_anims(standard, STANDARD_ANIMATION_FPS),
+                make_anims(strobing, HIT_ANIMATION_FPS)]
+
+    def make_frame_sets(self):
+        """
+        Composite every frame for the equipped gear.  Returns a list like
+        that of make_all_animations, but holding lists of frames instead of
+        Anim objects.
         """
         standard = {}
         standard["normal"] = self.make_images()
@@ -43,23 +153,27 @@ class _ImageProcessing(object):
         strobing = {}
         strobing["normal"] = self.make_hit_images(standard["normal"])
         strobing["attack"] = self.make_hit_images(standard["attack"])
-        return [standard, strobing]
+        frame_sets = []
+        for animations in (standard, strobing):
+            frame_set = {}
+            for state,anims in animations.items():
+                frame_set[state] = {direction:anims[direction].frames
+                                    for direction in anims}
+            frame_sets.append(frame_set)
+        return frame_sets
 
     def make_death_animation(self):
         """Return a tools.Anim object with the player's death sequence."""
-        sheet = prepare.GFX["enemies"]["enemysheet"]
-        cell_coords = [(3,1), (4,1), (5,1), (6,1), (6,1)]
-        args = (sheet, cell_coords, prepare.CELL_SIZE)
-        death_cells = tools.strip_coords_from_sheet(*args)
-        return tools.Anim(death_cells, 3, loops=1)
+        return make_death_animation()
 
-    def make_images(self, attack=False, order=DRAW_ORDER):
+    def make_images(self, attack=False, order=DRAW_ORDER,
+                    directions=prepare.DIRECTIONS):
         """Create the player's animations any time he changes equipment."""
         base = pg.Surface(prepare.CELL_SIZE).convert()
         base.set_colorkey(prepare.COLOR_KEY)
         base.fill(prepare.COLOR_KEY)
         anims = {}
-        for direction in prepare.DIRECTIONS:
+        for direction in directions:
             frames = []
             for frame in (0, 1):
                 image = base.copy()
@@ -210,8 +324,8 @@ class Player(tools._BaseSprite, _ImageProcessing):
     def change_equip(self, gear_type, gear):
         """
         Called if the player switches out one gear for another.
-        All animations are reconstructed and stats recalced.
-        Do not call at performance critical times.
+        All animations are reconstructed (from ANIMATION_CACHE if the new
+        loadout has been seen before) and stats recalced.
         """
         self.equipped[gear_type] = gear
         self.all_animations = self.make_all_animations()
@@ -220,9 +334,7 @@ class Player(tools._BaseSprite, _ImageProcessing):
 
     def calc_stats(self, gear):
         """Calculate stats based on current gear."""
-        stat_mods = zip(*[g.stats for g in gear.values()])
-        defense, attack, speed_mod = [sum(stats) for stats in stat_mods]
-        return (defense, attack, BASE_SPEED+speed_mod)
+        return calc_stats(gear)
 
     def make_mask(self):
         """Create a collision mask for the player."""
@@ -376,3 +488,64 @@ class Player(tools._BaseSprite, _ImageProcessing):
             self.move()
         self.adjust_frames(now)
         self.rect.topleft = self.exact_position
+
+
+class PlayerPreview(_ImageProcessing):
+    """
+    The stats and the composited front facing frames (normal and hit) for
+    one combination of equipped gear.  Only the equipped items are created,
+    and only once per combination; get it through get_preview.
+    """
+    def __init__(self, equipped):
+        self.equipped = {}
+        for part,name in equipped.items():
+            self.equipped[part] = equips.EQUIP_DICT[part][name]()
+        self.stats = calc_stats(self.equipped)
+        normal = self.make_images(directions=(PREVIEW_DIRECTION,))
+        self.frames = normal[PREVIEW_DIRECTION].frames
+        hit = self.make_hit_images(normal)
+        self.hit_frames = hit[PREVIEW_DIRECTION].frames
+
+
+class SlotSummary(object):
+    """
+    What the select screen shows of a save slot: name, money, keys, stats
+    and the names of the equipped gear, with a shared preview of the
+    player's appearance.  The full Player is only made (by make_player) for
+    the slot that is actually played.
+    """
+    def __init__(self, data):
+        self.data = data
+        self.name = data["name"]
+        self.money = data["money"]
+        self.keys = data["keys"]
+        self.equipped = dict(data["equipped"])
+        preview = get_preview(self.equipped)
+        self.defense, self.strength, self.speed = preview.stats
+        self.anim = tools.Anim(preview.frames, STANDARD_ANIMATION_FPS)
+        self.hit_anim = tools.Anim(preview.hit_frames, HIT_ANIMATION_FPS)
+        self.death_anim = None
+        self.image = preview.frames[0]
+        self.action_state = "normal"
+        self.hit_state = False
+
+    def die(self):
+        """Start the death animation (when the slot is deleted)."""
+        self.death_anim = make_death_animation()
+        self.action_state = "dead"
+
+    def adjust_frames(self, now, animate=False):
+        """
+        Advance the preview animation if animate is True.  The hit and
+        death animations always advance.
+        """
+        if self.action_state == "dead":
+            self.image = self.death_anim.get_next_frame(now)
+        elif self.hit_state:
+            self.image = self.hit_anim.get_next_frame(now)
+        elif animate:
+            self.image = self.anim.get_next_frame(now)
+
+    def make_player(self):
+        """Return the full Player for this slot."""
+        return Player(self.data)
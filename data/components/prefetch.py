@@ -0,0 +1,115 @@
+"""
+Contains a class for loading map files in the background.
+
+The WorldMap asks the prefetcher for the maps adjacent to the current one.
+A worker thread loads them into plain map dictionaries (no pygame calls are
+made off the main thread); the WorldMap then builds Levels from those
+dictionaries a little at a time so that crossing an edge does not need to
+parse or build anything.  While a session is recorded or replayed (see
+replay.DETERMINISTIC) maps are loaded on request instead, so that Levels are
+staged on the same update every time.
+"""
+
+import threading
+
+from .. import replay
+from . import level
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class MapPrefetcher(object):
+    """Loads map dictionaries on a daemon worker thread."""
+    def __init__(self, loader=level.load_map):
+        """
+        The loader argument is the function used to turn a map name into a
+        map dictionary; it must be safe to call from a thread.
+        """
+        self.loader = loader
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+        self.loaded = {}
+        self.pending = set()
+        self.hits = 0
+        self.misses = 0
+        self.thread = None
+
+    def start(self):
+        """Start the worker thread if it is not already running."""
+        if not self.thread:
+            self.thread = threading.Thread(target=self.work)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def request(self, map_names):
+        """
+        Queue any of the map_names that are not already loaded or waiting to
+        be loaded.  Loaded maps that are no longer requested are discarded.
+        """
+        wanted = set(map_names)
+        if replay.DETERMINISTIC:
+            self.load_now(wanted)
+            return
+        self.start()
+        with self.lock:
+            for name in set(self.loaded)-wanted:
+                del self.loaded[name]
+            for name in wanted-set(self.loaded)-self.pending:
+                self.pending.add(name)
+                self.requests.put(name)
+
+    def load_now(self, wanted):
+        """Load the wanted maps on the calling thread."""
+        with self.lock:
+            for name in set(self.loaded)-wanted:
+                del self.loaded[name]
+            missing = wanted-set(self.loaded)
+        for name in sorted(missing):
+            try:
+                map_dict = self.loader(name)
+            except Exception:
+                map_dict = None
+            if map_dict is not None:
+                with self.lock:
+                    self.loaded[name] = map_dict
+
+    def take(self, map_name):
+        """
+        Return and forget the loaded dictionary for map_name.  Returns None
+        if the map has not finished loading yet.
+        """
+        with self.lock:
+            return self.loaded.pop(map_name, None)
+
+    def work(self):
+        """Loop of the worker thread; load maps as they are requested."""
+        while True:
+            name = self.requests.get()
+            try:
+                map_dict = self.loader(name)
+            except Exception:
+                #The main thread will load the map itself and raise properly.
+                map_dict = None
+            with self.lock:
+                self.pending.discard(name)
+                if map_dict is not None:
+                    self.loaded[name] = map_dict
+
+    def record(self, hit):
+        """Count an edge crossing as a prefetch hit or miss."""
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def stats(self):
+        """Return a dictionary of prefetch counters."""
+        with self.lock:
+            loaded, pending = len(self.loaded), len(self.pending)
+        return {"hits" : self.hits,
+                "misses" : self.misses,
+                "loaded" : loaded,
+                "pending" : pending}
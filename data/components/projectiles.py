@@ -1,8 +1,7 @@
 import math
-import random
 import pygame as pg
 
-from .. import prepare, tools
+from .. import prepare, tools, replay
 
 
 SHOOT_SHEET = prepare.GFX["objects"]["projectiles"]
@@ -28,7 +27,7 @@ class Web(_Particle):
     def __init__(self, owner, group_dict):#*groups):
         self.owner = owner
         self.base = SHOOT_SHEET.subsurface(pg.Rect(51,0,21,50))
-        self.direction = random.choice(prepare.DIRECTIONS)
+        self.direction = replay.RNG.choice(prepare.DIRECTIONS)
         if self.direction in ("front","back"):
             self.axis = 0
             size = (50, 21)
@@ -114,7 +113,7 @@ class FireBall(_Particle):
         self.attack = 5
         self.frames = tools.strip_from_sheet(SHOOT_SHEET, (100,250), size, 2)
         self.anim = tools.Anim(self.frames, 12)
-        self.image = self.anim.get_next_frame(pg.time.get_ticks())
+        self.image = self.anim.get_next_frame(replay.CLOCK.get_ticks())
         self.mask = pg.mask.from_surface(self.image)
 
     def get_vector(self, player):
@@ -27,6 +27,8 @@ class SideBar(object):
         self.rect = self.image.get_rect(x=1000)
         self.cells = self.get_health_cells()
         self.stats = {"money" : (None,None), "keys" : (None,None)}
+        self.drawn_state = None
+        self.dirty = True #True if the image changed since last drawn.
 
     def get_health_cells(self):
         """
@@ -78,14 +80,27 @@ class SideBar(object):
         primary = display_image.get_rect(center=PRIMARY_EQUIP.center)
         self.image.blit(display_image, primary)
 
+    def get_state(self, player):
+        """Return a tuple of everything the HUD displays."""
+        return (player.health, player.inventory["money"],
+                player.inventory["keys"], player.equipped["weapon"].display)
+
     def update(self, player):
-        """Update and redraw all elements to the image."""
-        self.image.fill(prepare.BACKGROUND_COLOR)
-        self.image.blit(prepare.GFX["misc"]["sidebargfx"], (0,0))
-        self.render_health(player)
-        self.render_numbers(player)
-        self.render_gear(player)
+        """
+        Redraw all elements to the image if anything displayed has changed
+        since the last update.
+        """
+        state = self.get_state(player)
+        if state != self.drawn_state:
+            self.image.fill(prepare.BACKGROUND_COLOR)
+            self.image.blit(prepare.GFX["misc"]["sidebargfx"], (0,0))
+            self.render_health(player)
+            self.render_numbers(player)
+            self.render_gear(player)
+            self.drawn_state = state
+            self.dirty = True
 
     def draw(self, surface, offset=0):
         """Standard draw function."""
         surface.blit(self.image, (self.rect.x+offset, self.rect.y))
+        self.dirty = False
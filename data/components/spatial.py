@@ -0,0 +1,199 @@
+"""
+Contains a uniform grid used to find the sprites near a rect without
+testing every sprite on the map.
+"""
+
+import pygame as pg
+
+from .. import prepare
+
+
+class SpatialGrid(object):
+    """
+    Sprites are bucketed by every cell their rect overlaps.  Queries only
+    look at the buckets a rect overlaps, so their cost depends on how crowded
+    that area is rather than on the number of sprites on the map.  Results
+    are always returned in the order the sprites were added to the grid.
+    """
+    def __init__(self, sprites=(), cell_size=prepare.CELL_SIZE, slack=0):
+        """
+        The slack argument is the number of extra cells to search around a
+        queried rect.  A grid that is only resynced once a frame should use a
+        slack of 1 so that sprites that have moved a little since the last
+        sync are still found.
+        """
+        self.cell_size = cell_size
+        self.slack = slack
+        self.cells = {}
+        self.ranges = {} #Sprite to the cell range it is bucketed under.
+        self.order = {} #Sprite to a counter giving insertion order.
+        self.count = 0
+        for sprite in sprites:
+            self.add(sprite)
+
+    def __contains__(self, sprite):
+        return sprite in self.ranges
+
+    def __len__(self):
+        return len(self.ranges)
+
+    def get_range(self, rect, slack=0):
+        """Return the (left, top, right, bottom) cells that rect overlaps."""
+        width, height = self.cell_size
+        return (rect.left//width-slack, rect.top//height-slack,
+                max(rect.right-1, rect.left)//width+slack,
+                max(rect.bottom-1, rect.top)//height+slack)
+
+    def get_cells(self, cell_range):
+        """Yield the keys of all cells in cell_range."""
+        left, top, right, bottom = cell_range
+        for i in range(left, right+1):
+            for j in range(top, bottom+1):
+                yield (i, j)
+
+    def add(self, sprite):
+        """Add a sprite to the buckets its rect currently overlaps."""
+        cell_range = self.get_range(sprite.rect)
+        self.ranges[sprite] = cell_range
+        self.order[sprite] = self.count
+        self.count += 1
+        for cell in self.get_cells(cell_range):
+            self.cells.setdefault(cell, []).append(sprite)
+
+    def remove(self, sprite):
+        """Remove a sprite from the grid."""
+        for cell in self.get_cells(self.ranges.pop(sprite)):
+            bucket = self.cells[cell]
+            bucket.remove(sprite)
+            if not bucket:
+                del self.cells[cell]
+        del self.order[sprite]
+
+    def move(self, sprite):
+        """
+        Rebucket a sprite whose rect may have changed.  Nothing is done if
+        it still overlaps the same cells.
+        """
+        if self.get_range(sprite.rect) != self.ranges[sprite]:
+            order = self.order[sprite]
+            self.remove(sprite)
+            self.add(sprite)
+            self.order[sprite] = order
+
+    def sync(self, sprites):
+        """
+        Make the grid contain exactly the sprites passed, with each in the
+        buckets its current rect overlaps.
+        """
+        current = set(sprites)
+        for sprite in list(self.ranges):
+            if sprite not in current:
+                self.remove(sprite)
+        for sprite in sprites:
+            if sprite in self.ranges:
+                self.move(sprite)
+            else:
+                self.add(sprite)
+
+    def query(self, rect, within=None):
+        """
+        Return a list of the sprites whose rects collide with rect.  If a
+        group is passed as within, only sprites in that group are returned.
+        """
+        found = set()
+        for cell in self.get_cells(self.get_range(rect, self.slack)):
+            found.update(self.cells.get(cell, ()))
+        hits = [sprite for sprite in found if rect.colliderect(sprite.rect)]
+        if within is not None:
+            hits = [sprite for sprite in hits if sprite in within]
+        return sorted(hits, key=self.order.__getitem__)
+
+    def collide(self, sprite, callback=None, within=None):
+        """
+        The equivalent of pg.sprite.spritecollide (without dokill) for the
+        sprites in the grid.
+        """
+        hits = self.query(sprite.rect, within)
+        if callback:
+            hits = [hit for hit in hits if callback(sprite, hit)]
+        return hits
+
+    def collideany(self, sprite, within=None):
+        """
+        The equivalent of pg.sprite.spritecollideany for the sprites in the
+        grid.  Returns the first colliding sprite or None.
+        """
+        hits = self.query(sprite.rect, within)
+        return hits[0] if hits else None
+
+
+def collideany(sprite, obstacles):
+    """
+    Return the first sprite in obstacles that collides with sprite.
+    The obstacles may be either a SpatialGrid or a regular sprite group.
+    """
+    if isinstance(obstacles, SpatialGrid):
+        return obstacles.collideany(sprite)
+    return pg.sprite.spritecollideany(sprite, obstacles)
+
+
+class OccupancyGrid(object):
+    """
+    A flat array with one entry per cell of the play area counting the
+    obstacles that overlap that cell.  Looking up whether a cell is free is
+    a single index, which makes it suitable for AI that only needs to know
+    about neighbouring cells.  Cells outside the play area are treated as
+    blocked, which takes the place of the border rects.
+    """
+    def __init__(self, sprites=(), area=prepare.PLAY_RECT,
+                 cell_size=prepare.CELL_SIZE):
+        self.cell_size = cell_size
+        self.columns = area.w//cell_size[0]
+        self.rows = area.h//cell_size[1]
+        self.origin = area.topleft
+        self.cells = bytearray(self.columns*self.rows)
+        for sprite in sprites:
+            self.block(sprite.rect)
+
+    def get_range(self, rect):
+        """Return the (left, top, right, bottom) cells that rect overlaps."""
+        width, height = self.cell_size
+        x, y = rect.left-self.origin[0], rect.top-self.origin[1]
+        return (x//width, y//height,
+                (x+max(rect.width, 1)-1)//width,
+                (y+max(rect.height, 1)-1)//height)
+
+    def get_indices(self, rect):
+        """
+        Return the array indices of the cells that rect overlaps, or None if
+        any part of rect lies outside the grid.
+        """
+        left, top, right, bottom = self.get_range(rect)
+        if left < 0 or top < 0 or right >= self.columns or bottom >= self.rows:
+            return None
+        return [j*self.columns+i for j in range(top, bottom+1)
+                                 for i in range(left, right+1)]
+
+    def block(self, rect):
+        """Add one obstacle to each of the cells that rect overlaps."""
+        for index in self.get_indices(rect) or ():
+            self.cells[index] = min(self.cells[index]+1, 255)
+
+    def unblock(self, rect):
+        """Remove one obstacle from each of the cells that rect overlaps."""
+        for index in self.get_indices(rect) or ():
+            self.cells[index] = max(self.cells[index]-1, 0)
+
+    def is_free(self, rect):
+        """
+        Return True if rect lies entirely within the grid and overlaps no
+        obstacles.  For a cell aligned rect this is a single lookup.
+        """
+        left, top, right, bottom = self.get_range(rect)
+        if left < 0 or top < 0 or right >= self.columns or bottom >= self.rows:
+            return False
+        if left == right and top == bottom:
+            return not self.cells[top*self.columns+left]
+        return not any(self.cells[j*self.columns+i]
+                       for j in range(top, bottom+1)
+                       for i in range(left, right+1))
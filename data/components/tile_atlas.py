@@ -0,0 +1,59 @@
+"""
+Contains the process wide atlas of map tile images and collision masks.
+
+Maps are built from a small number of distinct tiles repeated many times.
+Rather than every Tile slicing its own subsurface and building its own mask,
+tiles are requested from ATLAS by (sheet, source) and share one image and one
+mask.  Shared masks must never be modified; a sprite that needs a different
+mask must make its own.
+"""
+
+import pygame as pg
+
+from .. import prepare
+
+
+class TileAtlas(object):
+    """A cache of tile images and masks keyed by (sheet, source)."""
+    def __init__(self, size=prepare.CELL_SIZE):
+        self.size = size
+        self.images = {}
+        self.masks = {}
+        self.solid_mask = pg.Mask(self.size)
+        self.solid_mask.fill()
+        self.requests = 0
+
+    def get_image(self, sheet, source):
+        """Return the shared image for the tile at source on sheet."""
+        self.requests += 1
+        key = (sheet, tuple(source))
+        if key not in self.images:
+            sheet_image = prepare.GFX["mapsheets"][sheet]
+            rect = pg.Rect(source, self.size)
+            self.images[key] = sheet_image.subsurface(rect)
+        return self.images[key]
+
+    def get_mask(self, sheet, source):
+        """Return the shared collision mask for the tile at source on sheet."""
+        key = (sheet, tuple(source))
+        if key not in self.masks:
+            image = self.get_image(sheet, source)
+            self.masks[key] = pg.mask.from_surface(image)
+        return self.masks[key]
+
+    def get_frames(self, sheet, start, frames):
+        """
+        Return a list of shared images for a horizontal strip of frames
+        beginning at start (used for animated tiles).
+        """
+        return [self.get_image(sheet, (start[0]+self.size[0]*i, start[1]))
+                for i in range(frames)]
+
+    def stats(self):
+        """Return counts of stored images and masks and total requests."""
+        return {"images" : len(self.images),
+                "masks" : len(self.masks),
+                "requests" : self.requests}
+
+
+ATLAS = TileAtlas()
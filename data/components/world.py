@@ -1,18 +1,13 @@
 import os
-import sys
 import pygame as pg
 
-from .. import prepare, tools
-from . import level
+from .. import prepare, tools, serialization, autosave
+from . import level, level_cache, prefetch
 
 
-if sys.version_info[0] < 3:
-    import yaml
-else:
-    import yaml3 as yaml
-
-
-MAX_HISTORY = 3
+LEVEL_CACHE_BUDGET = 24*1024**2 #Bytes. About 7 of the desert maps.
+FREEZE_EVICTED_LEVELS = False #If True, evicted maps don't respawn.
+FROZEN_LEVEL_LIMIT = 32 #Most evicted maps whose state is kept.
 OFFSCREEN_THRESHOLD = 25 #Amount player can be offscreen before map scrolls.
 SCROLL_SPEED = 20.0
 
@@ -31,7 +26,12 @@ class WorldMap(object):
         self.player = player
         self.name = self.player.world
         self.world_dict = self.load(self.name)
-        self.history = []
+        self.history = level_cache.LevelCache(LEVEL_CACHE_BUDGET,
+                                              FREEZE_EVICTED_LEVELS,
+                                              FROZEN_LEVEL_LIMIT)
+        self.prefetcher = prefetch.MapPrefetcher()
+        self.staged = {} #Prebuilt Levels for neighbouring maps.
+        self.building = None #A Level being staged a stage per update.
         self.scrolling = False
         self.screen_copy = None
         self.next_screen = pg.Surface(prepare.PLAY_RECT.size).convert()
@@ -41,6 +41,7 @@ class WorldMap(object):
         self.current_coords = list(start_coords)
         self.offset = [0, 0]
         self.drawn_this_frame = False #Disallow multiple updates per frame.
+        self.prefetch_neighbors()
 
     def load(self, world_name):
         """Load world given a world_name."""
@@ -55,23 +56,81 @@ class WorldMap(object):
                 (5,6) : "desert_south.map"}
 ##        path = os.path.join(".", "resources", "map_data", world_name)
 ##        with open(path) as myfile:
-##            return yaml.load(myfile)
+##            return serialization.load(myfile)
 
     def update_history(self, next_map_name):
         """
         Check to see if the current map is saved in history.  If it is
-        found, use the old map (don't respawn monsters etc.).  If not, create a
-        new map and place it in history.  Remove older maps if MAX_HISTORY is
-        exceeded."""
-        try:
-            index = [mapp.name for mapp in self.history].index(next_map_name)
-            next_map = self.history.pop(index)
-        except ValueError:
-            next_map = level.Level(self.player, next_map_name)
-        if len(self.history) == MAX_HISTORY:
-            del self.history[-1]
-        self.history.insert(0, next_map)
-        return self.history[0]
+        found, use the old map (don't respawn monsters etc.).  If not, use the
+        staged Level if the prefetcher got to it in time (finishing it if it
+        is still being built), or else create a new map.  Maps that were
+        evicted from history in freeze mode have their saved state restored.
+        The new map is added to history, which evicts the least recently used
+        maps if over budget.
+        """
+        next_map = self.history.get(next_map_name)
+        if next_map is None:
+            next_map = self.staged.pop(next_map_name, None)
+            if next_map is None and self.building and (
+                    self.building.name == next_map_name):
+                next_map, self.building = self.building, None
+                next_map.finish_building()
+            self.prefetcher.record(next_map is not None)
+            if not next_map:
+                map_dict = self.prefetcher.take(next_map_name)
+                next_map = level.Level(self.player, next_map_name, map_dict)
+            frozen = self.history.pop_frozen(next_map_name)
+            if frozen:
+                next_map.thaw(frozen)
+        self.history.add(next_map)
+        return next_map
+
+    def get_neighbors(self):
+        """Return the names of the maps adjacent to the current map."""
+        neighbors = []
+        for vector in prepare.DIRECT_DICT.values():
+            coords = (self.current_coords[0]+vector[0],
+                      self.current_coords[1]+vector[1])
+            if coords in self.world_dict:
+                neighbors.append(self.world_dict[coords])
+        return neighbors
+
+    def prefetch_neighbors(self):
+        """
+        Ask the prefetcher to load the maps around the current map that are
+        not already in history or staged.  Staged Levels (built or not) that
+        are no longer adjacent are dropped.
+        """
+        neighbors = self.get_neighbors()
+        for name in set(self.staged)-set(neighbors):
+            self.staged.pop(name).discard()
+        if self.building and self.building.name not in neighbors:
+            self.building.discard()
+            self.building = None
+        building = self.building.name if self.building else None
+        needed = [name for name in neighbors if name not in self.history and
+                  name not in self.staged and name != building]
+        self.prefetcher.request(needed)
+
+    def stage_level(self):
+        """
+        Run one stage (see Level.build) of the Level being built for a
+        neighboring map, starting on the next map whose data the prefetcher
+        has finished loading if none is.  Called every update while not
+        scrolling so that the cost is spread over many updates before the
+        player reaches an edge.
+        """
+        if not self.building:
+            for name in self.get_neighbors():
+                if name not in self.staged:
+                    map_dict = self.prefetcher.take(name)
+                    if map_dict:
+                        self.building = level.Level(self.player, name,
+                                                    map_dict, True)
+                        break
+        if self.building and self.building.build_step():
+            self.staged[self.building.name] = self.building
+            self.building = None
 
     def check_change_map(self):
         """
@@ -96,6 +155,8 @@ class WorldMap(object):
             self.level.on_map_change()
             self.level = self.update_history(next_map)
             self.scrolling = True
+            self.prefetch_neighbors()
+            autosave.AUTOSAVER.trigger("map change")
 
     def update(self, now):
         """
@@ -107,6 +168,8 @@ class WorldMap(object):
         else:
             self.level.update(now)
             self.check_change_map()
+            if not self.scrolling:
+                self.stage_level()
 
     def prepare_scroll(self):
         """
@@ -185,3 +248,15 @@ class WorldMap(object):
         elif not self.scrolling:
             self.level.draw(surface, interpolate)
         self.drawn_this_frame = True
+
+    def draw_dirty(self, surface, interpolate):
+        """
+        Draw only the changed areas of the level and return the list of
+        rects that need updating.  While scrolling a normal draw is performed
+        instead; the copy of the previous screen covers the whole display.
+        """
+        if self.scrolling:
+            self.draw(surface, interpolate)
+            return [prepare.SCREEN_RECT.copy()]
+        self.drawn_this_frame = True
+        return self.level.draw_dirty(surface, interpolate)
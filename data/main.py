@@ -6,14 +6,40 @@ All modifications should occur in this module
 and in the prepare module.
 """
 
-from . import prepare, tools
-from .states import title, splash, select, register, viewcontrols, game, camp
+import argparse
 
+from . import (prepare, tools, autosave, sprite_profiler, replay,
+               save_store, asset_loader)
+from .states import (loading, title, splash, select, register,
+                     viewcontrols, game, camp)
 
-def main():
+
+def parse_args(argv=None):
+    """
+    Parse the command line.  The --headless option is acted on by the
+    cabbages.py launcher before pygame is imported.
+    """
+    parser = argparse.ArgumentParser(description="The Cabbages")
+    sessions = parser.add_mutually_exclusive_group()
+    sessions.add_argument("--record", metavar="PATH",
+                          help="record the session to PATH")
+    sessions.add_argument("--replay", metavar="PATH",
+                          help="replay the session recorded in PATH")
+    parser.add_argument("--seed", type=int,
+                        help="random seed of a recording (default: time)")
+    parser.add_argument("--unpaced", action="store_true",
+                        help="replay as fast as possible")
+    parser.add_argument("--headless", action="store_true",
+                        help="run without a window (dummy SDL drivers)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
     """Add states to control here."""
+    args = parse_args(argv)
     app = tools.Control(prepare.ORIGINAL_CAPTION)
-    state_dict = {"SPLASH"   : splash.Splash(),
+    state_dict = {"LOADING"  : loading.Loading(),
+                  "SPLASH"   : splash.Splash(),
                   "TITLE"    : title.Title(),
                   "SELECT"   : select.Select(),
                   "REGISTER" : register.Register(),
@@ -22,4 +48,27 @@ def main():
                   "CAMP"     : camp.Camp()
                   }
     app.state_machine.setup_states(state_dict, "SPLASH")
-    app.main()
+    asset_loader.start_background(list(prepare.GFX.values())+[prepare.SFX])
+    replayer = None
+    if args.replay:
+        try:
+            replayer = replay.Replayer(args.replay, not args.unpaced)
+        except replay.ReplayError as error:
+            print(error)
+            return
+        #Saves made during a replay go to a copy of the recorded slots.
+        autosave.AUTOSAVER.store = replayer.make_store(save_store.SaveStore)
+    try:
+        if replayer:
+            app.replay(replayer)
+        elif args.record:
+            slots = autosave.AUTOSAVER.get_slots()
+            app.record(replay.Recorder(args.record, args.seed, slots))
+        else:
+            app.main()
+        autosave.AUTOSAVER.flush()
+    finally:
+        if replayer:
+            replayer.remove_store()
+    if sprite_profiler.PROFILER.passes["update"]:
+        print(sprite_profiler.PROFILER.format_report())
@@ -0,0 +1,149 @@
+"""
+A benchmark of the YAML map loaders.
+
+Every map in resources/map_data is parsed repeatedly from memory with both
+the full YAML Loader and the MapLoader fast path, and the median time of
+each is reported.  The data produced by the two loaders is checked to be
+identical, both for the maps and for a few small documents that have
+tripped the fast path before.  Neither pygame nor a display is needed.
+
+Run from the top level directory with: python -m data.map_benchmark
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+from . import serialization
+
+
+if sys.version_info[0] < 3:
+    import yaml
+else:
+    import yaml3 as yaml
+
+
+MAP_DIRECTORY = os.path.join(".", "resources", "map_data")
+MAP_EXTENSION = ".map"
+
+get_time = getattr(time, "perf_counter", time.time)
+
+#Documents the fast path must either load exactly as the full Loader does
+#or hand over to it.
+EQUIVALENCE_CASES = [
+    "a:\n- Solid/Fore: [677]\n- x\n",
+    "a:\n- b: c\n  d: [1, 2]\n",
+    "a: b: c\n",
+    ]
+
+
+def median(values):
+    ordered = sorted(values)
+    middle = len(ordered)//2
+    if len(ordered)%2:
+        return ordered[middle]
+    return (ordered[middle-1]+ordered[middle])/2.0
+
+
+def time_load(text, loader, repeat):
+    """
+    Return the data loaded from text with the given Loader class, the
+    loader instance used last and the median time taken in milliseconds.
+    """
+    times = []
+    for _ in range(repeat):
+        start = get_time()
+        instance = loader(text)
+        try:
+            data = instance.get_single_data()
+        finally:
+            instance.dispose()
+        times.append(1000.0*(get_time()-start))
+    return data, instance, median(times)
+
+
+def benchmark_map(path, repeat):
+    """Time both loaders on the map at path and return a result dict."""
+    with open(path) as map_file:
+        text = map_file.read()
+    full_data, _, full_time = time_load(text, yaml.Loader, repeat)
+    fast_data, loader, fast_time = time_load(text, yaml.MapLoader, repeat)
+    return {"map" : os.path.basename(path),
+            "bytes" : len(text),
+            "full_ms" : full_time,
+            "fast_ms" : fast_time,
+            "fallback" : loader.used_fallback,
+            "identical" : repr(fast_data) == repr(full_data)}
+
+
+def run_benchmark(directory=MAP_DIRECTORY, repeat=20):
+    """Benchmark every map file in directory."""
+    names = sorted(name for name in os.listdir(directory)
+                   if name.endswith(MAP_EXTENSION))
+    return [benchmark_map(os.path.join(directory, name), repeat)
+            for name in names]
+
+
+def check_equivalence(cases=EQUIVALENCE_CASES):
+    """Return the cases for which the two loaders give different data."""
+    differing = []
+    for text in cases:
+        try:
+            full = repr(yaml.load(text, Loader=yaml.Loader))
+        except yaml.YAMLError as error:
+            full = repr(type(error))
+        try:
+            fast = repr(yaml.load(text, Loader=yaml.MapLoader))
+        except yaml.YAMLError as error:
+            fast = repr(type(error))
+        if fast != full:
+            differing.append(text)
+    return differing
+
+
+def format_report(results):
+    """Return a printable table of the results of run_benchmark."""
+    lines = ["YAML backend: {}".format(serialization.get_backend()),
+             "{:<24}{:>8}{:>11}{:>11}{:>9}  {}".format(
+             "map", "KB", "full (ms)", "fast (ms)", "speedup", "notes")]
+    for result in results:
+        notes = []
+        if result["fallback"]:
+            notes.append("fallback")
+        if not result["identical"]:
+            notes.append("DATA DIFFERS")
+        lines.append("{:<24}{:>8.1f}{:>11.3f}{:>11.3f}{:>8.1f}x  {}".format(
+                     result["map"], result["bytes"]/1024.0,
+                     result["full_ms"], result["fast_ms"],
+                     result["full_ms"]/max(result["fast_ms"], 1e-9),
+                     " ".join(notes)))
+    full = sum(result["full_ms"] for result in results)
+    fast = sum(result["fast_ms"] for result in results)
+    lines.append("{:<32}{:>11.3f}{:>11.3f}{:>8.1f}x".format(
+                 "total", full, fast, full/max(fast, 1e-9)))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """Parse command line arguments, run the benchmark and report."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--directory", default=MAP_DIRECTORY)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", help="also write the results to this path")
+    args = parser.parse_args(argv)
+    results = run_benchmark(args.directory, max(args.repeat, 1))
+    differing = check_equivalence()
+    print(format_report(results))
+    for text in differing:
+        print("DATA DIFFERS for {!r}".format(text))
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=2, sort_keys=True)
+    if differing or not all(result["identical"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,18 +3,12 @@ The state for editing the individual maps.
 """
 
 import os
-import sys
 import wx
 import pygame as pg
 
-from .. import map_prepare, state_machine
+from .. import map_prepare, state_machine, serialization
 from ..map_components import toolbar, panel, modes
 
-if sys.version_info[0] < 3:
-    import yaml
-else:
-    import yaml3 as yaml
-
 
 BACKGROUND_COLOR = (30, 40, 50)
 
@@ -95,7 +89,7 @@ class Edit(state_machine._State):
         if path:
             try:
                 with open(path,"w") as myfile:
-                    yaml.dump(self.map_state.map_dict, myfile)
+                    serialization.dump(self.map_state.map_dict, myfile)
                     print("Map saved.")
             except IOError:
                 print("Invalid filename.")
@@ -115,7 +109,8 @@ class Edit(state_machine._State):
         if path:
             try:
                 with open(path) as myfile:
-                    self.map_state.map_dict.update(yaml.load(myfile))
+                    map_data = serialization.load_map(myfile)
+                    self.map_state.map_dict.update(map_data)
                     print("Map loaded.\n")
             except IOError:
                 print("File not found.")
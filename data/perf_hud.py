@@ -0,0 +1,230 @@
+"""
+Contains the performance overlay toggled with F5.
+
+Control marks the end of each phase of a frame (handling events, the fixed
+step updates, the state's draw and the display update) with PerfHUD.lap.
+The last HISTORY frames are kept whether or not the overlay is shown, so the
+graph is already full when it is turned on.  The graph is a stacked bar per
+frame, one colour per phase, with a line at the frame budget and a tick
+above frames that needed more than one update step to catch up.  The text
+(averages and maxima per phase, update steps, and the sprite, enemy and
+projectile counts of the current Level) is only rerendered every
+TEXT_INTERVAL milliseconds.  While the sprite profiler is enabled the
+PROFILE_ROWS most expensive sprite classes since the last rerender are
+listed as well.
+
+This module is imported by tools, so it must not import prepare.
+"""
+
+import os
+import time
+import pygame as pg
+
+from collections import deque
+
+from . import sprite_profiler
+
+
+PHASES = ("events", "update", "draw", "display")
+PHASE_COLORS = {"events" : (230, 200, 60),
+                "update" : (90, 200, 90),
+                "draw" : (80, 150, 240),
+                "display" : (200, 90, 200)}
+HISTORY = 180 #Frames.
+BUDGET = 1000.0/60 #Milliseconds.
+
+FONT_PATH = os.path.join("resources", "fonts", "Fixedsys500c.ttf")
+FONT_SIZE = 16
+TEXT_INTERVAL = 250 #Milliseconds between rerendering the text.
+
+#Placement and sizes.
+TOPLEFT = (8, 8)
+BAR_WIDTH = 2
+GRAPH_HEIGHT = 64
+GRAPH_SCALE = 2.0 #Pixels per millisecond.
+MARGIN = 6
+LINE_SPACER = 16
+TEXT_LINES = 7
+PROFILE_ROWS = 6
+BACKGROUND = (10, 10, 20)
+BUDGET_COLOR = (220, 60, 60)
+CATCH_UP_COLOR = (255, 120, 40)
+TEXT_COLOR = (235, 235, 235)
+
+get_time = getattr(time, "perf_counter", time.time)
+
+
+def get_level_counts(state):
+    """
+    Return (sprites, enemies, projectiles) for the Level of a state with a
+    world (the Game state), or None for any other state.
+    """
+    level = getattr(getattr(state, "world", None), "level", None)
+    if level is None:
+        return None
+    return len(level.all_group), len(level.enemies), len(level.projectiles)
+
+
+class PerfHUD(object):
+    """
+    Rolling frame phase times and the overlay that shows them.  Surfaces
+    and the font are created on the first draw.
+    """
+    def __init__(self, history=HISTORY):
+        self.visible = False
+        self.history = history
+        self.times = {phase:deque(maxlen=history) for phase in PHASES}
+        self.steps = deque(maxlen=history)
+        self.current = {phase:0.0 for phase in PHASES}
+        self.stamp = get_time()
+        self.font = None
+        self.image = None
+        self.graph = None
+        self.text = None
+        self.text_time = None
+        self.profile = None #The sprite profiler snapshot at the last render.
+        width = history*BAR_WIDTH+2*MARGIN
+        height = GRAPH_HEIGHT+3*MARGIN+TEXT_LINES*LINE_SPACER
+        self.rect = pg.Rect(TOPLEFT, (width, height))
+        self.base_height = height
+
+    def toggle(self):
+        """
+        Show or hide the overlay.  The overlay only grows while shown (as
+        a state drawing dirty rects would not clear the difference), so its
+        size is reset here.
+        """
+        self.visible = not self.visible
+        self.text_time = None
+        self.rect.h = self.base_height
+        self.image = None
+
+    def begin_frame(self):
+        """Start timing a new frame."""
+        for phase in PHASES:
+            self.current[phase] = 0.0
+        self.stamp = get_time()
+
+    def lap(self, phase=None):
+        """
+        Add the time since the last lap to phase; with no phase the time is
+        discarded (used to leave the overlay's own drawing out).
+        """
+        now = get_time()
+        if phase:
+            self.current[phase] += 1000.0*(now-self.stamp)
+        self.stamp = now
+
+    def end_frame(self, steps):
+        """Store the finished frame, which ran steps fixed step updates."""
+        for phase in PHASES:
+            self.times[phase].append(self.current[phase])
+        self.steps.append(steps)
+        if self.graph:
+            self.add_bar(len(self.steps)-1)
+
+    def draw(self, surface, state, now, fps):
+        """
+        Draw the overlay to surface and return the rect it covers.  The
+        state is the current state and fps the measured frame rate.
+        """
+        if self.image is None:
+            self.setup()
+        if self.text_time is None or now-self.text_time >= TEXT_INTERVAL:
+            self.text = self.render_text(state, fps)
+            self.text_time = now
+            height = GRAPH_HEIGHT+3*MARGIN+self.text.get_height()
+            if height > self.rect.h:
+                self.rect.h = height
+                self.image = pg.Surface(self.rect.size).convert()
+        self.image.fill(BACKGROUND)
+        self.image.blit(self.graph, (MARGIN, MARGIN))
+        budget_y = MARGIN+GRAPH_HEIGHT-int(BUDGET*GRAPH_SCALE)
+        pg.draw.line(self.image, BUDGET_COLOR, (MARGIN, budget_y),
+                     (self.rect.w-MARGIN-1, budget_y))
+        self.image.blit(self.text, (MARGIN, GRAPH_HEIGHT+2*MARGIN))
+        return surface.blit(self.image, self.rect)
+
+    def setup(self):
+        """Create the font and surfaces and draw the stored history."""
+        self.font = pg.font.Font(FONT_PATH, FONT_SIZE)
+        self.image = pg.Surface(self.rect.size).convert()
+        graph_size = (self.history*BAR_WIDTH, GRAPH_HEIGHT)
+        self.graph = pg.Surface(graph_size).convert()
+        self.graph.fill(BACKGROUND)
+        for index in range(len(self.steps)):
+            self.add_bar(index)
+
+    def add_bar(self, index):
+        """
+        Scroll the graph left by one bar and draw the bar of the frame at
+        index in the history at its right edge.
+        """
+        self.graph.scroll(-BAR_WIDTH, 0)
+        x = self.graph.get_width()-BAR_WIDTH
+        self.graph.fill(BACKGROUND, (x, 0, BAR_WIDTH, GRAPH_HEIGHT))
+        bottom = GRAPH_HEIGHT
+        for phase in PHASES:
+            height = int(round(self.times[phase][index]*GRAPH_SCALE))
+            height = min(height, bottom)
+            if height:
+                bottom -= height
+                bar = (x, bottom, BAR_WIDTH, height)
+                self.graph.fill(PHASE_COLORS[phase], bar)
+        if self.steps[index] > 1:
+            self.graph.fill(CATCH_UP_COLOR, (x, 0, BAR_WIDTH, 3))
+
+    def get_lines(self, state, fps):
+        """Return the lines of text as (text, color) tuples."""
+        frames = len(self.steps)
+        totals = [sum(times) for times in zip(*self.times.values())]
+        average = sum(totals)/frames if frames else 0.0
+        lines = [("{:.1f} FPS  work {:.1f} avg {:.1f} max ms".format(
+                  fps, average, max(totals or [0.0])), TEXT_COLOR)]
+        for phase in PHASES:
+            times = self.times[phase]
+            mean = sum(times)/frames if frames else 0.0
+            lines.append(("{:<8}{:>7.2f} avg {:>6.2f} max".format(
+                          phase, mean, max(times or [0.0])),
+                          PHASE_COLORS[phase]))
+        steps = self.steps
+        catch_up = sum(1 for step in steps if step > 1)
+        lines.append(("steps {:.2f} avg {} max  {} catch-up".format(
+                      sum(steps)/float(frames) if frames else 0.0,
+                      max(steps or [0]), catch_up), CATCH_UP_COLOR))
+        counts = get_level_counts(state)
+        if counts:
+            text = "sprites {}  enemies {}  projectiles {}".format(*counts)
+            lines.append((text, TEXT_COLOR))
+        lines.extend(self.get_profile_lines())
+        return lines
+
+    def get_profile_lines(self):
+        """
+        Return lines for the sprite classes that cost the most since the
+        last call, in milliseconds per update and per draw.
+        """
+        profiler = sprite_profiler.PROFILER
+        if not profiler.enabled:
+            self.profile = None
+            return []
+        snapshot = profiler.snapshot()
+        rows = profiler.get_rows(snapshot, self.profile)[:PROFILE_ROWS]
+        self.profile = snapshot
+        lines = [("{:<15}{:>7}{:>7}{:>6}".format("sprite ms", "update",
+                                                 "draw", "count"),
+                  TEXT_COLOR)]
+        for name, update, draw, count in rows:
+            lines.append(("{:<15.15}{:>7.3f}{:>7.3f}{:>6.0f}".format(
+                          name, update, draw, count), TEXT_COLOR))
+        return lines
+
+    def render_text(self, state, fps):
+        """Render the text lines to a single surface."""
+        lines = self.get_lines(state, fps)
+        size = (self.rect.w-2*MARGIN, max(len(lines), 1)*LINE_SPACER)
+        image = pg.Surface(size).convert()
+        image.fill(BACKGROUND)
+        for i,(text, color) in enumerate(lines):
+            image.blit(self.font.render(text, 0, color), (0, i*LINE_SPACER))
+        return image
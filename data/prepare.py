@@ -6,7 +6,7 @@ Also contained are various constants used throughout the program.
 import os
 import pygame as pg
 
-from . import tools
+from . import tools, surface_cache
 
 
 pg.init()
@@ -85,22 +85,31 @@ Z_ORDER = {"BG Tiles" : -4,
            "Foreground" : 800,
            "Projectiles" : 850}
 
+#If True, converted graphics are cached on disk for faster loading.
+USE_SURFACE_CACHE = True
+
 #Resource loading (Fonts and music just contain path names).
 SAVE_PATH = os.path.join("resources", "save_data", "save_data.dat")
 FONTS = tools.load_all_fonts(os.path.join("resources", "fonts"))
 MUSIC = tools.load_all_music(os.path.join("resources", "music"))
-SFX   = tools.load_all_sfx(os.path.join("resources", "sound"))
+SFX   = tools.lazy_load_sfx(os.path.join("resources", "sound"))
 
 
 def graphics_from_directories(directories):
     """
-    Calls the tools.load_all_graphics() function for all directories passed.
+    Calls the tools.lazy_load_gfx() function for all directories passed.
+    No graphics are actually loaded until they are first used.  If
+    USE_SURFACE_CACHE is True they are loaded through surface_cache.
     """
     base_path = os.path.join("resources", "graphics")
+    stages = {}
+    if USE_SURFACE_CACHE:
+        stages = {"decode" : surface_cache.decode_gfx,
+                  "finish" : surface_cache.finish_gfx}
     GFX = {}
     for directory in directories:
         path = os.path.join(base_path, directory)
-        GFX[directory] = tools.load_all_gfx(path)
+        GFX[directory] = tools.lazy_load_gfx(path, **stages)
     return GFX
 
 
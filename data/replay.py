@@ -0,0 +1,340 @@
+"""
+Contains the game's random number generator and clock, and the recording
+and replaying of play sessions.
+
+Everything that affects gameplay draws random numbers from RNG and reads
+the time from CLOCK.get_ticks rather than from the random module and
+pg.time.get_ticks.  Outside of a session CLOCK simply returns
+pg.time.get_ticks, so nothing changes.
+
+A Recorder seeds RNG (and the random module, used for cosmetic effects),
+snapshots the save slots and then stores every frame the Control runs: the
+key events handled, the time given to each fixed step update and the
+interpolation the frame was drawn with.  Drawing is part of the record
+because interpolated rects decide the draw order of the main sprites, and
+with it the order they update in.  While a session runs, DETERMINISTIC is
+True.  Background work that gameplay waits on (the LOADING state, map
+prefetching) then finishes synchronously, so it can't finish on different
+frames.  Every FINGERPRINT_INTERVAL updates a fingerprint of the game state
+is stored.
+
+A Replayer feeds a recording back through the same Control, window or no
+window (SDL's dummy drivers), paced at the recorded frame rate or as fast
+as possible.  Live input is ignored apart from quitting and the debug keys.
+Saves go to a temporary copy of the recorded slots.  The fingerprints are
+checked as it goes, and the result is reported with the time taken per
+frame phase.  Two builds can then be compared on identical gameplay.
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import shutil
+import tempfile
+import pygame as pg
+
+from . import serialization
+
+
+FORMAT_VERSION = 2
+FINGERPRINT_INTERVAL = 60 #Updates.
+RECORDED_EVENTS = (pg.KEYDOWN, pg.KEYUP)
+EVENT_FIELDS = ("key", "mod", "unicode", "scancode")
+DEBUG_KEYS = (pg.K_F4, pg.K_F5, pg.K_F7, pg.K_F8, pg.K_F9)
+
+#True while a session is recording or replaying; see the module docstring.
+DETERMINISTIC = False
+
+RNG = random.Random()
+
+get_time = getattr(time, "perf_counter", time.time)
+
+
+class ReplayError(Exception):
+    """Raised if a recording can not be read."""
+    pass
+
+
+class VirtualClock(object):
+    """
+    The time in milliseconds as seen by gameplay code.  While now is None
+    it is the real time.
+    """
+    def __init__(self):
+        self.now = None
+
+    def get_ticks(self):
+        if self.now is None:
+            return pg.time.get_ticks()
+        return self.now
+
+
+CLOCK = VirtualClock()
+
+
+class KeyState(object):
+    """
+    Stands in for pg.key.get_pressed() during a replay, tracking the
+    recorded key events.
+    """
+    def __init__(self):
+        self.pressed = set()
+
+    def __getitem__(self, key):
+        return key in self.pressed
+
+    def handle(self, event):
+        if event.type == pg.KEYDOWN:
+            self.pressed.add(event.key)
+        elif event.type == pg.KEYUP:
+            self.pressed.discard(event.key)
+
+
+def fingerprint(control):
+    """
+    Return a checksum of the parts of the game state a divergence would
+    show up in: the state, the player, the level's enemies and RNG.
+    """
+    state = control.state_machine.state
+    parts = [control.state_machine.state_name, RNG.getstate()]
+    player = getattr(state, "player", None)
+    if player is not None and not isinstance(player, str):
+        parts.append((getattr(player, "exact_position", None),
+                      getattr(player, "health", None),
+                      getattr(player, "action_state", None)))
+    level = getattr(getattr(state, "world", None), "level", None)
+    if level is not None:
+        enemies = sorted((enemy.__class__.__name__, tuple(enemy.rect))
+                         for enemy in level.enemies)
+        parts.append((level.name, enemies))
+    return zlib.crc32(repr(parts).encode("utf-8"))&0xffffffff
+
+
+def encode_event(event):
+    """Return a recorded event as a list of [type, {field : value}]."""
+    fields = {field:getattr(event, field) for field in EVENT_FIELDS
+              if hasattr(event, field)}
+    return [event.type, fields]
+
+
+def decode_event(data):
+    event_type, fields = data
+    return pg.event.Event(event_type, **fields)
+
+
+def start_session(seed):
+    """Seed the random number generators and turn on DETERMINISTIC."""
+    global DETERMINISTIC
+    DETERMINISTIC = True
+    RNG.seed(seed)
+    random.seed(seed)
+
+
+def end_session():
+    global DETERMINISTIC
+    DETERMINISTIC = False
+    CLOCK.now = None
+
+
+class Recorder(object):
+    """
+    Records the frames run by a Control.  Attach it with
+    Control.start_session and write it out with save.
+    """
+    def __init__(self, path, seed=None, slots=None):
+        self.path = path
+        self.seed = int(time.time()) if seed is None else seed
+        self.slots = slots
+        self.frames = []
+        self.events = []
+        self.times = []
+        self.updates = 0
+        self.fingerprints = {}
+
+    def start(self, control):
+        start_session(self.seed)
+
+    def add_event(self, event):
+        """Record an event handled by the Control this frame."""
+        if event.type in RECORDED_EVENTS:
+            self.events.append(encode_event(event))
+
+    def get_now(self, now):
+        """Record and return the time given to an update."""
+        self.times.append(now)
+        CLOCK.now = now
+        return now
+
+    def end_update(self, control):
+        self.updates += 1
+        if not self.updates%FINGERPRINT_INTERVAL:
+            self.fingerprints[self.updates] = fingerprint(control)
+
+    def end_frame(self, interpolate):
+        self.frames.append([self.events, self.times, interpolate])
+        self.events = []
+        self.times = []
+
+    def finish(self, control):
+        """Stop recording and write the recording out."""
+        end_session()
+        self.save()
+
+    def dump_slots(self):
+        """
+        Return the save slots as YAML text, as in the save file; JSON would
+        turn their tuples into lists.
+        """
+        if self.slots is None:
+            return None
+        return serialization.dump(self.slots)
+
+    def save(self):
+        recording = {"version" : FORMAT_VERSION,
+                     "seed" : self.seed,
+                     "slots" : self.dump_slots(),
+                     "frames" : self.frames,
+                     "fingerprints" : {str(update):value for update,value
+                                       in self.fingerprints.items()}}
+        with open(self.path, "w") as recording_file:
+            json.dump(recording, recording_file, separators=(",", ":"))
+        print("Recorded {} frames ({} updates) to {}.".format(
+              len(self.frames), self.updates, self.path))
+
+
+class Replayer(object):
+    """
+    Plays a recording back through a Control (see Control.replay).  If
+    paced is False frames are run as fast as possible.
+    """
+    def __init__(self, path, paced=True):
+        self.path = path
+        self.paced = paced
+        try:
+            with open(path) as recording_file:
+                recording = json.load(recording_file)
+        except (IOError, ValueError) as error:
+            raise ReplayError("Can't read {}: {}".format(path, error))
+        if recording.get("version") != FORMAT_VERSION:
+            raise ReplayError("{} is not a version {} recording.".format(
+                              path, FORMAT_VERSION))
+        self.seed = recording["seed"]
+        self.slots = recording["slots"]
+        self.frames = recording["frames"]
+        self.fingerprints = {int(update):value for update,value
+                             in recording["fingerprints"].items()}
+        self.keys = KeyState()
+        self.times = []
+        self.updates = 0
+        self.checked = 0
+        self.diverged = None
+        self.save_directory = None
+        self.phases = {}
+
+    def start(self, control):
+        start_session(self.seed)
+        control.keys = self.keys
+
+    def make_store(self, store_class):
+        """
+        Return a store_class (a save_store.SaveStore) in a temporary
+        directory holding the recorded save slots.
+        """
+        self.save_directory = tempfile.mkdtemp(prefix="replay")
+        store = store_class(os.path.join(self.save_directory, "save.dat"))
+        if self.slots is not None:
+            store.slots = serialization.load(self.slots)
+        return store
+
+    def add_event(self, event):
+        pass
+
+    def handle_live_events(self, control):
+        """
+        Quit if the window is closed and pass on the debug keys; all other
+        live input is ignored.
+        """
+        for event in pg.event.get():
+            if event.type == pg.QUIT:
+                control.done = True
+            elif event.type == pg.KEYDOWN and event.key in DEBUG_KEYS:
+                control.debug_keys(event.key)
+
+    def get_now(self, now):
+        now = self.times.pop(0)
+        CLOCK.now = now
+        return now
+
+    def end_update(self, control):
+        self.updates += 1
+        expected = self.fingerprints.get(self.updates)
+        if expected is not None:
+            self.checked += 1
+            if self.diverged is None and fingerprint(control) != expected:
+                self.diverged = self.updates
+
+    def end_frame(self, interpolate):
+        pass
+
+    def run(self, control):
+        """
+        Run every recorded frame unless the Control quits first.  The
+        report is printed even if a frame raises.
+        """
+        frames = 0
+        start = get_time()
+        try:
+            for events, times, interpolate in self.frames:
+                if control.done:
+                    break
+                if self.paced:
+                    control.clock.tick(control.fps)
+                control.hud.begin_frame()
+                self.handle_live_events(control)
+                for data in events:
+                    event = decode_event(data)
+                    self.keys.handle(event)
+                    control.state_machine.get_event(event)
+                control.hud.lap("events")
+                self.times = list(times)
+                for _ in times:
+                    control.update()
+                control.hud.lap("update")
+                control.draw(interpolate)
+                control.hud.end_frame(len(times))
+                for phase,value in control.hud.current.items():
+                    self.phases[phase] = self.phases.get(phase, 0.0)+value
+                if control.tracer.enabled:
+                    control.tracer.end_frame()
+                frames += 1
+        finally:
+            self.report(frames, get_time()-start)
+
+    def finish(self, control):
+        end_session()
+
+    def remove_store(self):
+        """Delete the directory made by make_store once saving is done."""
+        if self.save_directory:
+            shutil.rmtree(self.save_directory, ignore_errors=True)
+            self.save_directory = None
+
+    def report(self, frames, seconds):
+        """Print whether the replay matched and how long it took."""
+        if self.diverged is not None:
+            result = "DIVERGED at update {}".format(self.diverged)
+        elif frames < len(self.frames):
+            result = "stopped early; {} fingerprints matched".format(
+                     self.checked)
+        else:
+            result = "matched ({} fingerprints)".format(self.checked)
+        print("Replay of {}: {}".format(self.path, result))
+        print("{} frames, {} updates in {:.2f}s".format(frames, self.updates,
+                                                        seconds))
+        for phase in sorted(self.phases):
+            mean = self.phases[phase]/frames if frames else 0.0
+            print("  {:<8} {:>8.3f} ms/frame".format(phase, mean))
+        sys.stdout.flush()
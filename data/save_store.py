@@ -0,0 +1,256 @@
+"""
+Contains the store for the save slots in the save data file.
+
+Rewriting the whole save file every time one slot changes means a full YAML
+load and dump and leaves a window where a crash loses the file.  Instead the
+save file is a snapshot, in the same format as ever (a YAML list with one
+entry per slot), and every change is appended to a journal alongside it
+(save_data.dat becomes save_data.journal).  Only the fields that changed are
+written; for the dictionary fields (identifiers, gear, equipped) only the
+entries that changed.  Loading replays the journal over the snapshot.  Once
+the journal holds COMPACT_AFTER records the current slots are written out as
+a new snapshot and the journal is removed.
+
+Each journal record is a header line holding the length and CRC-32 of the
+YAML document that follows it.  A record cut short by a crash fails the
+check; it and anything after it are discarded (and truncated from the file
+on the next load).  Snapshots are written to a temporary file, synced and
+renamed into place.  A crash between renaming a snapshot and removing the
+journal is harmless: the changes in a journal are all assignments and
+deletions, so replaying them over a snapshot that already includes them
+changes nothing.
+"""
+
+import os
+import copy
+import zlib
+import tempfile
+import threading
+
+from . import prepare, serialization
+
+
+JOURNAL_EXTENSION = ".journal"
+COMPACT_AFTER = 64 #Journal records.
+EMPTY = "EMPTY"
+SLOTS = 3
+
+#Top level fields of a save whose entries are journaled individually.
+NESTED_FIELDS = ("identifiers", "gear", "equipped")
+
+_MISSING = object()
+
+
+def diff_slot(old, new):
+    """
+    Return a list of (operation, path, value) changes that turn the save
+    old into new.  The operation is either "set" or "delete" and the path is
+    a tuple of keys; an empty path replaces the whole slot.
+    """
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return [] if old == new else [("set", (), new)]
+    changes = []
+    for key, value in new.items():
+        if key not in old:
+            changes.append(("set", (key,), value))
+        elif old[key] != value:
+            if (key in NESTED_FIELDS and isinstance(value, dict) and
+                    isinstance(old[key], dict)):
+                changes.extend(diff_entries(key, old[key], value))
+            else:
+                changes.append(("set", (key,), value))
+    changes.extend(("delete", (key,), None) for key in old if key not in new)
+    return changes
+
+
+def diff_entries(key, old, new):
+    """Return the changes to the entries of the dictionary field key."""
+    changes = [("set", (key, sub_key), value)
+               for sub_key, value in new.items()
+               if old.get(sub_key, _MISSING) != value]
+    changes.extend(("delete", (key, sub_key), None)
+                   for sub_key in old if sub_key not in new)
+    return changes
+
+
+def apply_changes(slots, slot, changes):
+    """Apply a list of changes (see diff_slot) to slots[slot] in place."""
+    for operation, path, value in changes:
+        if not path:
+            slots[slot] = value
+            continue
+        target = slots[slot]
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+        if operation == "set":
+            target[path[-1]] = value
+        else:
+            target.pop(path[-1], None)
+
+
+def write_atomic(path, data):
+    """Write the bytes data to path through a synced temporary file."""
+    directory, name = os.path.split(path)
+    handle, temp = tempfile.mkstemp(".tmp", name+".", directory or ".")
+    try:
+        with os.fdopen(handle, "wb") as temp_file:
+            temp_file.write(data)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        if os.name == "nt" and os.path.exists(path):
+            os.remove(path)
+        os.rename(temp, path)
+    except (IOError, OSError):
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        raise
+
+
+class SaveStore(object):
+    """
+    The save slots, loaded on first use.  Slots hold either a dictionary of
+    player data (see Player.get_player_data) or the string EMPTY.  A store
+    may be used from more than one thread; reading the slots never waits
+    for a write to reach the disk.
+    """
+    def __init__(self, path=prepare.SAVE_PATH, slots=SLOTS,
+                 compact_after=COMPACT_AFTER):
+        self.path = path
+        self.journal_path = os.path.splitext(path)[0]+JOURNAL_EXTENSION
+        self.slot_count = slots
+        self.compact_after = compact_after
+        self.slots = None
+        self.journal_records = 0
+        self.lock = threading.RLock() #Guards slots.
+        self.write_lock = threading.RLock() #Orders writes to disk.
+
+    def load(self):
+        """Read the snapshot and replay the journal over it."""
+        try:
+            with open(self.path) as save_file:
+                slots = serialization.load(save_file)
+        except IOError:
+            slots = None
+        if not isinstance(slots, list):
+            slots = []
+        slots.extend([EMPTY]*(self.slot_count-len(slots)))
+        self.slots = slots
+        self.journal_records = self.replay_journal()
+
+    def replay_journal(self):
+        """
+        Apply every intact journal record to the slots, truncating a
+        damaged tail.  Returns the number of records applied.
+        """
+        try:
+            with open(self.journal_path, "rb") as journal:
+                raw = journal.read()
+        except IOError:
+            return 0
+        records = 0
+        position = 0
+        while position < len(raw):
+            record = self.read_record(raw, position)
+            if record is None:
+                break
+            (slot, changes), position = record
+            apply_changes(self.slots, slot, changes)
+            records += 1
+        if position < len(raw):
+            with open(self.journal_path, "r+b") as journal:
+                journal.truncate(position)
+        return records
+
+    def read_record(self, raw, position):
+        """
+        Return ((slot, changes), next_position) for the journal record at
+        position in raw, or None if it is incomplete or damaged.
+        """
+        end_of_header = raw.find(b"\n", position)
+        if end_of_header < 0:
+            return None
+        try:
+            length, checksum = raw[position:end_of_header].split()
+            length, checksum = int(length), int(checksum, 16)
+        except ValueError:
+            return None
+        start = end_of_header+1
+        payload = raw[start:start+length]
+        if len(payload) != length:
+            return None
+        if zlib.crc32(payload)&0xffffffff != checksum:
+            return None
+        try:
+            record = serialization.load(payload.decode("utf-8"))
+            slot, changes = record["slot"], record["changes"]
+        except Exception:
+            return None
+        if not 0 <= slot < len(self.slots):
+            return None
+        return (slot, changes), start+length
+
+    def get_slots(self):
+        """Return a copy of the list of all slots."""
+        with self.lock:
+            if self.slots is None:
+                self.load()
+            return copy.deepcopy(self.slots)
+
+    def get_slot(self, slot):
+        """Return a copy of the data in one slot."""
+        with self.lock:
+            if self.slots is None:
+                self.load()
+            return copy.deepcopy(self.slots[slot])
+
+    def save_slot(self, slot, data):
+        """
+        Store data (player data or EMPTY) in slot.  Only the differences
+        from what the slot held are written.  Returns the number of changes.
+        """
+        data = copy.deepcopy(data)
+        with self.write_lock:
+            with self.lock:
+                if self.slots is None:
+                    self.load()
+                changes = diff_slot(self.slots[slot], data)
+            if changes:
+                self.append_record(slot, changes)
+                with self.lock:
+                    apply_changes(self.slots, slot, changes)
+                if self.journal_records >= self.compact_after:
+                    self.compact()
+        return len(changes)
+
+    def clear_slot(self, slot):
+        """Empty a slot."""
+        return self.save_slot(slot, EMPTY)
+
+    def append_record(self, slot, changes):
+        """Append a record to the journal and sync it to disk."""
+        record = {"slot" : slot, "changes" : [list(change)
+                                              for change in changes]}
+        payload = serialization.dump(record).encode("utf-8")
+        header = "{} {:08x}\n".format(len(payload),
+                                      zlib.crc32(payload)&0xffffffff)
+        with open(self.journal_path, "ab") as journal:
+            journal.write(header.encode("ascii")+payload)
+            journal.flush()
+            os.fsync(journal.fileno())
+        self.journal_records += 1
+
+    def compact(self):
+        """Write the current slots as a new snapshot and drop the journal."""
+        with self.write_lock:
+            snapshot = serialization.dump(self.get_slots()).encode("utf-8")
+            write_atomic(self.path, snapshot)
+            try:
+                os.remove(self.journal_path)
+            except OSError:
+                pass
+            self.journal_records = 0
+
+
+STORE = SaveStore()
@@ -0,0 +1,81 @@
+"""
+The game's single interface to YAML; every save file and map is loaded and
+dumped through this module.
+
+The bundled yaml packages provide CLoader and CDumper, bindings to libyaml
+that are several times faster than the pure python Loader and Dumper, but
+they are only importable where libyaml and its extension module are
+installed.  They are used whenever they are available (and agree with the
+pure python classes on a sample document).  Otherwise the pure python
+classes are used, with maps read by the MapLoader fast path.
+"""
+
+import sys
+
+
+if sys.version_info[0] < 3:
+    import yaml
+else:
+    import yaml3 as yaml
+
+
+#A document using the python tags the game relies on.
+SAMPLE = {"name" : "sample",
+          "items" : ["a", 1, 0.5, u"b"],
+          "solid" : {(0, 50) : ("base", (100, 450)), (50, 50) : (1, 2)}}
+
+
+def get_libyaml_classes():
+    """
+    Return (CLoader, CDumper) if libyaml is available and produces the
+    same data as the pure python classes; otherwise return None.
+    """
+    if not getattr(yaml, "__with_libyaml__", False):
+        return None
+    try:
+        text = yaml.dump(SAMPLE, Dumper=yaml.CDumper)
+        if yaml.load(text, Loader=yaml.CLoader) != SAMPLE:
+            return None
+        if yaml.load(text, Loader=yaml.Loader) != SAMPLE:
+            return None
+    except Exception:
+        return None
+    return yaml.CLoader, yaml.CDumper
+
+
+LIBYAML_CLASSES = get_libyaml_classes()
+
+if LIBYAML_CLASSES:
+    BACKEND = "libyaml"
+    Loader, Dumper = LIBYAML_CLASSES
+    MapLoader = Loader
+else:
+    BACKEND = "python"
+    Loader, Dumper = yaml.Loader, yaml.Dumper
+    MapLoader = yaml.MapLoader
+
+
+def load(stream):
+    """Load a YAML document (a string or an open file)."""
+    return yaml.load(stream, Loader=Loader)
+
+
+def load_map(stream):
+    """Load a map file written by the map editor."""
+    return yaml.load(stream, Loader=MapLoader)
+
+
+def dump(data, stream=None):
+    """
+    Dump data to an open file, or return it as a string if no stream is
+    given.
+    """
+    return yaml.dump(data, stream, Dumper=Dumper)
+
+
+def get_backend():
+    """Return a description of the active backend."""
+    loader = "MapLoader" if MapLoader is yaml.MapLoader else MapLoader.__name__
+    return "{} (yaml {}; {}/{}, maps {})".format(BACKEND, yaml.__version__,
+                                                Loader.__name__,
+                                                Dumper.__name__, loader)
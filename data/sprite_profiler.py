@@ -0,0 +1,128 @@
+"""
+Contains a profiler for the update and draw costs of a Level's sprites.
+
+When PROFILER.enabled is True (toggled with F9, or from the start with
+PROFILE_SPRITES) the Level updates and draws its sprites one at a time
+through the profiler.  The profiler adds up the calls and wall time of each
+concrete sprite class (Tile, AnimatedTile, Spider, Shadow, ...) separately
+for update and draw.  The time taken by an EnemyBatch is counted under
+that name.  The perf overlay lists the classes that cost the most, and
+the totals are printed when the game exits.
+
+Timing every sprite has a cost of its own, so absolute numbers are higher
+than with profiling off.  The ratios between classes are what matter.
+"""
+
+import time
+
+
+KINDS = ("update", "draw")
+PROFILE_SPRITES = False
+
+get_time = getattr(time, "perf_counter", time.time)
+
+
+class SpriteProfiler(object):
+    """
+    The stats are kept as {kind : {class name : [calls, seconds]}} and
+    passes as {kind : number of group updates or draws}.
+    """
+    def __init__(self, enabled=PROFILE_SPRITES):
+        self.enabled = enabled
+        self.stats = {kind:{} for kind in KINDS}
+        self.passes = {kind:0 for kind in KINDS}
+
+    def toggle(self):
+        self.enabled = not self.enabled
+
+    def reset(self):
+        for kind in KINDS:
+            self.stats[kind].clear()
+            self.passes[kind] = 0
+
+    def add(self, kind, name, seconds, calls=1):
+        """Add calls taking seconds in total to name's stats for kind."""
+        entry = self.stats[kind].get(name)
+        if entry is None:
+            entry = self.stats[kind][name] = [0, 0.0]
+        entry[0] += calls
+        entry[1] += seconds
+
+    def update(self, sprites, *args):
+        """Call update(*args) on each sprite, timing each one."""
+        stats = self.stats["update"]
+        for sprite in sprites:
+            start = get_time()
+            sprite.update(*args)
+            elapsed = get_time()-start
+            entry = stats.get(sprite.__class__.__name__)
+            if entry is None:
+                entry = stats[sprite.__class__.__name__] = [0, 0.0]
+            entry[0] += 1
+            entry[1] += elapsed
+        self.passes["update"] += 1
+
+    def draw(self, sprites, surface):
+        """Blit each sprite to surface in order, timing each one."""
+        for sprite in sprites:
+            self.draw_sprite(surface, sprite)
+        self.passes["draw"] += 1
+
+    def draw_sprite(self, surface, sprite):
+        """Blit one sprite to surface, timing it."""
+        start = get_time()
+        surface.blit(sprite.image, sprite.rect)
+        elapsed = get_time()-start
+        stats = self.stats["draw"]
+        entry = stats.get(sprite.__class__.__name__)
+        if entry is None:
+            entry = stats[sprite.__class__.__name__] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += elapsed
+
+    def end_draw(self):
+        """Count a draw made of separate draw_sprite calls."""
+        self.passes["draw"] += 1
+
+    def snapshot(self):
+        """Return a copy of the stats and passes (see difference)."""
+        stats = {kind:{name:tuple(entry)
+                       for name,entry in self.stats[kind].items()}
+                 for kind in KINDS}
+        return stats, dict(self.passes)
+
+    def get_rows(self, snapshot=None, previous=None):
+        """
+        Return (name, update ms, draw ms, sprites) rows sorted by total time,
+        giving milliseconds per pass and sprites per update pass.  If a
+        previous snapshot is given only the time since it is included.
+        """
+        stats, passes = snapshot or self.snapshot()
+        old_stats, old_passes = previous or ({kind:{} for kind in KINDS},
+                                             {kind:0 for kind in KINDS})
+        rows = {}
+        for kind in KINDS:
+            count = passes[kind]-old_passes[kind]
+            for name,(calls, seconds) in stats[kind].items():
+                old_calls, old_seconds = old_stats[kind].get(name, (0, 0.0))
+                row = rows.setdefault(name, [name, 0.0, 0.0, 0.0])
+                if count > 0:
+                    milliseconds = 1000.0*(seconds-old_seconds)/count
+                    row[KINDS.index(kind)+1] = milliseconds
+                    if kind == "update":
+                        row[3] = float(calls-old_calls)/count
+        return sorted((tuple(row) for row in rows.values()),
+                      key=lambda row: row[1]+row[2], reverse=True)
+
+    def format_report(self):
+        """Return a printable table of everything recorded."""
+        lines = ["Sprite costs over {} updates and {} draws".format(
+                 self.passes["update"], self.passes["draw"]),
+                 "{:<20}{:>14}{:>14}{:>10}".format(
+                 "class", "update (ms)", "draw (ms)", "sprites")]
+        for row in self.get_rows():
+            lines.append("{:<20}{:>14.4f}{:>14.4f}{:>10.1f}".format(*row))
+        return "\n".join(lines)
+
+
+PROFILER = SpriteProfiler()
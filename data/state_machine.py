@@ -71,6 +71,7 @@ class _State(object):
         self.next = None
         self.previous = None
         self.persist = {}
+        self.dirty_rects = None #Rects to update after draw; None for all.
 
     def get_event(self, event):
         """
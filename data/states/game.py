@@ -2,20 +2,13 @@
 This module contains the primary gameplay state.
 """
 
-import sys
 import math
 import pygame as pg
 
-from .. import prepare, state_machine, menu_helpers
+from .. import prepare, state_machine, menu_helpers, autosave
 from ..components import player, world, sidebar, enemy_sprites
 
 
-if sys.version_info[0] < 3:
-    import yaml
-else:
-    import yaml3 as yaml
-
-
 SMALL_FONT = pg.font.Font(prepare.FONTS["Fixedsys500c"], 32) ###
 
 PLAY_AGAIN = prepare.GFX["misc"]["retry"]
@@ -28,6 +21,8 @@ IRIS_TRANSPARENCY = (0, 0, 0, 175)
 IRIS_STRIP_RECT = pg.Rect(prepare.PLAY_RECT.w-5, 0, 5, prepare.PLAY_RECT.h)
 IRIS_STRIP_COLOR = (255, 73, 73)
 
+DIRTY_RECT_RENDERING = False #Toggled in game with the F6 key.
+
 
 class Game(state_machine._State):
     """Core state for the actual gameplay."""
@@ -35,6 +30,9 @@ class Game(state_machine._State):
         state_machine._State.__init__(self)
         self.world = None
         self.reset_map = True
+        self.dirty_rendering = DIRTY_RECT_RENDERING
+        self.full_redraw = True
+        self.dirty_area = 0 #Pixels sent to the display last frame.
 
     def startup(self, now, persistant):
         """
@@ -43,42 +41,46 @@ class Game(state_machine._State):
         map and reset relevant variables.
         """
         state_machine._State.startup(self, now, persistant)
+        self.full_redraw = True
         if self.reset_map:
             self.player = self.persist["player"]
-            self.world = world.WorldMap(self.player)
+            self.world = self.make_world()
             self.sidebar = sidebar.SideBar()
             self.iris = None
             self.play_again = None
             self.reset_map = False
 
+    def make_world(self):
+        """Create the WorldMap the player starts in."""
+        return world.WorldMap(self.player)
+
     def cleanup(self):
-        """Store background color and sidebar for use in camp menu."""
+        """
+        Store background color and sidebar for use in camp menu.  Anything
+        triggered on the way out (entering camp) is autosaved now.
+        """
         self.done = False
+        autosave.AUTOSAVER.poll(self.persist["save_slot"], self.player)
         self.persist["bg_color"] = self.world.level.background_color
         self.persist["sidebar"] = self.sidebar
         return self.persist
 
     def save_player(self):
         """
-        Retrieve needed data and save it in the player's save slot using YAML.
+        Retrieve needed data and queue it to be saved in the player's save
+        slot (the write happens on the autosave thread).
         """
         data = self.player.get_player_data()
-        try:
-            with open(prepare.SAVE_PATH) as my_file:
-                players = yaml.load(my_file)
-        except IOError:
-            print("Problem loading data. Exiting.")
-            raise
-        save_slot = self.persist["save_slot"]
-        players[save_slot] = data
-        with open(prepare.SAVE_PATH, 'w') as my_file:
-            yaml.dump(players, my_file)
+        autosave.AUTOSAVER.request(self.persist["save_slot"], data)
 
     def get_event(self, event):
         """
         Process game state events. Add and pop directions from the player's
         direction stack as necessary.
         """
+        if event.type == pg.KEYDOWN and event.key == pg.K_F6:
+            self.dirty_rendering = not self.dirty_rendering
+            self.full_redraw = True
         if self.player.action_state != "dead":
             if event.type == pg.KEYDOWN:
                 self.player.add_direction(event.key)
@@ -102,6 +104,7 @@ class Game(state_machine._State):
         """
         self.done = True
         self.next = "CAMP"
+        autosave.AUTOSAVER.trigger("camp")
         self.player.direction_stack = []
         self.player.equipped["weapon"].sprite.reset_attack()
         self.player.action_state = "normal"
@@ -113,15 +116,40 @@ class Game(state_machine._State):
         self.sidebar.update(self.player)
         if self.player.action_state == "dead":
             self.update_on_death(keys, now)
+        else:
+            autosave.AUTOSAVER.poll(self.persist["save_slot"], self.player)
 
     def draw(self, surface, interpolate):
-        """Draw level and sidebar; if player is dead draw death sequence."""
+        """
+        Draw level and sidebar; if player is dead draw death sequence.
+        The dirty rect path is used when enabled unless the player is dead.
+        """
+        dead = self.player.action_state == "dead"
+        if self.dirty_rendering and not (dead or self.full_redraw):
+            self.draw_dirty(surface, interpolate)
+            return
         self.world.draw(surface, interpolate)
         self.sidebar.draw(surface, interpolate)
-        if self.player.action_state == "dead" and self.iris:
+        if dead and self.iris:
             self.iris.draw(surface)
             if self.iris.done:
                 self.play_again.draw(surface, interpolate)
+        self.dirty_rects = None
+        self.dirty_area = prepare.SCREEN_RECT.w*prepare.SCREEN_RECT.h
+        self.full_redraw = False
+
+    def draw_dirty(self, surface, interpolate):
+        """
+        Draw only the parts of the level and sidebar that have changed,
+        storing the changed rects in dirty_rects for Control to update.
+        """
+        self.dirty_rects = self.world.draw_dirty(surface, interpolate)
+        covered = self.sidebar.rect.collidelist(self.dirty_rects) != -1
+        if self.sidebar.dirty or covered:
+            self.sidebar.draw(surface)
+            if not covered:
+                self.dirty_rects.append(self.sidebar.rect)
+        self.dirty_area = sum(rect.w*rect.h for rect in self.dirty_rects)
 
     def update_on_death(self, keys, now):
         """
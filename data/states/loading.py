@@ -0,0 +1,65 @@
+"""
+The loading screen shown between the title and select screens if the
+resources loading in the background aren't finished yet.
+"""
+
+import pygame as pg
+
+from .. import prepare, state_machine, asset_loader, replay
+
+
+BUDGET_PER_UPDATE = 8 #Milliseconds of main thread work per update.
+BAR_RECT = pg.Rect(0, 0, 600, 30)
+BAR_RECT.center = (prepare.SCREEN_RECT.centerx, prepare.SCREEN_RECT.centery+90)
+BAR_COLOR = pg.Color("white")
+
+
+class Loading(state_machine._State):
+    """
+    Waits for asset_loader's background loader (started before the splash
+    screen) to finish while displaying a progress bar, so that no graphic
+    or sound is loaded on first use once the game starts.  Events keep
+    being processed so the window stays responsive.  If loading is already
+    done the state passes straight on without drawing.
+    """
+    def __init__(self):
+        state_machine._State.__init__(self)
+        self.next = "SELECT"
+        self.loader = None
+        self.text = prepare.BIG_FONT.render("LOADING...", 0, BAR_COLOR)
+        center = (prepare.SCREEN_RECT.centerx, prepare.SCREEN_RECT.centery)
+        self.text_rect = self.text.get_rect(center=center)
+
+    def startup(self, now, persistant):
+        state_machine._State.startup(self, now, persistant)
+        self.loader = asset_loader.BACKGROUND
+
+    def update(self, keys, now):
+        """
+        Finish as many decoded resources as the budget allows.  While a
+        session is recorded or replayed everything is finished in one
+        update so that loading takes the same number of updates every time.
+        """
+        self.now = now
+        if self.loader:
+            if replay.DETERMINISTIC:
+                self.loader.finish_all()
+            else:
+                self.loader.process(BUDGET_PER_UPDATE)
+        self.done = not self.loader or self.loader.done
+
+    def cleanup(self):
+        self.loader = None
+        return state_machine._State.cleanup(self)
+
+    def draw(self, surface, interpolate):
+        surface.fill(prepare.BACKGROUND_COLOR)
+        surface.blit(self.text, self.text_rect)
+        pg.draw.rect(surface, BAR_COLOR, BAR_RECT, 2)
+        if self.loader:
+            filled = BAR_RECT.inflate(-8, -8)
+            filled.w = int(filled.w*self.loader.progress)
+            surface.fill(BAR_COLOR, filled)
+
+    def get_event(self, event):
+        pass
@@ -3,17 +3,10 @@ Contains class for creating a new player and registering their name.
 """
 
 import os
-import sys
 import copy
 import pygame as pg
 
-from .. import prepare, tools, menu_helpers
-
-
-if sys.version_info[0] < 3:
-    import yaml
-else:
-    import yaml3 as yaml
+from .. import prepare, tools, menu_helpers, autosave
 
 
 FONT = pg.font.Font(prepare.FONTS["Fixedsys500c"], 60) ###
@@ -67,15 +60,7 @@ class Register(menu_helpers.BidirectionalMenu):
         """
         player_data = copy.deepcopy(prepare.DEFAULT_PLAYER)
         player_data["name"] = "".join(self.name)
-        try:
-            with open(prepare.SAVE_PATH) as my_file:
-                players = yaml.load(my_file)
-        except IOError:
-            players = ["EMPTY", "EMPTY", "EMPTY"]
-        save_slot = self.persist["save_slot"]
-        players[save_slot] = player_data
-        with open(prepare.SAVE_PATH, 'w') as my_file:
-            yaml.dump(players, my_file)
+        autosave.AUTOSAVER.request(self.persist["save_slot"], player_data)
 
     def pressed_enter(self):
         """Called if the user selects an item with the enter key(s)."""
@@ -3,19 +3,13 @@ Contains classes used for the player selection screen.
 """
 
 import os
-import sys
 import pygame as pg
 
-from .. import prepare, tools, state_machine, menu_helpers
+from .. import (prepare, tools, state_machine, menu_helpers, autosave,
+               replay)
 from ..components import enemy_sprites, player
 
 
-if sys.version_info[0] < 3:
-    import yaml
-else:
-    import yaml3 as yaml
-
-
 FONT = pg.font.Font(prepare.FONTS["Fixedsys500c"], 60) ###
 SMALL_FONT = pg.font.Font(prepare.FONTS["Fixedsys500c"], 32) ###
 
@@ -71,8 +65,11 @@ class Select(state_machine._State):
         self.state_machine.done = False
         regi = self.state_machine.state_dict["SELECT/REGISTER"]
         options = self.state_machine.state_dict["OPTIONS"]
+        selected = options.players[regi.index]
+        if self.next == "GAME" and selected != "EMPTY":
+            selected = selected.make_player()
         self.persist["save_slot"] = regi.index
-        self.persist["player"] = options.players[regi.index]
+        self.persist["player"] = selected
         return self.persist
 
     def update(self, keys, now):
@@ -105,7 +102,7 @@ class Select(state_machine._State):
         Get events from Control.
         """
         if event.type == pg.KEYDOWN:
-            self.start_time = pg.time.get_ticks()
+            self.start_time = replay.CLOCK.get_ticks()
         self.state_machine.get_event(event)
 
 
@@ -117,17 +114,12 @@ class SelectState(menu_helpers.BasicMenu):
 
     def draw_player(self, surface, player_sprite, index, redraw=False):
         """
-        Draw the player in slot index.  Setting the redraw flag allows for
-        the player to be animated.
+        Draw the player (a player.SlotSummary) in slot index.  Setting the
+        redraw flag allows for the player to be animated.
         """
         if player_sprite != "EMPTY":
-            if player_sprite.image and not player_sprite.redraw:
-                player_sprite.redraw = redraw
-            player_sprite.direction = "front"
-            player_sprite.adjust_frames(pg.time.get_ticks())
+            player_sprite.adjust_frames(replay.CLOCK.get_ticks(), redraw)
             expand = pg.transform.scale(player_sprite.image, (100,100))
-            player_sprite.direction = player_sprite.start_direction ###
-            player_sprite.redraw = redraw ###
             position = (PLAYER_START[0], PLAYER_START[1]+SLOT_SPACER*index)
             surface.blit(expand, position)
             self.draw_player_stats(surface, player_sprite, index)
@@ -138,7 +130,7 @@ class SelectState(menu_helpers.BasicMenu):
         icons = prepare.GFX["misc"]["icons"]
         surface.blit(items, (ITEM_IMAGES[0],ITEM_IMAGES[1]+index*SLOT_SPACER))
         for i,stat in enumerate(["money", "keys"]):
-            num = player_sprite.inventory[stat]
+            num = getattr(player_sprite, stat)
             pos_y = ITEM_START[1]+index*SLOT_SPACER+i*ITEM_SPACER
             rend_it = (SMALL_FONT, str(num), pg.Color("white"), self.rendered)
             surface.blit(tools.get_rendered(*rend_it), (ITEM_START[0], pos_y))
@@ -175,17 +167,13 @@ class Options(SelectState):
 
     def load_players(self):
         """
-        Load player data.  If no data is find create three empty slots.
-        """
-        players = ["EMPTY", "EMPTY", "EMPTY"]
-        try:
-            with open(prepare.SAVE_PATH) as my_file:
-                data = yaml.load(my_file)
-            for i,play_data in enumerate(data):
-                if play_data != "EMPTY":
-                    players[i] = player.Player(play_data)
-        except IOError:
-            pass
+        Load a player.SlotSummary for each save slot.  Empty slots are left
+        as the string EMPTY.
+        """
+        players = autosave.AUTOSAVER.get_slots()
+        for i,play_data in enumerate(players):
+            if play_data != "EMPTY":
+                players[i] = player.SlotSummary(play_data)
         return players
 
     def make_player_names(self):
@@ -357,19 +345,14 @@ class Confirm(SelectState):
         Overwrite the save data of the player with
         the string EMPTY.
         """
-        with open(prepare.SAVE_PATH) as my_file:
-            data = yaml.load(my_file)
-        del_index = self.persist["del_index"]
-        data[del_index] = "EMPTY"
-        with open(prepare.SAVE_PATH, 'w') as my_file:
-            yaml.dump(data, my_file)
+        autosave.AUTOSAVER.request(self.persist["del_index"], "EMPTY")
 
     def pressed_enter(self):
         """
         Return to menu on 'Cancel'; set player to 'dead' on 'Confirm'.
         """
         if not self.index:
-            self.player.action_state = "dead"
+            self.player.die()
         else:
             self.pressed_exit()
 
@@ -378,7 +361,7 @@ class Confirm(SelectState):
         If a player deletion has been confirmed and death animation completed,
         return to menu.
         """
-        if self.player.death_anim.done:
+        if self.player.death_anim and self.player.death_anim.done:
             self.save_change()
             self.pressed_exit()
 
@@ -5,7 +5,7 @@ State for the Title scene.
 import random
 import pygame as pg
 
-from .. import prepare, state_machine, tools
+from .. import prepare, state_machine, tools, replay
 from ..components import player, equips
 
 
@@ -63,7 +63,7 @@ class Title(state_machine._State):
         press.
         """
         if event.type == pg.KEYDOWN:
-            self.next = "SELECT"
+            self.next = "LOADING"
             self.done = True
 
 
@@ -156,7 +156,7 @@ class Star(pg.sprite.Sprite):
         self.image = self.frames[self.frame]
         self.rect = self.image.get_rect(center=pos)
         self.blink_timer = tools.Timer(100)
-        self.blink_timer.check_tick(pg.time.get_ticks())
+        self.blink_timer.check_tick(replay.CLOCK.get_ticks())
         self.delay = random.randrange(200, 3000)
         self.delay_timer = 0.0
         self.animate = random.random() < 0.1
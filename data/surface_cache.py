@@ -0,0 +1,168 @@
+"""
+Functions for loading graphics through a cache of already converted pixels.
+
+Decoding a PNG and converting it to the display's pixel format is repeated
+for the same unchanging sheets every time the game starts.  The first time a
+graphic is loaded its converted pixels are written to a raw file in
+CACHE_DIRECTORY; later loads rebuild the surface directly from those bytes
+with pg.image.frombuffer.  Each cache file records the SHA-1 digest of the
+source image and the pixel format it was written in, and is rewritten when
+either no longer matches.
+"""
+
+import os
+import struct
+import hashlib
+import tempfile
+import pygame as pg
+
+from . import tools
+
+
+CACHE_DIRECTORY = os.path.join("resources", "cache", "graphics")
+CACHE_EXTENSION = ".surf"
+MAGIC = b"CKSF"
+FORMAT_VERSION = 1
+
+#Magic, format version, source SHA-1 digest, pixel format, width, height,
+#and whether the surface has per pixel alpha.
+HEADER = struct.Struct("<4sB20s4sIIB")
+
+#Formats understood by both pg.image.tostring and pg.image.frombuffer.
+CANDIDATE_FORMATS = ("BGRA", "RGBA", "ARGB")
+
+_pixel_format = []
+
+
+def get_pixel_format():
+    """
+    Return the frombuffer format string whose surfaces match the format
+    convert_alpha() produces for the current display, or None if there
+    isn't one (in which case the cache can't be used).  The answer is
+    computed once.
+    """
+    if not _pixel_format:
+        target = pg.Surface((1, 1), pg.SRCALPHA).convert_alpha().get_masks()
+        found = None
+        for pixel_format in CANDIDATE_FORMATS:
+            try:
+                test = pg.image.frombuffer(bytearray(4), (1, 1), pixel_format)
+            except ValueError:
+                continue
+            if test.get_masks() == target:
+                found = pixel_format
+                break
+        _pixel_format.append(found)
+    return _pixel_format[0]
+
+
+def cache_path(path):
+    """Return the path of the cache file for the image at path."""
+    directory, name = os.path.split(os.path.normpath(path))
+    prefix = os.path.basename(directory)
+    filename = "{}_{}{}".format(prefix, os.path.splitext(name)[0],
+                                CACHE_EXTENSION)
+    return os.path.join(CACHE_DIRECTORY, filename)
+
+
+def read_cached(path, digest):
+    """
+    Return (pixel_format, size, alpha, pixels) from the cache file for the
+    image at path if it was built from a source with the given digest;
+    otherwise return None.  This doesn't touch the display so it may be
+    called from a worker thread.
+    """
+    try:
+        with open(cache_path(path), "rb") as cached:
+            header = HEADER.unpack(cached.read(HEADER.size))
+            magic, version, source_digest, stored_format = header[:4]
+            width, height, alpha = header[4:]
+            if (magic, version, source_digest) != (MAGIC, FORMAT_VERSION,
+                                                   digest):
+                return None
+            pixels = cached.read()
+            if len(pixels) != width*height*4:
+                return None
+    except (IOError, OSError, struct.error, ValueError):
+        return None
+    return stored_format.decode(), (width, height), alpha, pixels
+
+
+def make_surface(size, alpha, pixels, pixel_format):
+    """Build a display format surface from cached pixels."""
+    if not alpha:
+        #Converting copies the pixels so the buffer need not be kept.
+        return pg.image.frombuffer(pixels, size, pixel_format).convert()
+    #The surface shares the buffer, which must be writable.
+    return pg.image.frombuffer(bytearray(pixels), size, pixel_format)
+
+
+def write_cached(path, digest, pixel_format, surface):
+    """
+    Write the pixels of a converted surface to the cache.  As with compiled
+    maps, the file is written under a temporary name and renamed into
+    place, and failure to write is not an error.
+    """
+    alpha = bool(surface.get_flags()&pg.SRCALPHA)
+    width, height = surface.get_size()
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, digest,
+                         pixel_format.encode(), width, height, alpha)
+    target = cache_path(path)
+    directory, name = os.path.split(target)
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        handle, temp = tempfile.mkstemp(".tmp", name+".", directory)
+    except (IOError, OSError):
+        return
+    try:
+        with os.fdopen(handle, "wb") as cached:
+            cached.write(header)
+            cached.write(pg.image.tostring(surface, pixel_format))
+        if os.name == "nt" and os.path.exists(target):
+            os.remove(target)
+        os.rename(temp, target)
+    except (IOError, OSError, ValueError):
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+
+
+def decode_gfx(path):
+    """
+    The first stage of loading a graphic through the cache; safe to call
+    from a worker thread.  Returns a tuple of the source digest, the cached
+    data (or None) and the decoded image (None if cached data was found).
+    """
+    with open(path, "rb") as source:
+        digest = hashlib.sha1(source.read()).digest()
+    cached = read_cached(path, digest)
+    image = tools.decode_gfx(path) if cached is None else None
+    return digest, cached, image
+
+
+def finish_gfx(path, decoded, colorkey=(255,0,255)):
+    """
+    The second stage of loading a graphic through the cache (see
+    decode_gfx).  Cached pixels stored in a different pixel format than the
+    display currently needs are ignored and the cache file is rewritten.
+    """
+    digest, cached, image = decoded
+    pixel_format = get_pixel_format()
+    if cached and pixel_format and cached[0] == pixel_format:
+        surface = make_surface(cached[1], cached[2], cached[3], pixel_format)
+        if not cached[2]:
+            surface.set_colorkey(colorkey)
+        return surface
+    if image is None:
+        image = tools.decode_gfx(path)
+    surface = tools.finish_gfx(path, image, colorkey)
+    if pixel_format:
+        write_cached(path, digest, pixel_format, surface)
+    return surface
+
+
+def load_gfx(path, colorkey=(255,0,255)):
+    """A drop in replacement for tools.load_gfx that goes through the cache."""
+    return finish_gfx(path, decode_gfx(path), colorkey)
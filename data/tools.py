@@ -6,10 +6,13 @@ Also contained here are resource loading functions.
 import os
 import pygame as pg
 
-from . import state_machine
+from . import (state_machine, perf_hud, trace, sprite_profiler, replay,
+               asset_loader)
 
 
 TIME_PER_UPDATE = 16.0  #Milliseconds
+CAPTION_INTERVAL = 1000 #Milliseconds between FPS caption updates.
+BACKGROUND_LOAD_BUDGET = 4 #Milliseconds per update finishing assets.
 
 
 class Control(object):
@@ -24,64 +27,168 @@ class Control(object):
         self.clock = pg.time.Clock()
         self.fps = 60.0
         self.fps_visible = True
+        self.caption_time = None
+        self.hud = perf_hud.PerfHUD()
+        self.tracer = trace.TRACER
+        if trace.ENABLED_AT_START:
+            self.tracer.enable()
         self.now = 0.0
         self.keys = pg.key.get_pressed()
         self.state_machine = state_machine.StateMachine()
+        self.session = None #A replay.Recorder or replay.Replayer.
 
     def update(self):
         """
-        Updates the currently active state.
+        Updates the currently active state, then finishes some of any
+        assets loading in the background.  During a recording or replay
+        the session decides the time the state is given.
         """
         self.now = pg.time.get_ticks()
-        self.state_machine.update(self.keys, self.now)
+        if self.session:
+            self.now = self.session.get_now(self.now)
+            self.state_machine.update(self.keys, self.now)
+            self.session.end_update(self)
+        else:
+            self.state_machine.update(self.keys, self.now)
+        asset_loader.process_background(BACKGROUND_LOAD_BUDGET)
 
     def draw(self, interpolate):
+        """
+        Draw the current state and then the performance overlay if it is
+        visible.  If the state provides a list of dirty_rects only those
+        areas of the display (and the overlay) are updated.
+        """
         if not self.state_machine.state.done:
             self.state_machine.draw(self.screen, interpolate)
-            pg.display.update()
+            self.hud.lap("draw")
+            dirty_rects = self.state_machine.state.dirty_rects
+            if self.hud.visible:
+                state = self.state_machine.state
+                now = pg.time.get_ticks()
+                fps = self.clock.get_fps()
+                hud_rect = self.hud.draw(self.screen, state, now, fps)
+                if dirty_rects is not None:
+                    dirty_rects = dirty_rects+[hud_rect]
+                self.hud.lap()
+            if dirty_rects is None:
+                pg.display.update()
+            elif dirty_rects:
+                pg.display.update(dirty_rects)
+            self.hud.lap("display")
             self.show_fps()
 
     def event_loop(self):
         """
         Process all events and pass them down to the state_machine.
-        The f5 key globally turns on/off the display of FPS in the caption
+        The f4, f5, f7, f8 and f9 keys are handled globally (see debug_keys).
         """
         for event in pg.event.get():
-            if event.type == pg.QUIT:
-                self.done = True
-            elif event.type == pg.KEYDOWN:
-                self.keys = pg.key.get_pressed()
-                self.toggle_show_fps(event.key)
-            elif event.type == pg.KEYUP:
-                self.keys = pg.key.get_pressed()
-            self.state_machine.get_event(event)
-
-    def toggle_show_fps(self, key):
-        """Press f5 to turn on/off displaying the framerate in the caption."""
-        if key == pg.K_F5:
+            self.process_event(event)
+
+    def process_event(self, event):
+        """Handle a single event, recording it if a session is active."""
+        if event.type == pg.QUIT:
+            self.done = True
+        elif event.type == pg.KEYDOWN:
+            self.keys = pg.key.get_pressed()
+            self.debug_keys(event.key)
+        elif event.type == pg.KEYUP:
+            self.keys = pg.key.get_pressed()
+        if self.session:
+            self.session.add_event(event)
+        self.state_machine.get_event(event)
+
+    def debug_keys(self, key):
+        """
+        Press f4 to turn on/off displaying the framerate in the caption; f5
+        to turn on/off the performance overlay; f7 to turn on/off tracing;
+        f8 to write out the trace buffer; and f9 to turn on/off the sprite
+        profiler.  A state that renders with dirty rects is asked to
+        redraw fully when the overlay is hidden, as nothing else would clear
+        it.
+        """
+        if key == pg.K_F4:
             self.fps_visible = not self.fps_visible
             if not self.fps_visible:
                 pg.display.set_caption(self.caption)
+            self.caption_time = None
+        elif key == pg.K_F5:
+            self.hud.toggle()
+            if not self.hud.visible:
+                state = self.state_machine.state
+                if hasattr(state, "full_redraw"):
+                    state.full_redraw = True
+        elif key == pg.K_F7:
+            self.tracer.toggle()
+        elif key == pg.K_F8:
+            self.tracer.dump()
+        elif key == pg.K_F9:
+            sprite_profiler.PROFILER.toggle()
 
     def show_fps(self):
         """
         Display the current FPS in the window handle if fps_visible is True.
+        Setting the caption is a window manager call, so it is only done
+        every CAPTION_INTERVAL milliseconds.
         """
         if self.fps_visible:
-            fps = self.clock.get_fps()
-            with_fps = "{} - {:.2f} FPS".format(self.caption, fps)
-            pg.display.set_caption(with_fps)
+            now = pg.time.get_ticks()
+            if self.caption_time is None or (
+                    now-self.caption_time >= CAPTION_INTERVAL):
+                fps = self.clock.get_fps()
+                with_fps = "{} - {:.2f} FPS".format(self.caption, fps)
+                pg.display.set_caption(with_fps)
+                self.caption_time = now
 
     def main(self):
-        """Main loop for entire program. Uses a constant timestep."""
+        """
+        Main loop for entire program. Uses a constant timestep.  The time
+        spent in each phase of a frame is passed to the performance overlay
+        and, while tracing, each frame is recorded by the tracer.  During a
+        recording the session is told the interpolation of each frame.
+        """
         lag = 0.0
         while not self.done:
             lag += self.clock.tick(self.fps)
+            self.hud.begin_frame()
             self.event_loop()
+            self.hud.lap("events")
+            steps = 0
             while lag >= TIME_PER_UPDATE:
                 self.update()
                 lag -= TIME_PER_UPDATE
-            self.draw(lag/TIME_PER_UPDATE)
+                steps += 1
+            self.hud.lap("update")
+            interpolate = lag/TIME_PER_UPDATE
+            self.draw(interpolate)
+            self.hud.end_frame(steps)
+            if self.session:
+                self.session.end_frame(interpolate)
+            if self.tracer.enabled:
+                self.tracer.end_frame()
+
+    def record(self, recorder):
+        """
+        Run the main loop recording everything that happens with a
+        replay.Recorder.  The recording is written even if the game crashes.
+        """
+        self.session = recorder
+        recorder.start(self)
+        try:
+            self.main()
+        finally:
+            self.session = None
+            recorder.finish(self)
+
+    def replay(self, replayer):
+        """Run the frames of a recording with a replay.Replayer."""
+        self.session = replayer
+        replayer.start(self)
+        try:
+            replayer.run(self)
+        finally:
+            self.session = None
+            replayer.finish(self)
 
 
 class Anim(object):
@@ -192,25 +299,143 @@ class _BaseSprite(pg.sprite.Sprite):
 
 
 ### Resource loading functions.
-def load_all_gfx(directory,colorkey=(255,0,255),accept=(".png",".jpg",".bmp")):
+class LazyAssets(object):
+    """
+    A read only mapping of names to resources that are only loaded when
+    first accessed.  It is created from a dictionary of names to file paths
+    and the function(s) used to load a resource from its path.
+    """
+    def __init__(self, paths, decode, finish=None):
+        """
+        The decode argument turns a path into a resource.  If finish is
+        given, loading is split in two stages: decode must then be safe to
+        call from a worker thread (no display access) and
+        finish(path, decoded) completes the resource on the main thread.
+        """
+        self.paths = paths
+        self.decode = decode
+        self.finish = finish
+        self.loaded = {}
+
+    def __getitem__(self, name):
+        try:
+            return self.loaded[name]
+        except KeyError:
+            path = self.paths[name]
+            return self.store(name, self.decode(path))
+
+    def store(self, name, decoded):
+        """
+        Finish a resource from the result of decode and store it.  If the
+        resource was already loaded the stored one is kept and returned.
+        """
+        if name not in self.loaded:
+            if self.finish:
+                decoded = self.finish(self.paths[name], decoded)
+            self.loaded[name] = decoded
+        return self.loaded[name]
+
+    def unloaded(self):
+        """Return a list of the names of resources not loaded yet."""
+        return [name for name in self.paths if name not in self.loaded]
+
+    def __contains__(self, name):
+        return name in self.paths
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def get(self, name, default=None):
+        return self[name] if name in self.paths else default
+
+    def keys(self):
+        return list(self.paths)
+
+    def values(self):
+        return [self[name] for name in self.paths]
+
+    def items(self):
+        return [(name, self[name]) for name in self.paths]
+
+    def is_loaded(self, name):
+        """Return True if the named resource has already been loaded."""
+        return name in self.loaded
+
+    def warm(self, names=None):
+        """
+        Load the named resources now (all of them if names is None) so
+        that the first access doesn't stall.  States that know what they
+        need can call this at a convenient time.
+        """
+        for name in (self.paths if names is None else names):
+            self[name]
+
+
+def get_resource_paths(directory, accept):
     """
-    Load all graphics with extensions in the accept argument.  If alpha
-    transparency is found in the image the image will be converted using
-    convert_alpha().  If no alpha transparency is detected image will be
-    converted using convert() and colorkey will be set to colorkey.
+    Return a dictionary of name to path for the files in directory that
+    have extensions in accept.
     """
-    graphics = {}
-    for pic in os.listdir(directory):
-        name,ext = os.path.splitext(pic)
+    paths = {}
+    for resource in os.listdir(directory):
+        name,ext = os.path.splitext(resource)
         if ext.lower() in accept:
-            img = pg.image.load(os.path.join(directory,pic))
-            if img.get_alpha():
-                img = img.convert_alpha()
-            else:
-                img = img.convert()
-                img.set_colorkey(colorkey)
-            graphics[name]=img
-    return graphics
+            paths[name] = os.path.join(directory, resource)
+    return paths
+
+
+def decode_gfx(path):
+    """
+    Load a graphic without converting it.  This doesn't need the display
+    so it may be called from a worker thread.
+    """
+    return pg.image.load(path)
+
+
+def finish_gfx(path, img, colorkey=(255,0,255)):
+    """
+    Convert a graphic loaded by decode_gfx.  If alpha transparency is found
+    in the image the image will be converted using convert_alpha().  If no
+    alpha transparency is detected image will be converted using convert()
+    and colorkey will be set to colorkey.
+    """
+    if img.get_alpha():
+        img = img.convert_alpha()
+    else:
+        img = img.convert()
+        img.set_colorkey(colorkey)
+    return img
+
+
+def load_gfx(path, colorkey=(255,0,255)):
+    """Load and convert a single graphic (see finish_gfx)."""
+    return finish_gfx(path, decode_gfx(path), colorkey)
+
+
+def load_all_gfx(directory,colorkey=(255,0,255),accept=(".png",".jpg",".bmp")):
+    """
+    Load all graphics with extensions in the accept argument.  Graphics are
+    converted as described in load_gfx.
+    """
+    paths = get_resource_paths(directory, accept)
+    return {name:load_gfx(path, colorkey) for name,path in paths.items()}
+
+
+def lazy_load_gfx(directory, colorkey=(255,0,255),
+                  accept=(".png",".jpg",".bmp"),
+                  decode=decode_gfx, finish=finish_gfx):
+    """
+    As load_all_gfx, but returns a LazyAssets mapping so that each graphic
+    is only loaded and converted the first time it is used.  The decode and
+    finish arguments are the functions (with the signatures of decode_gfx
+    and finish_gfx) used for the two stages of loading.
+    """
+    paths = get_resource_paths(directory, accept)
+    return LazyAssets(paths, decode,
+                      lambda path, decoded: finish(path, decoded, colorkey))
 
 
 def load_all_music(directory, accept=(".wav",".mp3",".ogg",".mdi")):
@@ -240,12 +465,18 @@ def load_all_sfx(directory, accept=(".wav",".mp3",".ogg",".mdi")):
     common to need to set sfx volume on a one-by-one basis.  This must be done
     manually if necessary.
     """
-    effects = {}
-    for fx in os.listdir(directory):
-        name,ext = os.path.splitext(fx)
-        if ext.lower() in accept:
-            effects[name] = pg.mixer.Sound(os.path.join(directory,fx))
-    return effects
+    paths = get_resource_paths(directory, accept)
+    return {name:pg.mixer.Sound(path) for name,path in paths.items()}
+
+
+def lazy_load_sfx(directory, accept=(".wav",".mp3",".ogg",".mdi")):
+    """
+    As load_all_sfx, but returns a LazyAssets mapping so that each sound
+    is only decoded the first time it is used.  Sounds need no finishing on
+    the main thread, so they may be decoded entirely by a worker thread.
+    """
+    paths = get_resource_paths(directory, accept)
+    return LazyAssets(paths, pg.mixer.Sound, lambda path, sound: sound)
 
 
 def strip_from_sheet(sheet, start, size, columns, rows=1):
@@ -325,6 +556,22 @@ def get_rendered(font, text, color, cache):
     return image
 
 
+def merge_rects(rects):
+    """
+    Return a list of rects in which any overlapping rects from the argument
+    have been replaced by their union; used to avoid redrawing an area twice.
+    """
+    merged = []
+    for rect in rects:
+        rect = pg.Rect(rect)
+        index = rect.collidelist(merged)
+        while index != -1:
+            rect.union_ip(merged.pop(index))
+            index = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+
 def rect_then_mask(one, two):
     """
     This is a callback function to be used with sprite group collision methods.
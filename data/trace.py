@@ -0,0 +1,155 @@
+"""
+Contains a tracer that records spans of the game loop for offline analysis.
+
+While tracing is enabled (F7) the methods listed in TRACED are replaced by
+wrappers that append (name, thread, start, duration) to a ring buffer of the
+last BUFFER_SIZE spans, and Control adds a span for each whole frame.  The
+buffer is written out as Chrome trace event JSON (open it in
+chrome://tracing or ui.perfetto.dev) when F8 is pressed, and automatically
+when a frame takes longer than SLOW_FRAME, at most once every
+DUMP_COOLDOWN seconds.  While tracing is disabled the original methods are
+in place, so the only cost is the check of TRACER.enabled once per frame.
+
+This module is imported by tools, so it must only import the modules it
+wraps when tracing is first enabled.
+"""
+
+import os
+import json
+import time
+import threading
+import functools
+
+from collections import deque
+
+
+#(module, class, method) of each span; the span is named Class.method.
+TRACED = [("tools", "Control", "event_loop"),
+          ("state_machine", "StateMachine", "update"),
+          ("state_machine", "StateMachine", "flip_state"),
+          ("components.level", "Level", "__init__"),
+          ("components.level", "Level", "update"),
+          ("components.level", "Level", "check_collisions"),
+          ("components.level", "Level", "draw"),
+          ("components.world", "WorldMap", "update_history"),
+          ("components.world", "WorldMap", "prepare_scroll")]
+
+BUFFER_SIZE = 50000 #Spans; roughly a minute of play.
+SLOW_FRAME = 0.05 #Seconds.
+DUMP_COOLDOWN = 5.0 #Seconds.
+TRACE_DIRECTORY = os.path.join("resources", "traces")
+ENABLED_AT_START = False
+
+get_time = getattr(time, "perf_counter", time.time)
+get_ident = getattr(threading, "get_ident", None) or threading._get_ident
+
+
+def import_class(module_name, class_name):
+    """Import a class given its module's name relative to this package."""
+    package = __name__.rpartition(".")[0]
+    module = __import__(".".join((package, module_name)),
+                        fromlist=[class_name])
+    return getattr(module, class_name)
+
+
+class Tracer(object):
+    """
+    The ring buffer of spans and the wrappers that fill it.  Only one
+    tracer should be enabled at a time, as both patch the same classes.
+    """
+    def __init__(self, size=BUFFER_SIZE, traced=TRACED,
+                 directory=TRACE_DIRECTORY):
+        self.spans = deque(maxlen=size)
+        self.traced = traced
+        self.directory = directory
+        self.enabled = False
+        self.originals = []
+        self.frame_start = None
+        self.last_dump = None
+        self.dumps = 0
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def enable(self):
+        """Install the wrappers and start recording."""
+        if not self.enabled:
+            for module_name, class_name, method in self.traced:
+                cls = import_class(module_name, class_name)
+                original = cls.__dict__[method]
+                self.originals.append((cls, method, original))
+                name = "{}.{}".format(class_name, method)
+                setattr(cls, method, self.wrap(name, original))
+            self.enabled = True
+            self.frame_start = get_time()
+
+    def disable(self):
+        """Put the original methods back.  The buffer is kept."""
+        for cls, method, original in self.originals:
+            setattr(cls, method, original)
+        self.originals = []
+        self.enabled = False
+
+    def wrap(self, name, function):
+        """Return a version of function that records a span."""
+        spans = self.spans
+        @functools.wraps(function)
+        def traced(*args, **kwargs):
+            start = get_time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                spans.append((name, get_ident(), start, get_time()-start))
+        return traced
+
+    def end_frame(self):
+        """
+        Record the frame that just finished (from the end of the last one)
+        and dump the buffer if it was slow.  Called by Control while enabled.
+        """
+        now = get_time()
+        duration = now-self.frame_start
+        self.spans.append(("frame", get_ident(), self.frame_start, duration))
+        self.frame_start = now
+        if duration > SLOW_FRAME:
+            recent = self.last_dump and now-self.last_dump < DUMP_COOLDOWN
+            if not recent:
+                self.dump(reason="slow frame ({:.1f}ms)".format(1000*duration))
+                self.frame_start = get_time()
+
+    def get_events(self):
+        """Return the buffered spans as a list of Chrome trace events."""
+        if not self.spans:
+            return []
+        origin = min(span[2] for span in self.spans)
+        pid = os.getpid()
+        return [{"name" : name, "ph" : "X", "pid" : pid, "tid" : thread,
+                 "ts" : 1e6*(start-origin), "dur" : 1e6*duration}
+                for name, thread, start, duration in self.spans]
+
+    def dump(self, path=None, reason="requested"):
+        """
+        Write the buffer as Chrome trace JSON to path (by default a new file
+        in the trace directory) and return the path.
+        """
+        if path is None:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            name = "trace-{}-{}.json".format(time.strftime("%Y%m%d-%H%M%S"),
+                                             self.dumps)
+            path = os.path.join(self.directory, name)
+        trace = {"traceEvents" : self.get_events(),
+                 "displayTimeUnit" : "ms",
+                 "otherData" : {"reason" : reason}}
+        with open(path, "w") as trace_file:
+            json.dump(trace, trace_file)
+        self.last_dump = get_time()
+        self.dumps += 1
+        print("Trace written to {} ({}).".format(path, reason))
+        return path
+
+
+TRACER = Tracer()
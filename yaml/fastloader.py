@@ -0,0 +1,280 @@
+
+__all__ = ['MapLoader']
+
+import re
+
+from nodes import ScalarNode
+from loader import Loader
+from resolver import Resolver
+
+class UnsupportedInput(Exception):
+    """
+    Raised by the fast path when it meets anything outside the subset of
+    YAML it understands; the document is then given to the full Loader.
+    """
+    pass
+
+INT_TAG = 'tag:yaml.org,2002:int'
+FLOAT_TAG = 'tag:yaml.org,2002:float'
+STR_TAG = 'tag:yaml.org,2002:str'
+TUPLE_TAG = '!!python/tuple'
+UNICODE_TAG = '!!python/unicode'
+
+SIMPLE_KEY = re.compile(r'([A-Za-z_][A-Za-z0-9_ /]*[A-Za-z0-9_/]|[A-Za-z_]):'
+                        r'(?: (.*))?$')
+PROPERTIES = re.compile(r'(?:&([A-Za-z0-9_-]+)(?: |$))?'
+                        r'(?:(!!python/tuple|!!python/unicode)(?: |$))?')
+ALIAS = re.compile(r'\*([A-Za-z0-9_-]+)$')
+PLAIN = re.compile(r'(?:[A-Za-z0-9_]|[-+.][0-9])[A-Za-z0-9_.+-]*$')
+QUOTED = re.compile(r"'((?:[^'\x00-\x1f]|'')*)'$")
+FLOW_SEQUENCE = re.compile(r'\[([^\[\]{}\'"#&*!]*)\]$')
+SIMPLE_INT = re.compile(r'-?(?:0|[1-9][0-9]*)$')
+SIMPLE_FLOAT = re.compile(r'-?[0-9]+\.[0-9]+$')
+
+def make_str(value):
+    """As Constructor.construct_yaml_str, use str for ASCII strings."""
+    try:
+        return value.encode('ascii')
+    except UnicodeEncodeError:
+        return value
+
+class MapLoader(object):
+    """
+    A loader for the small subset of YAML that yaml.dump writes for map
+    files: block mappings (simple keys and '?' complex keys), block and
+    indentless sequences, flow sequences of plain scalars, anchors and
+    aliases, !!python/tuple and !!python/unicode tags, single quoted and
+    plain scalars.  The document is parsed line by line with precompiled
+    regular expressions.  On any input outside that subset it falls back
+    to Loader, so the result always equals that of yaml.load.
+
+    Usage: yaml.load(stream, Loader=MapLoader)
+    """
+
+    fallback = Loader
+
+    def __init__(self, stream):
+        if not isinstance(stream, (str, unicode)):
+            stream = stream.read()
+        self.stream = stream
+        self.resolver = Resolver()
+        self.anchors = {}
+        self.scalars = {}
+        self.lines = []
+        self.index = 0
+        self.used_fallback = False
+
+    def dispose(self):
+        pass
+
+    def get_single_data(self):
+        try:
+            return self.parse()
+        except UnsupportedInput:
+            self.used_fallback = True
+            loader = self.fallback(self.stream)
+            try:
+                return loader.get_single_data()
+            finally:
+                loader.dispose()
+
+    def split_lines(self):
+        text = self.stream
+        if isinstance(text, str):
+            try:
+                text = text.decode('utf-8')
+            except UnicodeDecodeError:
+                raise UnsupportedInput()
+        if '\t' in text or text.startswith(u'\ufeff'):
+            raise UnsupportedInput()
+        lines = []
+        for line in text.replace('\r\n', '\n').split('\n'):
+            content = line.lstrip(' ')
+            if content:
+                lines.append((len(line)-len(content), content))
+        return lines
+
+    def parse(self):
+        self.lines = self.split_lines()
+        if not self.lines or self.lines[0][0] != 0:
+            raise UnsupportedInput()
+        data = self.parse_mapping(0)
+        if self.index != len(self.lines):
+            raise UnsupportedInput()
+        return data
+
+    def peek(self):
+        if self.index < len(self.lines):
+            return self.lines[self.index]
+        return (-1, '')
+
+    def parse_mapping(self, indent):
+        mapping = {}
+        while self.peek()[0] == indent:
+            content = self.lines[self.index][1]
+            self.index += 1
+            if content.startswith('? '):
+                key = self.parse_key(content[2:])
+                column = indent+2
+                value_indent, value = self.peek()
+                if value_indent != indent or not value.startswith(':'):
+                    raise UnsupportedInput()
+                self.index += 1
+                if value != ':' and not value.startswith(': '):
+                    raise UnsupportedInput()
+                text = value[2:]
+            else:
+                match = SIMPLE_KEY.match(content)
+                if not match:
+                    raise UnsupportedInput()
+                key = self.construct_plain(match.group(1))
+                if not isinstance(key, basestring):
+                    raise UnsupportedInput()
+                text = match.group(2) or ''
+                column = None
+            try:
+                hash(key)
+            except TypeError:
+                raise UnsupportedInput()
+            mapping[key] = self.parse_value(text, column, indent, True)
+        if self.peek()[0] > indent:
+            raise UnsupportedInput()
+        return mapping
+
+    def parse_sequence(self, indent, first=None):
+        sequence = []
+        if first is not None:
+            sequence.append(self.parse_value(first, indent+2, indent, False))
+        while self.peek()[0] == indent and (
+                self.peek()[1].startswith('- ')):
+            content = self.lines[self.index][1]
+            self.index += 1
+            sequence.append(self.parse_value(content[2:], indent+2,
+                                             indent, False))
+        return sequence
+
+    def parse_block(self, indent, in_mapping):
+        """
+        Parse the block collection that follows a node with no inline
+        content, or return None if there is none.
+        """
+        next_indent, content = self.peek()
+        is_sequence = content.startswith('- ')
+        if next_indent > indent:
+            if is_sequence:
+                return self.parse_sequence(next_indent)
+            return self.parse_mapping(next_indent)
+        if next_indent == indent and is_sequence and in_mapping:
+            return self.parse_sequence(indent)
+        return None
+
+    def split_properties(self, text):
+        """Return the anchor, tag and remaining content of a node."""
+        match = PROPERTIES.match(text)
+        rest = text[match.end():]
+        if match.end() and rest.startswith(('&', '!', '*')):
+            raise UnsupportedInput()
+        return match.group(1), match.group(2), rest
+
+    def add_anchor(self, anchor, value):
+        if anchor is not None:
+            if anchor in self.anchors:
+                raise UnsupportedInput()
+            self.anchors[anchor] = value
+
+    def get_alias(self, text):
+        match = ALIAS.match(text)
+        if not match or match.group(1) not in self.anchors:
+            raise UnsupportedInput()
+        return self.anchors[match.group(1)]
+
+    def parse_value(self, text, column, indent, in_mapping):
+        """
+        Parse the node starting with text, which begins at column of a
+        line belonging to a collection at indent (column is None where a
+        compact sequence isn't allowed).  The rest of the node may continue
+        on the following lines.
+        """
+        if text.startswith('- '):
+            if column is None or not in_mapping:
+                raise UnsupportedInput()
+            return self.parse_sequence(column, text[2:])
+        if text.startswith('*'):
+            return self.get_alias(text)
+        anchor, tag, rest = self.split_properties(text)
+        if rest:
+            value = self.parse_inline(rest, tag)
+        elif tag == UNICODE_TAG:
+            raise UnsupportedInput()
+        else:
+            value = self.parse_block(indent, in_mapping)
+            if value is None:
+                raise UnsupportedInput()
+            if tag == TUPLE_TAG:
+                if not isinstance(value, list):
+                    raise UnsupportedInput()
+                value = tuple(value)
+        self.add_anchor(anchor, value)
+        return value
+
+    def parse_key(self, text):
+        """Parse a complex key, which must fit on one line."""
+        if text.startswith('*'):
+            return self.get_alias(text)
+        anchor, tag, rest = self.split_properties(text)
+        value = self.parse_inline(rest, tag)
+        self.add_anchor(anchor, value)
+        return value
+
+    def parse_inline(self, text, tag):
+        """Parse the content of a node contained entirely in text."""
+        match = FLOW_SEQUENCE.match(text)
+        if match:
+            if tag == UNICODE_TAG:
+                raise UnsupportedInput()
+            items = match.group(1).split(',')
+            if len(items) == 1 and not items[0].strip():
+                items = []
+            values = [self.construct_plain(item.strip()) for item in items]
+            return tuple(values) if tag == TUPLE_TAG else values
+        if tag == TUPLE_TAG:
+            raise UnsupportedInput()
+        if text == '{}' and tag is None:
+            return {}
+        match = QUOTED.match(text)
+        if match:
+            value = match.group(1).replace(u"''", u"'")
+            return value if tag == UNICODE_TAG else make_str(value)
+        if tag == UNICODE_TAG:
+            raise UnsupportedInput()
+        return self.construct_plain(text)
+
+    def construct_plain(self, text):
+        """
+        Construct a plain scalar.  The tag is chosen by the same implicit
+        resolvers as the full loader (the result is remembered for each
+        distinct text); only strings and simple decimal ints and floats are
+        constructed here.  As with the full loader, equal scalars are
+        separate objects unless they are aliases.
+        """
+        tag = self.scalars.get(text)
+        if tag is None:
+            if not PLAIN.match(text):
+                # Text such as "a: b" is a compact mapping, not a scalar.
+                match = SIMPLE_KEY.match(text+':')
+                if not match or match.group(2) is not None:
+                    raise UnsupportedInput()
+            tag = self.resolver.resolve(ScalarNode, text, (True, False))
+            if tag == INT_TAG and SIMPLE_INT.match(text):
+                tag = int
+            elif tag == FLOAT_TAG and SIMPLE_FLOAT.match(text):
+                tag = float
+            elif tag == STR_TAG:
+                tag = str
+            else:
+                raise UnsupportedInput()
+            self.scalars[text] = tag
+        if tag is str:
+            return make_str(text)
+        return tag(text)
+
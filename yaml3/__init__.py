@@ -7,6 +7,7 @@ from .nodes import *
 
 from .loader import *
 from .dumper import *
+from .fastloader import *
 
 __version__ = '3.10'
 try:
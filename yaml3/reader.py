@@ -10,7 +10,8 @@
 #   Reader(source, data)
 # Reader determines the encoding of `data` and converts it to unicode.
 # Reader provides the following methods and attributes:
-#   reader.peek(length=1) - return the next `length` characters
+#   reader.peek(index=0) - return the character `index` characters ahead
+#   reader.prefix(length=1) - return the next `length` characters
 #   reader.forward(length=1) - move the current position to `length` characters.
 #   reader.index - the number of the current character.
 #   reader.line, stream.column - the line and the column of the current character.
@@ -54,12 +55,19 @@ class Reader(object):
     #  - a file-like object with its `read` method returning `str`,
     #  - a file-like object with its `read` method returning `unicode`.
 
-    # Yeah, it's ugly and slow.
+    # The whole input is read and decoded up front (file-like objects with
+    # a single `read()`), so the buffer is never sliced or extended and
+    # `pointer` is also the index of the current character.  When the only
+    # line break in the input is '\n' (and there is no '\uFEFF'), `forward()`
+    # finds the new line and column with `str.count` and `str.rfind` rather
+    # than looking at each character in turn.
+
+    NON_PRINTABLE = re.compile('[^\x09\x0A\x0D\x20-\x7E\x85\xA0-\uD7FF\uE000-\uFFFD]')
+    SPECIAL_CHARACTERS = re.compile('[\r\x85\u2028\u2029\uFEFF]')
 
     def __init__(self, stream):
         self.name = None
         self.stream = None
-        self.stream_pointer = 0
         self.eof = True
         self.buffer = ''
         self.pointer = 0
@@ -69,10 +77,10 @@ class Reader(object):
         self.index = 0
         self.line = 0
         self.column = 0
+        self.simple_breaks = True
         if isinstance(stream, str):
             self.name = "<unicode string>"
-            self.check_printable(stream)
-            self.buffer = stream+'\0'
+            self.set_buffer(stream)
         elif isinstance(stream, bytes):
             self.name = "<byte string>"
             self.raw_buffer = stream
@@ -80,25 +88,39 @@ class Reader(object):
         else:
             self.stream = stream
             self.name = getattr(stream, 'name', "<file>")
-            self.eof = False
-            self.raw_buffer = None
-            self.determine_encoding()
+            data = stream.read()
+            if isinstance(data, str):
+                self.set_buffer(data)
+            else:
+                self.raw_buffer = data
+                self.determine_encoding()
 
     def peek(self, index=0):
-        try:
-            return self.buffer[self.pointer+index]
-        except IndexError:
-            self.update(index+1)
-            return self.buffer[self.pointer+index]
+        return self.buffer[self.pointer+index]
 
     def prefix(self, length=1):
-        if self.pointer+length >= len(self.buffer):
-            self.update(length)
         return self.buffer[self.pointer:self.pointer+length]
 
     def forward(self, length=1):
-        if self.pointer+length+1 >= len(self.buffer):
-            self.update(length+1)
+        if not self.simple_breaks:
+            return self.forward_by_character(length)
+        pointer = self.pointer
+        end = self.pointer = self.index = pointer+length
+        if length == 1:
+            if self.buffer[pointer] == '\n':
+                self.line += 1
+                self.column = 0
+            else:
+                self.column += 1
+            return
+        breaks = self.buffer.count('\n', pointer, end)
+        if breaks:
+            self.line += breaks
+            self.column = end-self.buffer.rfind('\n', pointer, end)-1
+        else:
+            self.column += length
+
+    def forward_by_character(self, length):
         while length:
             ch = self.buffer[self.pointer]
             self.pointer += 1
@@ -112,77 +134,39 @@ class Reader(object):
             length -= 1
 
     def get_mark(self):
-        if self.stream is None:
-            return Mark(self.name, self.index, self.line, self.column,
-                    self.buffer, self.pointer)
-        else:
-            return Mark(self.name, self.index, self.line, self.column,
-                    None, None)
+        return Mark(self.name, self.index, self.line, self.column,
+                self.buffer, self.pointer)
 
     def determine_encoding(self):
-        while not self.eof and (self.raw_buffer is None or len(self.raw_buffer) < 2):
-            self.update_raw()
-        if isinstance(self.raw_buffer, bytes):
-            if self.raw_buffer.startswith(codecs.BOM_UTF16_LE):
-                self.raw_decode = codecs.utf_16_le_decode
-                self.encoding = 'utf-16-le'
-            elif self.raw_buffer.startswith(codecs.BOM_UTF16_BE):
-                self.raw_decode = codecs.utf_16_be_decode
-                self.encoding = 'utf-16-be'
-            else:
-                self.raw_decode = codecs.utf_8_decode
-                self.encoding = 'utf-8'
-        self.update(1)
+        if self.raw_buffer.startswith(codecs.BOM_UTF16_LE):
+            self.raw_decode = codecs.utf_16_le_decode
+            self.encoding = 'utf-16-le'
+        elif self.raw_buffer.startswith(codecs.BOM_UTF16_BE):
+            self.raw_decode = codecs.utf_16_be_decode
+            self.encoding = 'utf-16-be'
+        else:
+            self.raw_decode = codecs.utf_8_decode
+            self.encoding = 'utf-8'
+        try:
+            data, converted = self.raw_decode(self.raw_buffer, 'strict', True)
+        except UnicodeDecodeError as exc:
+            character = self.raw_buffer[exc.start]
+            raise ReaderError(self.name, exc.start, character,
+                    exc.encoding, exc.reason)
+        self.raw_buffer = None
+        self.set_buffer(data)
 
-    NON_PRINTABLE = re.compile('[^\x09\x0A\x0D\x20-\x7E\x85\xA0-\uD7FF\uE000-\uFFFD]')
     def check_printable(self, data):
         match = self.NON_PRINTABLE.search(data)
         if match:
             character = match.group()
-            position = self.index+(len(self.buffer)-self.pointer)+match.start()
-            raise ReaderError(self.name, position, ord(character),
+            raise ReaderError(self.name, match.start(), ord(character),
                     'unicode', "special characters are not allowed")
 
-    def update(self, length):
-        if self.raw_buffer is None:
-            return
-        self.buffer = self.buffer[self.pointer:]
-        self.pointer = 0
-        while len(self.buffer) < length:
-            if not self.eof:
-                self.update_raw()
-            if self.raw_decode is not None:
-                try:
-                    data, converted = self.raw_decode(self.raw_buffer,
-                            'strict', self.eof)
-                except UnicodeDecodeError as exc:
-                    character = self.raw_buffer[exc.start]
-                    if self.stream is not None:
-                        position = self.stream_pointer-len(self.raw_buffer)+exc.start
-                    else:
-                        position = exc.start
-                    raise ReaderError(self.name, position, character,
-                            exc.encoding, exc.reason)
-            else:
-                data = self.raw_buffer
-                converted = len(data)
-            self.check_printable(data)
-            self.buffer += data
-            self.raw_buffer = self.raw_buffer[converted:]
-            if self.eof:
-                self.buffer += '\0'
-                self.raw_buffer = None
-                break
-
-    def update_raw(self, size=4096):
-        data = self.stream.read(size)
-        if self.raw_buffer is None:
-            self.raw_buffer = data
-        else:
-            self.raw_buffer += data
-        self.stream_pointer += len(data)
-        if not data:
-            self.eof = True
+    def set_buffer(self, data):
+        self.check_printable(data)
+        self.simple_breaks = not self.SPECIAL_CHARACTERS.search(data)
+        self.buffer = data+'\0'
 
 #try:
 #    import psyco